@@ -6,9 +6,75 @@ Created on Fri Jan  3 12:13:35 2020
 @author: yoonahshin
 """
 
-from .afm_analysis import *
-from .line_orientation import *
-from .output import *
-from .fingers import *
-from .scale import *
-from .batch import *
+import importlib
+
+# The submodules (and their heavy dependencies such as cv2, skimage,
+# pytesseract and matplotlib) are only imported on first use, e.g. when
+# fa.batch or fa.get_finger_orientation is accessed, so that importing the
+# package itself is fast and does not change any global state.
+_submodules = {
+    'afm_analysis': ('save_plt_fig', 'draw_plot', 'average_height_read',
+                     'corner', 'root', 'side', 'draw_side_plot', 'profile_results',
+                     'save_figures_and_results'),
+    'afm_psd': ('read_profile', 'resample_profile', 'segment_profiles',
+                'psd_1d', 'correlation_lengths', 'roughness_statistics',
+                'PSDAccumulator', 'batch_psd_and_roughness'),
+    'line_orientation': ('detect_lines', 'compute_angles', 'get_finger_orientation',
+                         'get_red_line_orientation', 'get_black_line_orientation'),
+    'output': ('PLOT_STYLE', 'set_plot_style', 'save_fig', 'draw_image', 'draw_histogram',
+               'make_dir_and_output_df_to_excel', 'plot_histogram'),
+    'fingers': ('get_edges_in_img', 'get_line_drawn_in_img',
+                'get_coords_intersections', 'get_wire_widths_along_line',
+                'get_finger_widths_along_line', 'get_finger_periods_along_line',
+                'propagation_distance_of_fingers',
+                'new_method_propagation_distance_of_fingers'),
+    'scale': ('get_pixel_size', 'read_number_above_scale_bar',
+              'get_number_of_pixels_in_scale_bar', 'extract_pixel_size'),
+    'batch': ('create_filename_list', 'create_filename_list_using_wildcard',
+              'batch_get_propagation_direction', 'batch_get_propagation_distance',
+              'batch_get_a_b_p', 'check_get_pixel_size', 'check_extract_pixel_size',
+              'batch_new_method_propagation_distance'),
+    'pipeline': ('run_pipeline', 'run_stages'),
+    'checkpoint': ('Checkpoint', 'error_report'),
+    'store': ('CONDITION_COLUMNS', 'INDEX_COLUMNS', 'results_to_table',
+              'append_results', 'replace_results', 'read_results', 'list_datasets', 'metric_columns',
+              'export_results_to_excel'),
+    'instrument': (), # used as fa.instrument.enable(), fa.instrument.summary_table(), ...
+    'synthetic': ('render_finger_image', 'draw_a_b_p_line', 'draw_propagation_lines',
+                  'write_synthetic_dataset'),
+    'benchmark': (), # run with python -m finger_analysis.benchmark
+    'golden': (), # run with python -m finger_analysis.golden
+    'watch': ('poll_folder', 'watch_folder'),
+    'catalog': ('parse_name', 'select_images', 'cached_pixel_size'),
+    'pack': ('pack_folder', 'open_pack', 'use_pack'),
+    'mosaic': ('open_mosaic', 'iter_tiles', 'get_edges_in_mosaic', 'detect_lines_in_mosaic',
+               'get_finger_orientation_in_mosaic', 'get_coords_intersections_in_mosaic'),
+    'distributed': ('submit', 'submit_conditions', 'run_worker', 'merge_all'),
+    'screening': ('screen_image', 'screen_folder', 'refine'),
+    'tracking': ('track_fingers', 'propagation_velocities'),
+    'memory': ('MemoryScheduler',),
+    'render': ('rendering',),
+    'service': ('connect', 'use_service'), # run with python -m finger_analysis.service
+    'aggregate': ('stored_results_long', 'aggregate_results', 'select_condition',
+                  'plot_aggregated_histogram', 'plot_condition_summary'),
+    'stats': ('bootstrap_ci', 'bootstrap_stored_results'),
+    'util': (),
+}
+
+# Name of function -> name of the submodule defining it
+_exports = {name: module for module, names in _submodules.items() for name in names}
+
+__all__ = list(_submodules) + list(_exports)
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module('.' + name, __name__)
+    if name in _exports:
+        module = importlib.import_module('.' + _exports[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value # cache, so __getattr__ is not called again
+        return value
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
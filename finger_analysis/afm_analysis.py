@@ -47,6 +47,28 @@ def draw_plot(leg, x, y, xlabel, ylabel):
     plt.tight_layout()
     return fig
 
+def _plot(draw, args, save_name, show_fig, save_fig):
+    """
+    Draws the figure with draw(*args), saves it in the directory 'output'
+    (next to the profile files, whose folder save_name may start with) as
+    save_name (EPS) if save_fig is True, and closes it unless show_fig is
+    True. While a render queue is active (see render.py), the figures that
+    are not shown are only drawn, in the background, if they are saved.
+    """
+    directory = os.path.join(os.path.dirname(save_name), 'output')
+    save_name = os.path.basename(save_name)
+    if show_fig == False and fa.render.is_active():
+        if save_fig == True:
+            fa.render.submit('afm_analysis.' + draw.__name__, os.path.join(directory, save_name),\
+                             args, savefig_kwargs={'format': 'eps'})
+        return None
+    fig = draw(*args)
+    if save_fig == True:
+        save_plt_fig(directory, save_name)
+    if show_fig == False:
+        plt.close(fig)
+    return None
+
 def average_height_read(filename_avg):
     """
     Read a .txt file that contains info about statistical measurements
@@ -100,17 +122,9 @@ def corner(filename_corner, filename_avg, show_fig=False, save_fig=False):
     rc = y.max() # rim height at the corner
 
     # Plot
-    fig = draw_plot(leg='Across the corner', x=x, y=y,\
-                    xlabel="$\mathrm{x}$ ($\mu$m)",\
-                    ylabel=r"$\mathrm{Height}$ (nm)")
-    
-    if save_fig == True:
-        directory_name = 'output'
-        save_name = '{}.eps'.format(filename_corner[:-4])
-        save_plt_fig(directory_name, save_name)
-        
-    if show_fig == False:
-        plt.close(fig)
+    _plot(draw_plot, ('Across the corner', x, y, "$\mathrm{x}$ ($\mu$m)",\
+                      r"$\mathrm{Height}$ (nm)"),\
+          '{}.eps'.format(filename_corner[:-4]), show_fig, save_fig)
         
     return rc
 
@@ -132,21 +146,45 @@ def root(filename_root, filename_avg, show_fig=False, save_fig=False):
     rm = y_root.max() # rim height at the root 
     
     # Plot
-    fig = draw_plot(leg='Across the {}'.format(filename_root[:-6]),\
-                    x=x_root, y=y_root, xlabel="$\mathrm{x}$ ($\mu$m)",\
-                    ylabel=r"$\mathrm{Height}$ (nm)")
-    
-    if save_fig == True:
-        directory_name = 'output'
-        save_name = '{}.eps'.format(filename_root[:-4])
-        save_plt_fig(directory_name, save_name)
-    
-    if show_fig == False:
-        plt.close(fig)
+    _plot(draw_plot, ('Across the {}'.format(os.path.basename(filename_root)[:-6]), x_root, y_root,\
+                      "$\mathrm{x}$ ($\mu$m)", r"$\mathrm{Height}$ (nm)"),\
+          '{}.eps'.format(filename_root[:-4]), show_fig, save_fig)
 
     return rm
 
 
+def draw_side_plot(x_crop, y_crop, simp_profile, side_i, y_min, y_max, side_number):
+    """
+    Plots the profile along the side (from the corner to the root) and the
+    simplified linear profile, as drawn by the function 'side'.
+    side_number: '1' or '2', index of the side in the file name (l_1 or l_2)
+    """
+    # Plot settings
+    plt.rcParams.update({'font.size': 22}) # change the font size of values on the axes and that of legend
+    plt.rcParams['mathtext.fontset'] = 'custom'
+    plt.rcParams['mathtext.it'] = 'Arial:italic'
+    plt.rcParams['mathtext.rm'] = 'Arial'
+    plt.rcParams["font.family"] = 'Arial'
+    plt.rcParams["legend.loc"] = "upper left" # added this line on 2020/06/06
+    #Plot
+    fig = plt.figure(figsize=(8,6))
+    ax = fig.add_subplot(111)
+    ax.plot(x_crop, y_crop,'b-', lw=6, label='Actual profile along the side {}'.format(side_i))
+    ax.plot(x_crop, simp_profile,'k-.', label='Simplified profile')
+    ax.set_ylim([y_min, y_max]) # added this line on 2020/06/06
+    # Using the specialized math font elsewhere, plus a different font
+    if side_number == '1':
+        ax.set_xlabel('$\mathrm{l_1}$ ($\mu$m)', fontsize=32)
+    else:
+        ax.set_xlabel('$\mathrm{l_2}$ ($\mu$m)', fontsize=32)
+    ax.set_ylabel('Height (nm)',fontsize=32)
+    # legend 
+    plt.legend(frameon=False)
+    ax.tick_params(direction='in', length=6, width=1, colors='k', \
+                   top=True, bottom=True, left=True, right=True)
+    plt.tight_layout()
+    return fig
+
 def side(filename_side, filename_avg, filename_corner, filename_root,\
          side_i, y_min, y_max, show_fig = False, save_fig = False):
     """
@@ -199,87 +237,94 @@ def side(filename_side, filename_avg, filename_corner, filename_root,\
     slope = (y_crop[-1] - y_crop[0])/(x_crop[-1])
     simp_profile = slope*(x_crop-x_crop[0]) + y_crop[0]
 
-    # Plot settings
-    plt.rcParams.update({'font.size': 22}) # change the font size of values on the axes and that of legend
-    plt.rcParams['mathtext.fontset'] = 'custom'
-    plt.rcParams['mathtext.it'] = 'Arial:italic'
-    plt.rcParams['mathtext.rm'] = 'Arial'
-    plt.rcParams["font.family"] = 'Arial'
-    plt.rcParams["legend.loc"] = "upper left" # added this line on 2020/06/06
-    #Plot
-    fig = plt.figure(figsize=(8,6))
-    ax = fig.add_subplot(111)
-    ax.plot(x_crop, y_crop,'b-', lw=6, label='Actual profile along the side {}'.format(side_i))
-    ax.plot(x_crop, simp_profile,'k-.', label='Simplified profile')
-    ax.set_ylim([y_min, y_max]) # added this line on 2020/06/06
-    # Using the specialized math font elsewhere, plus a different font
-    if filename_side[4] == '1':
-        ax.set_xlabel('$\mathrm{l_1}$ ($\mu$m)', fontsize=32)
-    else:
-        ax.set_xlabel('$\mathrm{l_2}$ ($\mu$m)', fontsize=32)
-    ax.set_ylabel('Height (nm)',fontsize=32)
-    # legend 
-    plt.legend(frameon=False)
-    ax.tick_params(direction='in', length=6, width=1, colors='k', \
-                   top=True, bottom=True, left=True, right=True)
-    plt.tight_layout()
-    
-    if save_fig == True:
-        directory_name = 'output'
-        save_name = '{}.eps'.format(filename_side[:-4])
-        save_plt_fig(directory_name, save_name)
-        
-    if show_fig == False:
-        plt.close(fig)
+    # Plot
+    _plot(draw_side_plot, (x_crop, y_crop, simp_profile, side_i, y_min, y_max,\
+                           os.path.basename(filename_side)[4]), '{}.eps'.format(filename_side[:-4]),\
+          show_fig, save_fig)
     
     return (side_length, slope/1000)
 
 
-def save_figures_and_results(n, y_min, y_max, save_fig=False, show_fig=False, save_df=False):
+def profile_results(num, y_min, y_max, save_fig=False, show_fig=False, directory=''):
+    """
+    num: (int) number of the profile
+    directory: (str) folder of the profile files (and of the folder 'output'
+        of the figures); the default is the working directory
+    Returns the results of the profile num as a tuple of (profile number,
+    rc (nm), rm_1 (nm), rm_2 (nm), m_1 (μm), m_2 (μm), q_1 (rad), q_2 (rad)).
+    """
+    # Get file names 
+    num = str(num) # change data type from int to str
+    filename_avg = os.path.join(directory, 'flat_{}_stat.txt'.format(num))
+    filename_c = os.path.join(directory, 'corner_{}.txt'.format(num))
+    filename_r1 = os.path.join(directory, 'root1_{}.txt'.format(num))
+    filename_s1 = os.path.join(directory, 'side1_{}.txt'.format(num))
+    filename_r2 = os.path.join(directory, 'root2_{}.txt'.format(num))
+    filename_s2 = os.path.join(directory, 'side2_{}.txt'.format(num))
+    # Rim height at the corner 
+    rc = corner(filename_c, filename_avg, show_fig, save_fig)
+    # Rim height at the root 1 
+    r_m1 = root(filename_r1, filename_avg, show_fig, save_fig)
+    # Rim height at the root 2
+    r_m2 = root(filename_r2, filename_avg, show_fig, save_fig)
+    # Length and slope of simplified profile of side1
+    m1, q1 = side(filename_s1, filename_avg, filename_c, filename_r1,\
+                  '1', y_min, y_max, show_fig, save_fig)
+    # Length and slope of simplified profile of side2
+    m2, q2 = side(filename_s2, filename_avg, filename_c, filename_r2,\
+                  '2', y_min, y_max, show_fig, save_fig)
+    return (int(num), rc, r_m1, r_m2, m1, m2, q1, q2)
+
+def save_figures_and_results(n, y_min, y_max, save_fig=False, show_fig=False, save_df=False,\
+                             profile_numbers=None, checkpoint_dir=None, resume=False,\
+                             directory=''):
     """
     n: (int) total number of profiles 
+    directory: (str) folder of the profile files, in which the figures and the
+        results are saved (in 'output'); the default is the working directory
+    profile_numbers: (list) numbers of the profiles to analyze; the default
+        is all of them, 1 to n
+    checkpoint_dir, resume: checkpoint of the run (see checkpoint.py); with a
+        checkpoint, a profile that fails is recorded with its error while the
+        other profiles go on, and resume=True skips the profiles already done
     """   
+    params = dict(locals()) # arguments of the run, recorded in the checkpoint
+    checkpoint = None
+    if checkpoint_dir is not None:
+        checkpoint = fa.checkpoint.Checkpoint(checkpoint_dir, 'save_figures_and_results',\
+                                              params, resume)
     # Initialize dataframe for storing results 
     col_names = ['profile_number','rc(nm)', 'rm_1(nm)','rm_2(nm)',\
                  'm_1(μm)','m_2(μm)','q_1(rad)','q_2(rad)']
-    df = np.zeros((n,len(col_names))) 
     # Generates array of numbers up to the provided number of profiles, n
-    num_list = np.arange(1,n+1) 
-    for num in num_list:
-        # Get file names 
-        num = str(num) # change data type from int to str
-        filename_avg = 'flat_{}_stat.txt'.format(num)
-        filename_c = 'corner_{}.txt'.format(num)
-        filename_r1 = 'root1_{}.txt'.format(num)
-        filename_s1 = 'side1_{}.txt'.format(num)
-        filename_r2 = 'root2_{}.txt'.format(num)
-        filename_s2 = 'side2_{}.txt'.format(num)
-        # Rim height at the corner 
-        rc = corner(filename_c, filename_avg, show_fig, save_fig)
-        # Rim height at the root 1 
-        r_m1 = root(filename_r1, filename_avg, show_fig, save_fig)
-        # Rim height at the root 2
-        r_m2 = root(filename_r2, filename_avg, show_fig, save_fig)
-        # Length and slope of simplified profile of side1
-        m1, q1 = side(filename_s1, filename_avg, filename_c, filename_r1,\
-                      '1', y_min, y_max, show_fig, save_fig)
-        # Length and slope of simplified profile of side2
-        m2, q2 = side(filename_s2, filename_avg, filename_c, filename_r2,\
-                      '2', y_min, y_max, show_fig, save_fig)
-        # Fill in the dataframe with results
-        df[int(num)-1]= int(num), rc, r_m1, r_m2, m1, m2, q1, q2 
+    if profile_numbers is None:
+        profile_numbers = np.arange(1,n+1) 
+    df = np.zeros((len(profile_numbers),len(col_names))) 
+    for i, num in enumerate(profile_numbers):
+        name = str(num)
+        if checkpoint is None:
+            df[i] = profile_results(num, y_min, y_max, save_fig, show_fig, directory)
+        elif checkpoint.is_done(name):
+            df[i] = checkpoint.load(name)
+        else:
+            try:
+                row = profile_results(num, y_min, y_max, save_fig, show_fig, directory)
+            except Exception as e: # e.g. a missing profile file
+                checkpoint.record_failure(name, e)
+                continue
+            checkpoint.save(name, row)
+            df[i] = row
+    if checkpoint is not None:
+        failed = checkpoint.failed([str(num) for num in profile_numbers])
+        if len(failed) > 0:
+            raise RuntimeError('{} of {} profiles failed: {}. See fa.checkpoint.error_report() '
+                               'for the errors and run again with resume=True to retry them.'\
+                               .format(len(failed), len(profile_numbers), ', '.join(failed)))
     
     # Put the results into Pandas DataFrame
     df = pd.DataFrame(df, columns=col_names)
     # Save the results
     if save_df == True:
-        fa.make_dir_and_output_df_to_excel('output',df,'Summary of results','')
+        fa.make_dir_and_output_df_to_excel(os.path.join(directory, 'output'),df,'Summary of results','')
             
     return df
-
-    
-    
-
-    
-    
-
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:40 2026
+
+@author: yoonahshin
+"""
+
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+def read_profile(filename_profile, filename_avg=None):
+    """
+    Read a .txt file of a profile exported from Gwyddion (see the function
+    'corner' in afm_analysis.py for how the file is obtained) and return the
+    distance (μm) and height (nm) as numpy arrays. If filename_avg is given,
+    the zero of height is shifted to the exposed substrate by subtracting the
+    average height in the finger region (see 'average_height_read').
+    """
+    data = pd.read_csv(filename_profile, sep='  ', header=None, \
+                       skiprows=3, engine='python')
+    x = data[0].to_numpy()*1e6 # distance along the profile (μm)
+    y = data[1].to_numpy()*1e9 # height (nm)
+    if filename_avg is not None:
+        y = y - fa.afm_analysis.average_height_read(filename_avg)
+    return x, y
+
+def resample_profile(x, y, dx):
+    """
+    Interpolates a profile onto a uniform grid with spacing dx (μm), starting
+    at the first point of the profile. Gwyddion exports profiles on a uniform
+    grid, so this is mostly a safeguard for profiles with a different spacing.
+    """
+    x_new = np.arange(x[0], x[-1] + 0.5*dx, dx)
+    return np.interp(x_new, x, y)
+
+def segment_profiles(profiles, n_points, overlap=0.5):
+    """
+    Parameters
+    ----------
+    profiles : list
+        List of 1D numpy arrays of height on a common uniform grid. The arrays
+        may have different lengths.
+    n_points : int
+        Number of points in each segment.
+    overlap : float, optional
+        Fraction of overlap between neighbouring segments. The default is 0.5.
+
+    Returns
+    -------
+    Tuple of (segments, owner), where segments is a 2D array of shape
+    (number of segments, n_points) and owner is the index of the profile in
+    'profiles' each segment was cut from. Profiles shorter than n_points give
+    no segments.
+
+    """
+    step = max(int(n_points*(1 - overlap)), 1)
+    segments = []
+    owner = []
+    for i, y in enumerate(profiles):
+        if len(y) < n_points:
+            continue
+        # Strided view of all the segments of the profile (no copy)
+        view = np.lib.stride_tricks.sliding_window_view(y, n_points)[::step]
+        segments.append(view)
+        owner.append(np.full(len(view), i))
+    if len(segments) == 0:
+        return np.zeros((0, n_points)), np.zeros(0, dtype=int)
+    return np.concatenate(segments), np.concatenate(owner)
+
+def _detrend(segments, detrend):
+    """
+    Removes the mean ('constant') or the least-squares line ('linear') from
+    each row of the 2D array of segments.
+    """
+    if detrend == 'constant':
+        return segments - segments.mean(axis=1, keepdims=True)
+    if detrend == 'linear':
+        n = segments.shape[1]
+        t = np.arange(n) - (n - 1)/2
+        slope = segments @ t / (t @ t)
+        return segments - segments.mean(axis=1, keepdims=True) - np.outer(slope, t)
+    return segments
+
+def _window(name, n_points):
+    """
+    Returns the window function with the given name ('hann', 'hamming',
+    'blackman' or None for a rectangular window) as a numpy array.
+    """
+    if name is None:
+        return np.ones(n_points)
+    windows = {'hann': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman}
+    return windows[name](n_points)
+
+def psd_1d(segments, dx, window='hann', detrend='linear'):
+    """
+    Parameters
+    ----------
+    segments : ndarray
+        2D array of height (nm) with one segment per row.
+    dx : float
+        Sampling interval (μm).
+    window : str, optional
+        Window applied to each segment before the FFT. The default is 'hann'.
+    detrend : str, optional
+        'linear', 'constant' or None. The default is 'linear'.
+
+    Returns
+    -------
+    Tuple of (freq, psd), where freq is the spatial frequency (1/μm) and psd is
+    a 2D array of the one-sided power spectral density (nm^2 μm) of each row.
+    All the rows are transformed with a single FFT call.
+
+    """
+    segments = np.atleast_2d(segments)
+    n_points = segments.shape[1]
+    w = _window(window, n_points)
+    spectrum = np.fft.rfft(_detrend(segments, detrend)*w, axis=1)
+    # Normalize so that the integral of the PSD over freq equals the variance
+    psd = np.abs(spectrum)**2*dx/(w @ w)
+    if n_points % 2 == 0:
+        psd[:, 1:-1] *= 2
+    else:
+        psd[:, 1:] *= 2
+    freq = np.fft.rfftfreq(n_points, d=dx)
+    return freq, psd
+
+def correlation_lengths(segments, dx, detrend='constant'):
+    """
+    Returns the correlation length (μm) of each row of the 2D array of
+    segments, which is the lag at which the normalized autocorrelation function
+    first drops below 1/e. The autocorrelation functions of all the rows are
+    computed with a single (zero-padded) FFT. Rows whose autocorrelation never
+    drops below 1/e return nan.
+    """
+    segments = _detrend(np.atleast_2d(segments), detrend)
+    n_points = segments.shape[1]
+    spectrum = np.fft.rfft(segments, n=2*n_points, axis=1)
+    acf = np.fft.irfft(np.abs(spectrum)**2, axis=1)[:, :n_points]
+    acf = acf/acf[:, :1]
+    below = acf < np.exp(-1)
+    idx = np.argmax(below, axis=1)
+    found = below[np.arange(len(idx)), idx]
+    # Linear interpolation between the two lags around 1/e
+    idx = np.maximum(idx, 1)
+    r = np.arange(len(idx))
+    a1 = acf[r, idx-1]
+    a2 = acf[r, idx]
+    lag = (idx - 1 + (a1 - np.exp(-1))/(a1 - a2))*dx
+    return np.where(found, lag, np.nan)
+
+def roughness_statistics(segments, dx=None):
+    """
+    Computes roughness statistics of each row of the 2D array of height (nm):
+        - RMS: root mean square of the height (i.e. about the zero of height,
+          which is the exposed substrate if the profile was shifted)
+        - Ra: arithmetic mean deviation from the mean line
+        - Rq: root mean square deviation from the mean line
+        - Rz: maximum peak to valley height
+    If dx (μm) is given, the correlation length is also computed.
+    Returns a dataframe with one row per segment.
+    """
+    segments = np.atleast_2d(segments)
+    dev = segments - segments.mean(axis=1, keepdims=True)
+    df = pd.DataFrame({'RMS (nm)': np.sqrt(np.mean(segments**2, axis=1)),
+                       'Ra (nm)': np.mean(np.abs(dev), axis=1),
+                       'Rq (nm)': np.sqrt(np.mean(dev**2, axis=1)),
+                       'Rz (nm)': segments.max(axis=1) - segments.min(axis=1)})
+    if dx is not None:
+        df['Correlation length (μm)'] = correlation_lengths(segments, dx)
+    return df
+
+class PSDAccumulator:
+    """
+    Running average of power spectral densities. Only the sum and the sum of
+    squares of the spectra are kept, so the memory does not grow with the
+    number of profiles.
+    """
+    def __init__(self, n_points, dx, window='hann', detrend='linear'):
+        self.n_points = n_points
+        self.dx = dx
+        self.window = window
+        self.detrend = detrend
+        self.freq = np.fft.rfftfreq(n_points, d=dx)
+        self.count = 0
+        self._sum = np.zeros(len(self.freq))
+        self._sum_sq = np.zeros(len(self.freq))
+
+    def update(self, segments):
+        """
+        Adds the PSDs of the rows of the 2D array of segments to the average.
+        """
+        if len(segments) == 0:
+            return None
+        psd = psd_1d(segments, self.dx, self.window, self.detrend)[1]
+        self._sum += psd.sum(axis=0)
+        self._sum_sq += (psd**2).sum(axis=0)
+        self.count += len(psd)
+        return None
+
+    def mean(self):
+        return self._sum/max(self.count, 1)
+
+    def std(self):
+        mean = self.mean()
+        return np.sqrt(np.maximum(self._sum_sq/max(self.count, 1) - mean**2, 0))
+
+    def to_dataframe(self):
+        return pd.DataFrame({'Frequency (1/μm)': self.freq,
+                             'PSD (nm^2 μm)': self.mean(),
+                             'PSD std (nm^2 μm)': self.std()})
+
+def batch_psd_and_roughness(n, profile_type='side1', n_points=128, overlap=0.5,\
+                            dx=None, window='hann', detrend='linear',\
+                            chunk_size=256, save_df=False):
+    """
+    Parameters
+    ----------
+    n : int
+        Total number of profiles (at least 1). The files must follow the
+        naming scheme used by 'save_figures_and_results' in afm_analysis.py:
+        '{profile_type}_ProfileNumber.txt' and 'flat_ProfileNumber_stat.txt'
+        (e.g. 'side1_1.txt' and 'flat_1_stat.txt').
+    profile_type : str, optional
+        'corner', 'root1', 'root2', 'side1' or 'side2'. The default is 'side1'.
+    n_points : int, optional
+        Number of points in each segment of the profiles. The default is 128.
+    overlap : float, optional
+        Fraction of overlap between neighbouring segments. The default is 0.5.
+    dx : float, optional
+        Sampling interval (μm). The default is the spacing of the first profile.
+    window : str, optional
+        Window applied before the FFT. The default is 'hann'.
+    detrend : str, optional
+        Detrending applied before the FFT. The default is 'linear'.
+    chunk_size : int, optional
+        Number of segments transformed together. Segments are buffered until
+        there are chunk_size of them and then transformed with a single FFT,
+        so the memory is bounded by chunk_size*n_points.
+    save_df : bool, optional
+        If True, saves both dataframes to excel files in the 'output' directory.
+
+    Returns
+    -------
+    Tuple of (psd_df, roughness_df). psd_df is the averaged PSD over all the
+    segments of all the profiles. roughness_df has one row per profile with the
+    roughness statistics and correlation length averaged over the segments of
+    the profile, and the number of segments.
+
+    """
+    if n < 1:
+        raise ValueError('no profiles to analyse (n = {}); n must be at least 1'.format(n))
+    acc = None
+    buffer = []
+    buffered = 0
+    stats = []
+    for num in np.arange(1, n+1):
+        num = str(num)
+        filename_avg = 'flat_{}_stat.txt'.format(num)
+        filename_profile = '{}_{}.txt'.format(profile_type, num)
+        x, y = read_profile(filename_profile, filename_avg)
+        if dx is None:
+            dx = np.median(np.diff(x))
+        if acc is None:
+            acc = PSDAccumulator(n_points, dx, window, detrend)
+        segments = segment_profiles([resample_profile(x, y, dx)], n_points, overlap)[0]
+        row = roughness_statistics(segments, dx).mean().to_dict()
+        row['Number of segments'] = len(segments)
+        stats.append(row)
+        buffer.append(segments)
+        buffered += len(segments)
+        if buffered >= chunk_size:
+            acc.update(np.concatenate(buffer))
+            buffer = []
+            buffered = 0
+    if buffered > 0:
+        acc.update(np.concatenate(buffer))
+    psd_df = acc.to_dataframe()
+    roughness_df = pd.DataFrame(stats, index=pd.Index(np.arange(1, n+1),\
+                                                      name='profile_number'))
+    if save_df == True:
+        fa.output.make_dir_and_output_df_to_excel('output', psd_df,\
+                                                  'PSD of {}'.format(profile_type), '')
+        fa.output.make_dir_and_output_df_to_excel('output', roughness_df,\
+                                                  'Roughness of {}'.format(profile_type), '')
+    return psd_df, roughness_df
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:20:47 2026
+
+@author: yoonahshin
+"""
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+def stored_results_long(store_dir, datasets=None, filters=None, file_format='parquet'):
+    """
+    Reads every data set of the result store once and returns a single long
+    data frame with the columns: dataset, metric, the experimental condition
+    (h, alpha, t, l, suffix), image and value. Rows with nan are dropped.
+    """
+    if datasets is None:
+        datasets = fa.store.list_datasets(store_dir)
+    long_dfs = []
+    for dataset in datasets:
+        df = fa.store.read_results(store_dir, dataset, filters=filters,\
+                                   file_format=file_format)
+        if len(df) == 0:
+            continue
+        id_vars = [col for col in fa.store.CONDITION_COLUMNS + ['image'] if col in df.columns]
+        long_df = df.melt(id_vars=id_vars, value_vars=fa.store.metric_columns(df),\
+                          var_name='metric', value_name='value')
+        long_df.insert(0, 'dataset', dataset)
+        long_dfs.append(long_df)
+    if len(long_dfs) == 0:
+        return pd.DataFrame(columns=['dataset', 'metric'] + fa.store.CONDITION_COLUMNS\
+                            + ['image', 'value'])
+    long_df = pd.concat(long_dfs, ignore_index=True)
+    return long_df[long_df.value.notna()].reset_index(drop=True)
+
+def aggregate_results(store_dir, datasets=None, filters=None,\
+                      by=('h', 'alpha', 't', 'l', 'suffix'),\
+                      quantiles=(0.05, 0.25, 0.5, 0.75, 0.95),\
+                      n_bins=30, bin_edges=None, file_format='parquet'):
+    """
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the result store (see store.py).
+    datasets : list, optional
+        Data sets to aggregate. The default is all the data sets in the store.
+    filters : dict, optional
+        Filters applied while reading, e.g. {'h': 120}.
+    by : tuple, optional
+        Columns defining an experimental condition.
+    quantiles : tuple, optional
+        Quantiles to compute. The default is (0.05, 0.25, 0.5, 0.75, 0.95).
+    n_bins : int, optional
+        Number of histogram bins. The bins of a metric are the same for all the
+        conditions and span the range of the metric over the whole store.
+    bin_edges : dict, optional
+        Dictionary of metric name to array of bin edges, overriding n_bins for
+        that metric, e.g. {'Finger period (μm)': np.arange(0, 6.2, 0.2)}.
+    file_format : str, optional
+        'parquet' or 'feather'. The default is 'parquet'.
+
+    Returns
+    -------
+    Tuple of (summary, histograms).
+    summary is a data frame indexed by (dataset, metric, *by) with the columns
+    count, mean, std, min, max, the quantiles and the number of images.
+    histograms is a long data frame with the columns dataset, metric, *by,
+    bin_left, bin_right and count.
+    All the conditions and metrics are computed together in one grouped pass
+    over the data read once from the store.
+
+    """
+    by = list(by)
+    long_df = stored_results_long(store_dir, datasets, filters, file_format)
+    keys = ['dataset', 'metric'] + by
+    grouped = long_df.groupby(keys, sort=True, observed=True)
+    summary = grouped['value'].agg(['count', 'mean', 'std', 'min', 'max'])
+    if len(quantiles) > 0 and len(long_df) > 0:
+        q = grouped['value'].quantile(list(quantiles)).unstack()
+        q.columns = ['q{:g}'.format(100*c) for c in q.columns]
+        summary = summary.join(q)
+    if 'image' in long_df.columns:
+        summary['images'] = grouped['image'].nunique()
+
+    # Histograms with bins shared by all the conditions of a metric
+    if bin_edges is None:
+        bin_edges = {}
+    code = grouped.ngroup().to_numpy()
+    n_groups = grouped.ngroups
+    group_keys = summary.index.to_frame(index=False)
+    hist_dfs = []
+    for (dataset, metric), rows in long_df.groupby(['dataset', 'metric'], sort=True).groups.items():
+        rows = np.asarray(rows)
+        values = long_df.value.to_numpy()[rows]
+        edges = bin_edges.get(metric)
+        if edges is None:
+            edges = np.histogram_bin_edges(values, bins=n_bins)
+        edges = np.asarray(edges, dtype=float)
+        n = len(edges) - 1
+        idx = np.searchsorted(edges, values, side='right') - 1
+        idx[values == edges[-1]] = n - 1 # the last bin includes its right edge
+        inside = (idx >= 0) & (idx < n)
+        counts = np.bincount(code[rows][inside]*n + idx[inside],\
+                             minlength=n_groups*n).reshape(n_groups, n)
+        groups = np.unique(code[rows])
+        hist = group_keys.iloc[np.repeat(groups, n)].reset_index(drop=True)
+        hist['bin_left'] = np.tile(edges[:-1], len(groups))
+        hist['bin_right'] = np.tile(edges[1:], len(groups))
+        hist['count'] = counts[groups].ravel()
+        hist_dfs.append(hist)
+    if len(hist_dfs) > 0:
+        histograms = pd.concat(hist_dfs, ignore_index=True)
+    else:
+        histograms = pd.DataFrame(columns=keys + ['bin_left', 'bin_right', 'count'])
+    return summary, histograms
+
+def select_condition(df, dataset, metric, h, alph, t, l, suffix=''):
+    """
+    Selects the rows of the summary or histograms returned by
+    'aggregate_results' for one data set, metric and experimental condition.
+    """
+    if isinstance(df.index, pd.MultiIndex):
+        df = df.reset_index()
+    mask = (df.dataset == dataset) & (df.metric == metric) & (df.h == h)\
+        & (df.alpha == alph) & (df.t == t) & (df.l == l) & (df.suffix == suffix)
+    return df[mask]
+
+def plot_aggregated_histogram(histograms, dataset, metric, h, alph, t, l, suffix,\
+                              x_label, y_label, x_min, x_max, tick_spacing,\
+                              summary=None, fontsize=22, save_format='png',\
+                              save_hist=False, color_user='b'):
+    """
+    Plots the precomputed histogram of one metric for one experimental
+    condition (see 'aggregate_results'). It is the counterpart of
+    'plot_histogram' in output.py, but no data is read from disk. If summary is
+    given, the mean is drawn as a dashed line.
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    hist = select_condition(histograms, dataset, metric, h, alph, t, l, suffix)
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    ax.bar(hist.bin_left, hist['count'], width=hist.bin_right-hist.bin_left,\
+           align='edge', edgecolor='k', color=color_user)
+    if summary is not None:
+        mean = select_condition(summary, dataset, metric, h, alph, t, l, suffix)['mean']
+        plt.axvline(mean.iloc[0], color=color_user, linewidth=2.5, linestyle='--')
+    # Plot settings
+    ax.set_xlabel(x_label, fontsize=fontsize)
+    ax.set_ylabel(y_label, fontsize=fontsize)
+    ax.set_xlim(xmin=x_min, xmax=x_max)
+    ax.xaxis.set_major_locator(ticker.MultipleLocator(tick_spacing))
+    if save_hist == True:
+        save_name = '{}nm_{}deg_{}h_{}{}_{}.{}'.format(h, alph, t, l, suffix,\
+                                                      metric, save_format)
+        fa.output.save_fig(dataset, save_name)
+    return fig
+
+def plot_condition_summary(summary, dataset, metric, x='alpha', x_label=None,\
+                           y_label=None, fontsize=22, save_format='png',\
+                           save_fig=False, color_user='b'):
+    """
+    Plots the mean ± standard deviation of one metric against one of the
+    condition columns (e.g. alpha) for all the conditions in the summary
+    returned by 'aggregate_results'.
+    """
+    import matplotlib.pyplot as plt
+    df = summary.reset_index()
+    df = df[(df.dataset == dataset) & (df.metric == metric)].sort_values(x)
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    ax.errorbar(df[x], df['mean'], yerr=df['std'], fmt='o', capsize=4, color=color_user)
+    ax.set_xlabel(x if x_label is None else x_label, fontsize=fontsize)
+    ax.set_ylabel(metric if y_label is None else y_label, fontsize=fontsize)
+    if save_fig == True:
+        fa.output.save_fig(dataset, '{}_vs_{}.{}'.format(metric, x, save_format))
+    return fig
@@ -11,14 +11,9 @@ import pandas as pd
 import os
 import glob
 import datetime
-import matplotlib.pyplot as plt
-# Plot settings
-#plt.rcParams.update({'font.size': 18}) 
-plt.rcParams['mathtext.fontset'] = 'custom'
-plt.rcParams['mathtext.it'] = 'Arial:italic'
-plt.rcParams['mathtext.rm'] = 'Arial'
-plt.rcParams["font.family"] = 'Arial'
+import threading
 
+@fa.instrument.instrumented
 def create_filename_list(base_name, img_num_list, zeropad=3):
     """
     Creates a list of file names for a given 
@@ -43,6 +38,12 @@ def create_filename_list(base_name, img_num_list, zeropad=3):
         filename_list.append(base_name+str(img_num_list[i]).zfill(zeropad))
     return filename_list
 
+def _image_names(filename_list):
+    # keys of the results: the image names, without the folder when the
+    # batch function is given the paths of the images
+    return [os.path.basename(name) for name in filename_list]
+
+@fa.instrument.instrumented
 def create_filename_list_using_wildcard(global_name, base_name='',\
                                         img_num_list=[], zeropad=3,\
                                         if_remove_ele=False):
@@ -73,28 +74,198 @@ def create_filename_list_using_wildcard(global_name, base_name='',\
     else:
         unwanted_ele = []
         
+    unwanted_ele = set(unwanted_ele) # constant-time membership test
     return [ele for ele in filename_w_o_ext if ele not in unwanted_ele]
 
+def _pixel_size_function(pix_size_given, scale_args, catalog=None):
+    """
+    Returns the function giving the pixel size (μm) of an image, read from the
+    data bar if pix_size_given is True, extracted from the scale bar located
+    automatically if pix_size_given is 'auto' (see 'scale.locate_data_bar'),
+    otherwise extracted from the scale bar with the arguments scale_args of
+    'scale.extract_pixel_size'. If catalog is the path of a dataset index (see
+    catalog.py), the pixel sizes cached in it are used and the new ones are
+    added to it.
+    """
+    if catalog is not None:
+        if pix_size_given == 'auto':
+            return lambda name: fa.catalog.cached_pixel_size(catalog, name,\
+                                                             'extract_pixel_size_auto')
+        if pix_size_given == True:
+            return lambda name: fa.catalog.cached_pixel_size(catalog, name)[0]/1000
+        names = ['y_min', 'y_max', 'x_min', 'x_max', 'y_min_bar', 'y_max_bar', 'x_min_bar',\
+                 'x_max_bar', 'e_w', 's_w', 'threshold', 'minLineLength', 'maxLineGap']
+        kwargs = dict(zip(names, scale_args))
+        return lambda name: fa.catalog.cached_pixel_size(catalog, name, 'extract_pixel_size',\
+                                                         **kwargs)
+    if pix_size_given == 'auto':
+        return lambda name: fa.scale.extract_pixel_size_auto(name)[2]
+    if pix_size_given == True:
+        return lambda name: fa.scale.get_pixel_size(name)[0]/1000
+    return lambda name: fa.scale.extract_pixel_size(name, *scale_args)[2]
+
+def _data_bar_top(name, data_bar_top, pix_size_given):
+    # y coordinate at which the image is cropped: the top of the data bar
+    # located by 'scale.locate_data_bar' if pix_size_given is 'auto', or else
+    # the data_bar_top argument
+    if pix_size_given == 'auto':
+        return fa.scale.get_data_bar_top(name)
+    return data_bar_top
+
+def _gate(gate_orientation, ori_l, ori_u):
+    # range of orientations given to 'line_orientation.get_finger_lines', so
+    # that only the lines in (ori_l, ori_u) are detected if gate_orientation is True
+    if gate_orientation == True:
+        return (ori_l, ori_u)
+    return (None, None)
+
+def _open_checkpoint(checkpoint_dir, function, params, resume):
+    if checkpoint_dir is None:
+        return None
+    return fa.checkpoint.Checkpoint(checkpoint_dir, function, params, resume)
+
+def _run_images(filename_list, compute, files, pixel_size=None,\
+                pixel_size_in_reader=True, prefetch=2, n_workers=1, checkpoint=None,\
+                memory_budget=None, steps=()):
+    """
+    Runs compute(name, pix_size) for every image with 'pipeline.run_pipeline'.
+    With prefetch reader threads, the images listed by files(name) as
+    (path, flags) are decoded, and the pixel size is read with OCR, ahead of
+    the computation. Returns the list of results in the order of filename_list.
+    With a checkpoint (see checkpoint.py), the images already done are loaded
+    instead of computed, the result of every image is saved by the writer
+    thread as soon as it is computed, and an image that fails is recorded
+    with its error while the other images go on; a RuntimeError listing the
+    failed images is raised at the end.
+    With n_workers='auto' (as many workers as CPUs) or a memory_budget
+    (bytes), the images are scheduled by a memory.MemoryScheduler: an image is
+    read once its working set, estimated from the TIFF headers of its files
+    and the steps of the analysis (keys of memory.BYTES_PER_PIXEL), fits in
+    the budget, and the number of workers computing is adjusted from the RSS.
+    """
+    scheduler = None
+    if n_workers == 'auto' or memory_budget is not None:
+        scheduler = fa.memory.MemoryScheduler(lambda name: fa.memory.working_set(files(name), steps),\
+                                              memory_budget,\
+                                              None if n_workers == 'auto' else n_workers)
+        n_workers = scheduler.max_workers
+    prefetched = {}
+    def read(name):
+        with fa.instrument.image(name):
+            if prefetch > 0:
+                keys = fa.pipeline.prefetch(files(name))
+                with lock:
+                    prefetched.setdefault(name, []).append(keys)
+            if pixel_size is not None and pixel_size_in_reader == True:
+                return pixel_size(name)
+        return None
+    def compute_image(name, pix_size):
+        try:
+            if pixel_size is not None and pixel_size_in_reader == False:
+                pix_size = pixel_size(name)
+            return compute(name, pix_size)
+        finally:
+            with lock:
+                keys = prefetched[name].pop(0) if len(prefetched.get(name, [])) > 0 else []
+            fa.pipeline.release(keys)
+    lock = threading.Lock()
+    todo = filename_list
+    write = None
+    if checkpoint is not None:
+        todo = [name for name in filename_list if not checkpoint.is_done(name)]
+        failures = {}
+        read_image = read
+        compute_one = compute_image
+        def read(name):
+            try:
+                return read_image(name)
+            except Exception as e: # e.g. OCR could not read the pixel size
+                failures[name] = e
+                return None
+        def compute_image(name, pix_size):
+            if name in failures:
+                with lock:
+                    keys = prefetched[name].pop(0) if len(prefetched.get(name, [])) > 0 else []
+                fa.pipeline.release(keys)
+                return None
+            try:
+                return compute_one(name, pix_size)
+            except Exception as e: # e.g. no line found in the image
+                failures[name] = e
+                return None
+        def write(name, result):
+            if name in failures:
+                checkpoint.record_failure(name, failures[name])
+            else:
+                checkpoint.save(name, result)
+    try:
+        results = fa.pipeline.run_pipeline(todo, compute_image, read, write,\
+                                           n_readers=prefetch, n_workers=n_workers,\
+                                           scheduler=scheduler)
+    finally:
+        if scheduler is not None:
+            scheduler.close()
+        # images read ahead but not computed because of an error
+        for keys_list in prefetched.values():
+            for keys in keys_list:
+                fa.pipeline.release(keys)
+    if checkpoint is None:
+        return results
+    failed = checkpoint.failed(filename_list)
+    if len(failed) > 0:
+        raise RuntimeError('{} of {} images failed: {}. The results of the other images are '
+                           'saved in {}; see fa.checkpoint.error_report() for the errors and '
+                           'run again with resume=True to retry the failed images.'\
+                           .format(len(failed), len(filename_list), ', '.join(failed),\
+                                   checkpoint.directory))
+    computed = dict(zip(todo, results))
+    return [computed[name] if name in computed else checkpoint.load(name)\
+            for name in filename_list]
+
+@fa.service.remote
+@fa.instrument.instrumented
 def batch_get_propagation_direction(base_name, img_num_list, zeropad=3,\
                                     threshold=100, minLineLength=100,\
                                     maxLineGap=5, data_bar_top=690,\
                                     show_image=False, save_image=False,\
                                     save_df_indiv=False, ori_l=0, ori_u=50,\
-                                    save_df=False, h=120, alpha=33, t=6,\
-                                    l='2_p1', dir_name='propagation_direction'):
+                                    gate_orientation=False, save_df=False, h=120, alpha=33, t=6,\
+                                    l='2_p1', dir_name='propagation_direction',\
+                                    store_dir=None, prefetch=2, n_workers=1,\
+                                    memory_budget=None, checkpoint_dir=None, resume=False):
+    params = dict(locals()) # arguments of the run, recorded in the checkpoint
+    checkpoint = _open_checkpoint(checkpoint_dir, 'batch_get_propagation_direction', params, resume)
     # 1. create file name list
     filename_list = create_filename_list(base_name, img_num_list, zeropad)
     # 2. batch process of calculating finger proagation direction
-    concat_df = [] # Create an empty list to store concatenated data frames
-    for name in filename_list:
-        df = fa.line_orientation.get_finger_orientation(name, threshold, minLineLength,\
-                                                        maxLineGap, data_bar_top,\
-                                                        show_image, save_image, save_df_indiv)
-        df = df[df>ori_l].dropna()
-        df = df[df<ori_u].dropna()
-        concat_df.append(df) # create list of data frames to be concatenated
-    df_combined = pd.concat(concat_df, keys=filename_list)
+    def compute(name, pix_size):
+        fa.instrument.set_image(name)
+        lines = fa.line_orientation.get_finger_lines(name, threshold, minLineLength,\
+                                                     maxLineGap, data_bar_top,\
+                                                     show_image, save_image,\
+                                                     *_gate(gate_orientation, ori_l, ori_u))
+        if save_df_indiv == True:
+            # all the detected lines, as get_finger_orientation saves them
+            excel_name = '{}_{}_{}_{}'.format(os.path.basename(name), threshold,\
+                                              minLineLength, maxLineGap)
+            fa.output.make_dir_and_output_df_to_excel(os.path.join(os.path.dirname(name),\
+                                                                   'Finger_Direction'),\
+                                                      lines.to_frame(['Finger orientation (deg)']),\
+                                                      excel_name, '')
+        return lines.select(ori_l, ori_u).to_frame(['Finger orientation (deg)'])
+    files = lambda name: [(name+'.tif', 1)]
+    # list of data frames to be concatenated; the next images are read while
+    # the current one is processed
+    concat_df = _run_images(filename_list, compute, files, prefetch=prefetch,\
+                            n_workers=n_workers, checkpoint=checkpoint,\
+                            memory_budget=memory_budget,\
+                            steps=('line_orientation.get_finger_lines',))
+    fa.instrument.set_image(None)
+    df_combined = pd.concat(concat_df, keys=_image_names(filename_list))
     # 3. save the result
+    if store_dir is not None:
+        # appending the dataframe to the columnar result store
+        fa.store.append_results(store_dir, dir_name, df_combined, h, alpha, t, l)
     if save_df==True:
         # saving the dataframe to an excel file
         output_name = '{}nm_{}deg_{}h_{}'.format(h,alpha,t,l)
@@ -112,6 +283,8 @@ def batch_get_propagation_direction(base_name, img_num_list, zeropad=3,\
    
     return df_combined
 
+@fa.service.remote
+@fa.instrument.instrumented
 def batch_get_propagation_distance(base_name, img_num_list, zeropad=3,\
                                    suffix_1='_line_1', suffix_2='_line_2',\
                                    line_color='r', data_bar_top=690,\
@@ -122,34 +295,48 @@ def batch_get_propagation_distance(base_name, img_num_list, zeropad=3,\
                                    minLineLength=25, maxLineGap=10, show_img=False,\
                                    show_edge=False, show_scale_bar=False,\
                                    save_df=False, h=120, alph=33, t=6, l='2_p1',\
-                                   dir_name='propagation_distance'):
+                                   dir_name='propagation_distance', store_dir=None,\
+                                   prefetch=2, n_workers=1, memory_budget=None,\
+                                   checkpoint_dir=None, resume=False, catalog=None):
+    params = dict(locals()) # arguments of the run, recorded in the checkpoint
+    checkpoint = _open_checkpoint(checkpoint_dir, 'batch_get_propagation_distance', params, resume)
     # 1. create file name list
     filename_list = create_filename_list(base_name, img_num_list, zeropad)
     # 2. batch process of calculating finger proagation distance
-    concat_df = [] # Create an empty list to store concatenated data frames
-    for name in filename_list:
-        edges = fa.fingers.get_edges_in_img(name, data_bar_top)
+    def compute(name, pix_size):
+        fa.instrument.set_image(name)
+        top = _data_bar_top(name, data_bar_top, pix_size_given)
+        edges = fa.fingers.get_edges_in_img(name, top)
         line_1 = fa.fingers.get_line_drawn_in_img(name, suffix_1,\
-                                                     line_color, data_bar_top)
+                                                     line_color, top)
         line_2 = fa.fingers.get_line_drawn_in_img(name, suffix_2,\
-                                                     line_color, data_bar_top)
+                                                     line_color, top)
         sorted_df_init = fa.fingers.get_coords_intersections(line_1, line_2,\
                                                                 show_overlay)
         sorted_df_tips = fa.fingers.get_coords_intersections(edges, line_2,\
                                                                 show_overlay)
-        if pix_size_given == True:
-            pix_size = fa.scale.get_pixel_size(name)[0]/1000
-        if pix_size_given == False:
-            pix_size = fa.scale.extract_pixel_size(name, y_min, y_max, x_min,\
-                                                      x_max, y_min_bar, y_max_bar,\
-                                                      x_min_bar, x_max_bar, e_w, s_w,\
-                                                      threshold, minLineLength, maxLineGap,\
-                                                      show_img, show_edge, show_scale_bar)[2]
         distance = fa.fingers.propagation_distance_of_fingers(sorted_df_init,\
                                                                   sorted_df_tips, pix_size)
-        concat_df.append(distance)
-    df_combined = pd.concat(concat_df, keys=filename_list)
+        return distance
+    files = lambda name: [(name+'.tif', 0), (name+suffix_1+'.tif', 1),\
+                          (name+suffix_2+'.tif', 1)]
+    pixel_size = _pixel_size_function(pix_size_given, (y_min, y_max, x_min, x_max,\
+                                                       y_min_bar, y_max_bar, x_min_bar,\
+                                                       x_max_bar, e_w, s_w, threshold,\
+                                                       minLineLength, maxLineGap, show_img,\
+                                                       show_edge, show_scale_bar), catalog)
+    # figures can only be shown from this thread
+    in_reader = not (show_img == True or show_edge == True or show_scale_bar == True)
+    concat_df = _run_images(filename_list, compute, files, pixel_size, in_reader,\
+                            prefetch, n_workers, checkpoint, memory_budget,\
+                            ('fingers.get_edges_in_img', 'fingers.get_line_drawn_in_img',\
+                             'fingers.get_line_drawn_in_img', 'fingers.get_coords_intersections'))
+    fa.instrument.set_image(None)
+    df_combined = pd.concat(concat_df, keys=_image_names(filename_list))
     # 3. save the result
+    if store_dir is not None:
+        # appending the dataframe to the columnar result store
+        fa.store.append_results(store_dir, dir_name, df_combined, h, alph, t, l)
     if save_df==True:
         # saving the dataframe to an excel file
         output_name = '{}nm_{}deg_{}h_{}'.format(h,alph,t,l)
@@ -167,18 +354,24 @@ def batch_get_propagation_distance(base_name, img_num_list, zeropad=3,\
     
     return df_combined  
 
+@fa.service.remote
+@fa.instrument.instrumented
 def batch_get_a_b_p(base_name, img_num_list, zeropad=3,\
                     threshold_alpha=100, minLineLength_alpha=100, maxLineGap_alpha=5,\
                     threshold_beta=100, minLineLength_beta=100, maxLineGap_beta=10,\
                     data_bar_top=690, show_image=False, ori_l=0, ori_u=50,\
-                    suffix='_line1', line_color='r', show_overlay=False,\
+                    gate_orientation=False, suffix='_line1', line_color='r', show_overlay=False,\
                     pix_size_given=True, y_min=713, y_max=750, x_min=5,\
                     x_max=190, y_min_bar=730, y_max_bar=760, x_min_bar=5,\
                     x_max_bar=190, e_w=1, s_w=1, threshold_s=25,\
                     minLineLength_s=25, maxLineGap_s=10, show_img=False,\
                     show_edge=False, show_scale_bar=False, save_df=False,\
                     h=120, alph=33, t=6, l='2_p1', dir_name_a='wire_width',\
-                    dir_name_b='finger_width', dir_name_p='finger_period'):
+                    dir_name_b='finger_width', dir_name_p='finger_period',\
+                    store_dir=None, prefetch=2, n_workers=1, n_stage_threads=1,\
+                    memory_budget=None, checkpoint_dir=None, resume=False, catalog=None):
+    params = dict(locals()) # arguments of the run, recorded in the checkpoint
+    checkpoint = _open_checkpoint(checkpoint_dir, 'batch_get_a_b_p', params, resume)
     
     # 1. create file name list
     filename_list = create_filename_list(base_name, img_num_list, zeropad)
@@ -189,73 +382,98 @@ def batch_get_a_b_p(base_name, img_num_list, zeropad=3,\
     # and compute a_p, b_p, and p_p, where a_p and b_p are the actual widths 
     # of wires and fingers (i.e. perpendicular to the wires) and p_p is the finger period
     # perpendicular to the wire arrays
-    concat_df_a = []
-    concat_df_b = []
-    concat_df_p = []
-    for name in filename_list:
+    # The stages of an image are run by 'pipeline.run_stages' as soon as the
+    # stages they depend on are done, so that with n_stage_threads > 1 the
+    # independent stages (alpha, beta, edges, line, pixel size) run at the same time.
+    def get_alpha(name, top):
         # 1.calculate alpha (i.e. initial edge orientation w.r.t. x-axis)
-        if line_color=='r':
-            df_alpha = fa.line_orientation.get_red_line_orientation(name, suffix,\
-                                                                    threshold_alpha,\
-                                                                    minLineLength_alpha,\
-                                                                    maxLineGap_alpha,\
-                                                                    data_bar_top, show_image)
-            alpha = df_alpha['Red line orientation (deg)'].mean() 
-        if line_color=='k':
-            df_alpha = fa.line_orientation.get_black_line_orientation(name, suffix,\
-                                                                      threshold_alpha,\
-                                                                      minLineLength_alpha,\
-                                                                      maxLineGap_alpha,\
-                                                                      data_bar_top, show_image)
-            alpha = df_alpha['Black line orientation (deg)'].mean()
+        lines = fa.line_orientation.get_drawn_lines(name, suffix, line_color, threshold_alpha,\
+                                                    minLineLength_alpha, maxLineGap_alpha,\
+                                                    top, show_image)
+        alpha = lines.mean_angle(weighted=False)
+        return alpha
+    def get_beta(name, top):
         # 2. calculate beta (i.e. wire orientation w.r.t. x-axis)
-        df_beta = fa.line_orientation.get_finger_orientation(name, threshold_beta,\
-                                                             minLineLength_beta,\
-                                                             maxLineGap_beta,\
-                                                             data_bar_top,\
-                                                             show_image)
-        df_beta = df_beta[df_beta>ori_l].dropna()
-        df_beta = df_beta[df_beta<ori_u].dropna()
-        beta = df_beta['Finger orientation (deg)'].mean()
+        lines = fa.line_orientation.get_finger_lines(name, threshold_beta,\
+                                                     minLineLength_beta,\
+                                                     maxLineGap_beta,\
+                                                     top,\
+                                                     show_image, False,\
+                                                     *_gate(gate_orientation, ori_l, ori_u))
+        beta = lines.select(ori_l, ori_u).mean_angle(weighted=False)
+        return beta
+    def get_a_b_p(sorted_df, pix_size, alpha, beta):
         # 3. calculate wire width, finger width, and finger period along alpha
-        edges = fa.fingers.get_edges_in_img(name, data_bar_top)
-        line = fa.fingers.get_line_drawn_in_img(name, suffix, line_color, data_bar_top)
-        sorted_df = fa.fingers.get_coords_intersections(edges, line, show_overlay)
-        if pix_size_given == True:
-            pix_size = fa.scale.get_pixel_size(name)[0]/1000
-        if pix_size_given == False:
-            pix_size = fa.scale.extract_pixel_size(name, y_min, y_max, x_min,\
-                                                      x_max, y_min_bar, y_max_bar,\
-                                                      x_min_bar, x_max_bar, e_w, s_w,\
-                                                      threshold_s, minLineLength_s, maxLineGap_s,\
-                                                      show_img, show_edge, show_scale_bar)[2]
         a = fa.fingers.get_wire_widths_along_line(sorted_df, pix_size)
-        a.rename(columns={'Wire width (\u03BCm)':'Wire width along alpha (\u03BCm)'}, inplace=True)
+        a.rename(columns={'Wire width (μm)':'Wire width along alpha (μm)'}, inplace=True)
         b = fa.fingers.get_finger_widths_along_line(sorted_df, pix_size)
-        b.rename(columns={'Finger width (\u03BCm)':'Finger width along alpha (\u03BCm)'}, inplace=True)
+        b.rename(columns={'Finger width (μm)':'Finger width along alpha (μm)'}, inplace=True)
         p = fa.fingers.get_finger_periods_along_line(sorted_df, pix_size)
-        p.rename(columns={'Finger period (\u03BCm)':'Finger period along alpha (\u03BCm)'}, inplace=True)
+        p.rename(columns={'Finger period (μm)':'Finger period along alpha (μm)'}, inplace=True)
         # 4. calculate wire width, finger width, and finger period perpendicular to wires
         m = np.sin(np.deg2rad(abs(alpha)+abs(beta)))
         a_p = a*m
-        a_p.rename(columns={'Wire width along alpha (\u03BCm)':'Wire width (\u03BCm)'}, inplace=True)
+        a_p.rename(columns={'Wire width along alpha (μm)':'Wire width (μm)'}, inplace=True)
         b_p = b*m
-        b_p.rename(columns={'Finger width along alpha (\u03BCm)':'Finger width (\u03BCm)'}, inplace=True)
+        b_p.rename(columns={'Finger width along alpha (μm)':'Finger width (μm)'}, inplace=True)
         p_p = p*m
-        p_p.rename(columns={'Finger period along alpha (\u03BCm)':'Finger period (\u03BCm)'}, inplace=True)
+        p_p.rename(columns={'Finger period along alpha (μm)':'Finger period (μm)'}, inplace=True)
         # 5. concatenate the dataframes side by side
         df_a = pd.concat([a, a_p], axis=1)
         df_b = pd.concat([b, b_p], axis=1)
         df_p = pd.concat([p, p_p], axis=1)
-        # 6. append the concatenated dataframe to the empty list of 'concat_df'
-        concat_df_a.append(df_a)
-        concat_df_b.append(df_b)
-        concat_df_p.append(df_p)
-    df_combined_a = pd.concat(concat_df_a, keys=filename_list)
-    df_combined_b = pd.concat(concat_df_b, keys=filename_list)
-    df_combined_p = pd.concat(concat_df_p, keys=filename_list)
+        return df_a, df_b, df_p
+    def compute(name, pix_size):
+        fa.instrument.set_image(name)
+        top = _data_bar_top(name, data_bar_top, pix_size_given)
+        stages = {'alpha': (lambda: get_alpha(name, top), ()),
+                  'beta': (lambda: get_beta(name, top), ()),
+                  'edges': (lambda: fa.fingers.get_edges_in_img(name, top), ()),
+                  'line': (lambda: fa.fingers.get_line_drawn_in_img(name, suffix, line_color,\
+                                                                    top), ()),
+                  'pix_size': ((lambda: pix_size) if ocr_ahead == True\
+                               else (lambda: pixel_size(name)), ()),
+                  'sorted_df': (lambda edges, line: fa.fingers.get_coords_intersections(edges, line,\
+                                                                                        show_overlay),\
+                                ('edges', 'line')),
+                  'a_b_p': (get_a_b_p, ('sorted_df', 'pix_size', 'alpha', 'beta'))}
+        return fa.pipeline.run_stages(stages, stage_threads)['a_b_p']
+    # 6. the next images are read (and their pixel sizes) while the current one is processed
+    files = lambda name: [(name+'.tif', 1), (name+'.tif', 0), (name+suffix+'.tif', 1)]
+    pixel_size = _pixel_size_function(pix_size_given, (y_min, y_max, x_min, x_max,\
+                                                       y_min_bar, y_max_bar, x_min_bar,\
+                                                       x_max_bar, e_w, s_w, threshold_s,\
+                                                       minLineLength_s, maxLineGap_s, show_img,\
+                                                       show_edge, show_scale_bar), catalog)
+    # figures can only be shown from this thread
+    show = show_image == True or show_overlay == True or show_img == True\
+        or show_edge == True or show_scale_bar == True
+    stage_threads = 1 if show == True else n_stage_threads
+    # the pixel size is read by the reader threads, or else as one of the
+    # stages (also when there is a single image, as there is nothing to read ahead)
+    ocr_ahead = prefetch > 0 and not show and len(filename_list) > 1
+    results = _run_images(filename_list, compute, files,\
+                          pixel_size if ocr_ahead == True else None,\
+                          prefetch=prefetch, n_workers=n_workers, checkpoint=checkpoint,\
+                          memory_budget=memory_budget,\
+                          steps=('line_orientation.get_drawn_lines',\
+                                 'line_orientation.get_finger_lines', 'fingers.get_edges_in_img',\
+                                 'fingers.get_line_drawn_in_img',\
+                                 'fingers.get_coords_intersections'))
+    concat_df_a = [df_a for df_a, df_b, df_p in results]
+    concat_df_b = [df_b for df_a, df_b, df_p in results]
+    concat_df_p = [df_p for df_a, df_b, df_p in results]
+    fa.instrument.set_image(None)
+    df_combined_a = pd.concat(concat_df_a, keys=_image_names(filename_list))
+    df_combined_b = pd.concat(concat_df_b, keys=_image_names(filename_list))
+    df_combined_p = pd.concat(concat_df_p, keys=_image_names(filename_list))
     
     # 3. save the result
+    if store_dir is not None:
+        # appending the dataframes to the columnar result store
+        fa.store.append_results(store_dir, dir_name_a, df_combined_a, h, alph, t, l, suffix)
+        fa.store.append_results(store_dir, dir_name_b, df_combined_b, h, alph, t, l, suffix)
+        fa.store.append_results(store_dir, dir_name_p, df_combined_p, h, alph, t, l, suffix)
     if save_df==True:
         # saving the dataframe to an excel file
         output_name = '{}nm_{}deg_{}h_{}{}'.format(h,alph,t,l,suffix)
@@ -280,6 +498,7 @@ def batch_get_a_b_p(base_name, img_num_list, zeropad=3,\
     
     return (df_combined_a, df_combined_b, df_combined_p)
 
+@fa.instrument.instrumented
 def check_get_pixel_size(filename_list, data_bar_min=712, data_bar_max=760):
     """
     check if the function 'get_pix_size' correctly reads the pixel size and 
@@ -316,6 +535,7 @@ def check_get_pixel_size(filename_list, data_bar_min=712, data_bar_max=760):
     
     return df_result
 
+@fa.instrument.instrumented
 def check_extract_pixel_size(filename_list, y_min=713, y_max=750, x_min=5, x_max=190,\
                             y_min_bar=730, y_max_bar=760, x_min_bar=5, x_max_bar=190,\
                             e_w=1, s_w=1, threshold=25, minLineLength=25, maxLineGap=10,\
@@ -341,61 +561,50 @@ def check_extract_pixel_size(filename_list, y_min=713, y_max=750, x_min=5, x_max
     
     return df_result
 
+@fa.service.remote
+@fa.instrument.instrumented
 def batch_new_method_propagation_distance(base_name, img_num_list, l='2_p1', zeropad=3,\
                                           suffix_1='new_line_1', suffix_2='new_line_2',\
                                           threshold_alpha=100, minLineLength_alpha=100,\
                                           maxLineGap_alpha=5, threshold_beta=100,\
                                           minLineLength_beta=100, maxLineGap_beta=10,\
                                           data_bar_top=690, show_image=False, ori_l=0,\
-                                          ori_u=50, line_color='r', show_overlay=False,\
+                                          ori_u=50, gate_orientation=False, line_color='r', show_overlay=False,\
                                           pix_size_given=True, y_min=713, y_max=750,\
                                           x_min=5, x_max=190, y_min_bar=730, y_max_bar=760,\
                                           x_min_bar=5, x_max_bar=190, e_w=1, s_w=1,\
                                           threshold_s=25, minLineLength_s=25, maxLineGap_s=10,\
                                           show_img=False, show_edge=False, show_scale_bar=False,\
                                           save_df=False, h=120, alph=33, t=6, reverse_sort=False,\
-                                          dir_name='propagation_distance'):
+                                          dir_name='propagation_distance', store_dir=None,\
+                                          dataset='propagation_distance_new_method',\
+                                          prefetch=2, n_workers=1, memory_budget=None,\
+                                          checkpoint_dir=None, resume=False, catalog=None):
+    params = dict(locals()) # arguments of the run, recorded in the checkpoint
+    checkpoint = _open_checkpoint(checkpoint_dir, 'batch_new_method_propagation_distance', params, resume)
     #1. Create file name list
     filename_list = create_filename_list(base_name, img_num_list, zeropad)
     #2. Calculate propagation distance of fingers using the new method
-    concat_df = []
-    for name in filename_list:
+    def compute(name, pix_size):
+        fa.instrument.set_image(name)
+        top = _data_bar_top(name, data_bar_top, pix_size_given)
         # 1.calculate alpha (i.e. initial edge orientation w.r.t. x-axis)
-        if line_color=='r':
-            df_alpha = fa.line_orientation.get_red_line_orientation(name, suffix_1,\
-                                                                    threshold_alpha,\
-                                                                    minLineLength_alpha,\
-                                                                    maxLineGap_alpha,\
-                                                                    data_bar_top, show_image)
-            alpha = df_alpha['Red line orientation (deg)'].mean() 
-        if line_color=='k':
-            df_alpha = fa.line_orientation.get_black_line_orientation(name, suffix_1,\
-                                                                      threshold_alpha,\
-                                                                      minLineLength_alpha,\
-                                                                      maxLineGap_alpha,\
-                                                                      data_bar_top, show_image)
-            alpha = df_alpha['Black line orientation (deg)'].mean()
+        lines = fa.line_orientation.get_drawn_lines(name, suffix_1, line_color,\
+                                                    threshold_alpha, minLineLength_alpha,\
+                                                    maxLineGap_alpha, top, show_image)
+        alpha = lines.mean_angle(weighted=False)
         # 2. calculate beta (i.e. wire orientation w.r.t. x-axis)
-        df_beta = fa.line_orientation.get_finger_orientation(name, threshold_beta,\
-                                                             minLineLength_beta,\
-                                                             maxLineGap_beta,\
-                                                             data_bar_top,\
-                                                             show_image)
-        df_beta = df_beta[df_beta>ori_l].dropna()
-        df_beta = df_beta[df_beta<ori_u].dropna()
-        beta = df_beta['Finger orientation (deg)'].mean()
-        # 3. get pixel size
-        if pix_size_given == True:
-            pix_size = fa.scale.get_pixel_size(name)[0]/1000
-        if pix_size_given == False:
-            pix_size = fa.scale.extract_pixel_size(name, y_min, y_max, x_min,\
-                                                      x_max, y_min_bar, y_max_bar,\
-                                                      x_min_bar, x_max_bar, e_w, s_w,\
-                                                      threshold_s, minLineLength_s, maxLineGap_s,\
-                                                      show_img, show_edge, show_scale_bar)[2]
+        lines = fa.line_orientation.get_finger_lines(name, threshold_beta,\
+                                                     minLineLength_beta,\
+                                                     maxLineGap_beta,\
+                                                     top,\
+                                                     show_image, False,\
+                                                     *_gate(gate_orientation, ori_l, ori_u))
+        beta = lines.select(ori_l, ori_u).mean_angle(weighted=False)
+        # 3. the pixel size (pix_size) is read ahead, see below
         # 4. calculate propgation distance of fingers
-        line_1 = fa.fingers.get_line_drawn_in_img(name, suffix_1, line_color, data_bar_top)
-        line_2 = fa.fingers.get_line_drawn_in_img(name, suffix_2, line_color, data_bar_top)
+        line_1 = fa.fingers.get_line_drawn_in_img(name, suffix_1, line_color, top)
+        line_2 = fa.fingers.get_line_drawn_in_img(name, suffix_2, line_color, top)
         sorted_df = fa.fingers.get_coords_intersections(line_1, line_2, show_overlay)
         if reverse_sort == True:
             sorted_df = sorted_df.iloc[::-1].reset_index(drop=True)
@@ -411,10 +620,29 @@ def batch_new_method_propagation_distance(base_name, img_num_list, l='2_p1', zer
         length.distance.iloc[0] = float('nan')
         m = np.sin(np.deg2rad(abs(alpha)+abs(beta)))
         d=length/m
-        concat_df.append(d)
-    df = pd.concat(concat_df, keys=filename_list)
+        return d
+    files = lambda name: [(name+'.tif', 1), (name+suffix_1+'.tif', 1), (name+suffix_2+'.tif', 1)]
+    pixel_size = _pixel_size_function(pix_size_given, (y_min, y_max, x_min, x_max,\
+                                                       y_min_bar, y_max_bar, x_min_bar,\
+                                                       x_max_bar, e_w, s_w, threshold_s,\
+                                                       minLineLength_s, maxLineGap_s, show_img,\
+                                                       show_edge, show_scale_bar), catalog)
+    # figures can only be shown from this thread
+    in_reader = not (show_img == True or show_edge == True or show_scale_bar == True)
+    concat_df = _run_images(filename_list, compute, files, pixel_size, in_reader,\
+                            prefetch, n_workers, checkpoint, memory_budget,\
+                            ('line_orientation.get_drawn_lines',\
+                             'line_orientation.get_finger_lines', 'fingers.get_line_drawn_in_img',\
+                             'fingers.get_line_drawn_in_img', 'fingers.get_coords_intersections'))
+    fa.instrument.set_image(None)
+    df = pd.concat(concat_df, keys=_image_names(filename_list))
     
    # 3. save the result
+    if store_dir is not None:
+        # appending the dataframe to the columnar result store
+        # (its own data set, as its columns differ from those of
+        # batch_get_propagation_distance)
+        fa.store.append_results(store_dir, dataset, df, h, alph, t, l)
     if save_df==True:
         # saving the dataframe to an excel file
         output_name = '{}nm_{}deg_{}h_{}'.format(h,alph,t,l)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:10:05 2026
+
+@author: yoonahshin
+
+Benchmarks of the public stages on the SEM images bundled in the repository.
+The batch runs take the pixel sizes stated in the data bars from
+golden.STATED_PIXEL_SIZES instead of reading them with OCR (unless ocr=True),
+so that they can be timed without Tesseract; the OCR itself is timed by the
+get_pixel_size and extract_pixel_size stages.
+Run from the command line, for example:
+    python -m finger_analysis.benchmark --save benchmark_results/baseline.json
+    python -m finger_analysis.benchmark --compare benchmark_results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import datetime
+import argparse
+import numpy as np
+import finger_analysis as fa
+
+# Folder of SEM images bundled in the repository
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),\
+                                'data', '05.28.2019_6h_3-3new_ni110_120')
+# Images of the folder that have the '_line1', '_line2', '_line_1' and '_line_2'
+# annotations (the same images as in batch_analysis.ipynb)
+DEFAULT_IMG_NUM_LIST = [28, 29, 34, 37, 40]
+# Parameters used in batch_analysis.ipynb
+DEFAULT_PARAMS = {'base_name': '33deg_', 'threshold_beta': 100,\
+                  'minLineLength_beta': 100, 'maxLineGap_beta': 5,\
+                  'ori_l': 14, 'ori_u': 50, 'suffix_a_b_p': '_line2',\
+                  'suffix_1': '_line_1', 'suffix_2': '_line_2'}
+
+def _names(img_num_list):
+    return fa.batch.create_filename_list(DEFAULT_PARAMS['base_name'], img_num_list)
+
+def _stage_detect_lines(img_num_list):
+    p = DEFAULT_PARAMS
+    names = _names(img_num_list)
+    return lambda: [fa.line_orientation.detect_lines(name, p['threshold_beta'],\
+                                                     p['minLineLength_beta'],\
+                                                     p['maxLineGap_beta'])\
+                    for name in names]
+
+def _stage_get_edges_in_img(img_num_list):
+    names = _names(img_num_list)
+    return lambda: [fa.fingers.get_edges_in_img(name) for name in names]
+
+def _stage_get_coords_intersections(img_num_list):
+    # Only the intersection finding is timed, the images are loaded beforehand
+    names = _names(img_num_list)
+    inputs = [(fa.fingers.get_edges_in_img(name),\
+               fa.fingers.get_line_drawn_in_img(name, DEFAULT_PARAMS['suffix_a_b_p']))\
+              for name in names]
+    return lambda: [fa.fingers.get_coords_intersections(edges, line)\
+                    for edges, line in inputs]
+
+def _stage_get_pixel_size(img_num_list):
+    names = _names(img_num_list)
+    return lambda: [fa.scale.get_pixel_size(name) for name in names]
+
+def _stage_extract_pixel_size(img_num_list):
+    names = _names(img_num_list)
+    return lambda: [fa.scale.extract_pixel_size(name) for name in names]
+
+def _stage_batch_get_a_b_p(img_num_list):
+    p = DEFAULT_PARAMS
+    return lambda: fa.batch.batch_get_a_b_p(p['base_name'], img_num_list,\
+                                            threshold_beta=p['threshold_beta'],\
+                                            minLineLength_beta=p['minLineLength_beta'],\
+                                            maxLineGap_beta=p['maxLineGap_beta'],\
+                                            ori_l=p['ori_l'], ori_u=p['ori_u'],\
+                                            suffix=p['suffix_a_b_p'])
+
+def _stage_batch_get_propagation_distance(img_num_list):
+    p = DEFAULT_PARAMS
+    return lambda: fa.batch.batch_get_propagation_distance(p['base_name'], img_num_list,\
+                                                           suffix_1=p['suffix_1'],\
+                                                           suffix_2=p['suffix_2'])
+
+# Name of stage -> function taking the list of image numbers and returning the
+# callable to be timed (anything done before returning it is not timed)
+STAGES = {'detect_lines': _stage_detect_lines,
+          'get_edges_in_img': _stage_get_edges_in_img,
+          'get_coords_intersections': _stage_get_coords_intersections,
+          'get_pixel_size': _stage_get_pixel_size,
+          'extract_pixel_size': _stage_extract_pixel_size,
+          'batch_get_a_b_p': _stage_batch_get_a_b_p,
+          'batch_get_propagation_distance': _stage_batch_get_propagation_distance}
+
+# Replacements in place while a stage runs, unless ocr=True (see
+# run_benchmarks): the batch runs use the stated pixel sizes
+STAGE_REPLACEMENTS = {'batch_get_a_b_p': {'scale.get_pixel_size': fa.golden.stated_pixel_size},
+                      'batch_get_propagation_distance': {'scale.get_pixel_size': fa.golden.stated_pixel_size}}
+
+def run_benchmarks(data_dir=None, stages=None, img_num_list=None, repeat=5, warmup=1,\
+                   ocr=False):
+    """
+    Parameters
+    ----------
+    data_dir : str, optional
+        Folder of the images. The default is the folder bundled in the repository.
+    stages : list, optional
+        Names of stages to run (see STAGES). The default is all the stages.
+    img_num_list : list, optional
+        Image numbers processed by every stage. The default is DEFAULT_IMG_NUM_LIST.
+    repeat : int, optional
+        Number of timed runs of every stage. The default is 5.
+    warmup : int, optional
+        Number of untimed runs before the timed runs. The default is 1.
+    ocr : bool, optional
+        If True, the batch runs read the pixel sizes with OCR. The default is
+        False: they take the stated pixel sizes (see STAGE_REPLACEMENTS).
+
+    Returns
+    -------
+    Dictionary with the metadata of the run (commit, date, python and library
+    versions, machine) and, for every stage, the list of run times (s) and
+    their min, median, mean and std. A stage that cannot run (e.g. the OCR
+    stages when Tesseract is not installed) is recorded as skipped with the
+    error message.
+
+    """
+    import cv2
+    if data_dir is None:
+        data_dir = DEFAULT_DATA_DIR
+    if stages is None:
+        stages = list(STAGES)
+    if img_num_list is None:
+        img_num_list = DEFAULT_IMG_NUM_LIST
+    results = {'commit': fa.util.git_commit(),\
+               'date': str(datetime.datetime.now()),\
+               'python': platform.python_version(),\
+               'numpy': np.__version__,\
+               'opencv': cv2.__version__,\
+               'machine': platform.platform(),\
+               'cpu_count': os.cpu_count(),\
+               'img_num_list': list(img_num_list),\
+               'repeat': repeat,\
+               'ocr': ocr,\
+               'stages': {}}
+    with fa.util.working_directory(data_dir):
+        for stage in stages:
+            try:
+                with fa.util.replaced({} if ocr == True else STAGE_REPLACEMENTS.get(stage, {})):
+                    func = STAGES[stage](img_num_list)
+                    for i in range(warmup):
+                        func()
+                    times = []
+                    for i in range(repeat):
+                        start = time.perf_counter()
+                        func()
+                        times.append(time.perf_counter() - start)
+            except Exception as e:
+                results['stages'][stage] = {'skipped': '{}: {}'.format(type(e).__name__, e)}
+                continue
+            results['stages'][stage] = {'times': times,\
+                                        'min': float(np.min(times)),\
+                                        'median': float(np.median(times)),\
+                                        'mean': float(np.mean(times)),\
+                                        'std': float(np.std(times))}
+    return results
+
+def save_results(results, path):
+    """
+    Saves the results of run_benchmarks as a JSON file.
+    """
+    directory = os.path.dirname(path)
+    if directory != '' and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    return None
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_results(current, baseline, threshold=0.2, statistic='median'):
+    """
+    Compares two results of run_benchmarks stage by stage. Returns a pandas
+    data frame with the baseline and current times, their ratio, and a
+    'regression' column that is True when the current time is more than
+    (1 + threshold) times the baseline time. The stages of either run that
+    could not be compared are reported too, with the reason in the 'status'
+    column; a stage timed in the baseline that is skipped (cannot run) in
+    the current run is a regression.
+    """
+    import pandas as pd
+    rows = []
+    # batch runs timed with OCR are not comparable with runs without it
+    modes_differ = current.get('ocr', False) != baseline.get('ocr', False)
+    for stage in list(current['stages']) + [stage for stage in baseline['stages']\
+                                             if stage not in current['stages']]:
+        cur = current['stages'].get(stage)
+        base = baseline['stages'].get(stage)
+        row = {'stage': stage,\
+               'baseline (s)': np.nan if base is None else base.get(statistic, np.nan),\
+               'current (s)': np.nan if cur is None else cur.get(statistic, np.nan),\
+               'ratio': np.nan, 'regression': False, 'status': 'compared'}
+        if cur is None: # not among the stages run
+            row['status'] = 'not run in the current run'
+        elif 'skipped' in cur:
+            row['status'] = 'skipped in the current run ({})'.format(cur['skipped'])
+            row['regression'] = base is not None and 'skipped' not in base
+        elif base is None:
+            row['status'] = 'missing in the baseline'
+        elif 'skipped' in base:
+            row['status'] = 'skipped in the baseline ({})'.format(base['skipped'])
+        elif modes_differ and stage in STAGE_REPLACEMENTS:
+            row['status'] = 'not comparable (ocr={} in the baseline)'.format(baseline.get('ocr', False))
+        else:
+            row['ratio'] = cur[statistic]/base[statistic]
+            row['regression'] = bool(row['ratio'] > 1 + threshold)
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('stage')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the public stages '
+                                     'of finger_analysis on the bundled SEM images.')
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--stages', nargs='*', default=None, choices=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', default=None, help='path of the JSON file to save the results to')
+    parser.add_argument('--compare', default=None, help='path of the baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2,\
+                        help='relative slowdown flagged as a regression (default 0.2)')
+    parser.add_argument('--ocr', action='store_true',\
+                        help='read the pixel sizes with OCR in the batch runs')
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.data_dir, args.stages, repeat=args.repeat, ocr=args.ocr)
+    for stage, res in results['stages'].items():
+        if 'skipped' in res:
+            print('{:32s} skipped ({})'.format(stage, res['skipped']))
+        else:
+            print('{:32s} median {:.4f} s  min {:.4f} s'.format(stage, res['median'], res['min']))
+    if args.save is not None:
+        save_results(results, args.save)
+    if args.compare is not None:
+        comparison = compare_results(results, load_results(args.compare), args.threshold)
+        print(comparison.to_string())
+        if comparison.regression.any():
+            print('Regression in: {}'.format(', '.join(comparison.index[comparison.regression])))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 17:52:27 2026
+
+@author: yoonahshin
+
+SQLite index of the images of the experiment folders: every image file is
+parsed once into (base name, image number, annotation suffix), with its size,
+modification time and hash, and the pixel sizes read from the data bars are
+cached, so that images can be selected by query instead of by globbing and
+string matching.
+"""
+import os
+import re
+import sqlite3
+import hashlib
+import datetime
+import pandas as pd
+import finger_analysis as fa
+
+# e.g. '33deg_028_line_1' -> base name '33deg_', number '028', suffix '_line_1'
+NAME_PATTERN = re.compile(r'^(?P<base_name>.*?_)(?P<number>\d+)(?P<suffix>_.*)?$')
+# e.g. '05.28.2019_6h_3-3new_ni110_120' -> date 05.28.2019, 6 hours, 120 nm
+DATE_PATTERN = re.compile(r'(\d{2}\.\d{2}\.\d{4})')
+TIME_PATTERN = re.compile(r'(?:^|_)(\d+(?:\.\d+)?)h(?:_|$)')
+THICKNESS_PATTERN = re.compile(r'_(\d+(?:\.\d+)?)$')
+ANGLE_PATTERN = re.compile(r'(-?\d+(?:\.\d+)?)deg')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    date TEXT, h REAL, alpha REAL, t REAL, l TEXT,
+    scanned TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    name TEXT NOT NULL,
+    base_name TEXT, number INTEGER, zeropad INTEGER, angle REAL,
+    suffix TEXT NOT NULL,
+    mtime_ns INTEGER, size INTEGER, sha1 TEXT,
+    UNIQUE (folder_id, name));
+CREATE INDEX IF NOT EXISTS files_image ON files (folder_id, base_name, number, suffix);
+CREATE INDEX IF NOT EXISTS files_suffix ON files (suffix, angle);
+CREATE TABLE IF NOT EXISTS pixel_sizes (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    method TEXT NOT NULL,
+    sha1 TEXT,
+    pixel_size REAL, prefix TEXT,
+    PRIMARY KEY (file_id, method));
+"""
+
+def connect(db_path):
+    """
+    Opens (and creates if needed) the SQLite index db_path.
+    """
+    con = sqlite3.connect(db_path)
+    con.executescript(_SCHEMA)
+    return con
+
+def parse_name(name):
+    """
+    Parses an image file name without extension, e.g. '33deg_028_line_1'.
+    Returns a dictionary with base_name ('33deg_'), number (28), zeropad (3),
+    angle (33.0, or None if the base name has no 'deg') and suffix ('_line_1',
+    '' for the original image), or None if the name does not match.
+    """
+    match = NAME_PATTERN.match(name)
+    if match is None:
+        return None
+    angle = ANGLE_PATTERN.search(match.group('base_name'))
+    return {'base_name': match.group('base_name'),\
+            'number': int(match.group('number')),\
+            'zeropad': len(match.group('number')),\
+            'angle': None if angle is None else float(angle.group(1)),\
+            'suffix': match.group('suffix') or ''}
+
+def parse_folder(folder):
+    """
+    Guesses the condition from a folder name such as
+    '05.28.2019_6h_3-3new_ni110_120': date, annealing time t (hour) and initial
+    film thickness h (nm, the number at the end). Values that are not found
+    are None; they can be set with set_condition.
+    """
+    name = os.path.basename(os.path.normpath(folder))
+    date = DATE_PATTERN.search(name)
+    t = TIME_PATTERN.search(name)
+    h = THICKNESS_PATTERN.search(name)
+    return {'date': None if date is None else date.group(1),\
+            't': None if t is None else float(t.group(1)),\
+            'h': None if h is None else float(h.group(1))}
+
+def _sha1(path, chunk_size=1<<20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def scan(db_path, folders, extension='.tif', hash_files=True):
+    """
+    Parameters
+    ----------
+    db_path : str
+        Path of the SQLite index.
+    folders : str or list
+        Experiment folder(s). Sub-folders are scanned too.
+    extension : str, optional
+        Extension of the image files. The default is '.tif'.
+    hash_files : bool, optional
+        If True, the SHA-1 of every new or modified file is recorded. The
+        default is True.
+
+    Returns
+    -------
+    Dictionary with the number of 'added', 'updated', 'unchanged' and
+    'removed' files. A file whose size and modification time did not change
+    since the last scan is not read again, so rescanning is cheap.
+
+    """
+    if isinstance(folders, str):
+        folders = [folders]
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+    con = connect(db_path)
+    with con:
+        for top in folders:
+            for dirpath, dirnames, filenames in os.walk(top):
+                images = [f for f in filenames if f.endswith(extension)]
+                if len(images) == 0:
+                    continue
+                path = os.path.abspath(dirpath)
+                con.execute('INSERT OR IGNORE INTO folders (path, date, h, t) VALUES (?, ?, ?, ?)',\
+                            (path,) + tuple(parse_folder(path)[k] for k in ('date', 'h', 't')))
+                con.execute('UPDATE folders SET scanned = ? WHERE path = ?',\
+                            (str(datetime.datetime.now()), path))
+                folder_id = con.execute('SELECT id FROM folders WHERE path = ?', (path,)).fetchone()[0]
+                known = {name: (file_id, mtime_ns, size) for file_id, name, mtime_ns, size in\
+                         con.execute('SELECT id, name, mtime_ns, size FROM files WHERE folder_id = ?',\
+                                     (folder_id,))}
+                for filename in images:
+                    name = filename[:-len(extension)]
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    old = known.pop(name, None)
+                    if old is not None and old[1] == stat.st_mtime_ns and old[2] == stat.st_size:
+                        counts['unchanged'] += 1
+                        continue
+                    parsed = parse_name(name) or {'base_name': None, 'number': None,\
+                                                  'zeropad': None, 'angle': None, 'suffix': ''}
+                    sha1 = _sha1(os.path.join(dirpath, filename)) if hash_files == True else None
+                    values = (parsed['base_name'], parsed['number'], parsed['zeropad'],\
+                              parsed['angle'], parsed['suffix'], stat.st_mtime_ns, stat.st_size, sha1)
+                    if old is None:
+                        con.execute('INSERT INTO files (folder_id, name, base_name, number, zeropad, '
+                                    'angle, suffix, mtime_ns, size, sha1) VALUES (?,?,?,?,?,?,?,?,?,?)',\
+                                    (folder_id, name) + values)
+                        counts['added'] += 1
+                    else:
+                        con.execute('UPDATE files SET base_name=?, number=?, zeropad=?, angle=?, '
+                                    'suffix=?, mtime_ns=?, size=?, sha1=? WHERE id=?', values + (old[0],))
+                        counts['updated'] += 1
+                # files deleted since the last scan
+                for name, (file_id, mtime_ns, size) in known.items():
+                    con.execute('DELETE FROM pixel_sizes WHERE file_id = ?', (file_id,))
+                    con.execute('DELETE FROM files WHERE id = ?', (file_id,))
+                    counts['removed'] += 1
+    con.close()
+    return counts
+
+def set_condition(db_path, folder, h=None, alpha=None, t=None, l=None):
+    """
+    Sets the experimental condition of a scanned folder (the values that are
+    None are left as they are).
+    """
+    con = connect(db_path)
+    with con:
+        for column, value in (('h', h), ('alpha', alpha), ('t', t), ('l', l)):
+            if value is not None:
+                con.execute('UPDATE folders SET {} = ? WHERE path = ?'.format(column),\
+                            (value, os.path.abspath(folder)))
+    con.close()
+    return None
+
+def select_images(db_path, annotations=(), folder=None, base_name=None, angle=None,\
+                  numbers=None, exclude_numbers=None, **condition):
+    """
+    Parameters
+    ----------
+    db_path : str
+        Path of the SQLite index.
+    annotations : tuple, optional
+        Suffixes of annotated images that must exist, e.g. ('_line_1', '_line_2').
+    folder, base_name, angle : optional
+        Restrict the selection to a folder, a base name (e.g. '33deg_') or an angle.
+    numbers : list, optional
+        Image numbers to select. The default is all.
+    exclude_numbers : list, optional
+        Image numbers to leave out.
+    **condition :
+        Condition of the folder, e.g. h=120, t=6.
+
+    Returns
+    -------
+    pandas data frame with one row per selected image: folder, name,
+    base_name, number, zeropad, angle and the condition of the folder, sorted
+    by folder and number. Group it by folder and base name to get the
+    arguments of the batch functions, e.g.
+        for (folder, base), df in images.groupby(['folder', 'base_name']):
+            fa.batch.batch_get_a_b_p(base, df.number.tolist(), ...)
+
+    """
+    query = ('SELECT d.path AS folder, f.name, f.base_name, f.number, f.zeropad, f.angle, '
+             'd.date, d.h, d.alpha, d.t, d.l FROM files f JOIN folders d ON f.folder_id = d.id '
+             "WHERE f.suffix = '' AND f.number IS NOT NULL")
+    args = []
+    for suffix in annotations:
+        query += (' AND EXISTS (SELECT 1 FROM files a WHERE a.folder_id = f.folder_id '
+                  'AND a.base_name = f.base_name AND a.number = f.number AND a.suffix = ?)')
+        args.append(suffix)
+    for column, value in (('d.path', None if folder is None else os.path.abspath(folder)),\
+                          ('f.base_name', base_name), ('f.angle', angle)):
+        if value is not None:
+            query += ' AND {} = ?'.format(column)
+            args.append(value)
+    for column, value in condition.items():
+        if column not in ('h', 'alpha', 't', 'l', 'date'):
+            raise ValueError('unknown condition {}'.format(column))
+        query += ' AND d.{} = ?'.format(column)
+        args.append(value)
+    if numbers is not None:
+        query += ' AND f.number IN ({})'.format(','.join('?'*len(numbers)))
+        args += [int(n) for n in numbers]
+    if exclude_numbers is not None:
+        query += ' AND f.number NOT IN ({})'.format(','.join('?'*len(exclude_numbers)))
+        args += [int(n) for n in exclude_numbers]
+    query += ' ORDER BY d.path, f.base_name, f.number'
+    con = connect(db_path)
+    df = pd.read_sql_query(query, con, params=args)
+    con.close()
+    return df
+
+def cached_pixel_size(db_path, filename, method='get_pixel_size', **kwargs):
+    """
+    Returns the pixel size of the image filename (path without extension), read
+    from the index if it was computed for the same file content before, and
+    otherwise computed and cached. method is 'get_pixel_size' (returns
+    (pixel size, prefix) as 'scale.get_pixel_size'), 'extract_pixel_size'
+    (returns the pixel size as 'scale.extract_pixel_size', with kwargs passed
+    to it) or 'extract_pixel_size_auto' (the same with 'scale.extract_pixel_size_auto').
+    The image must have been scanned.
+    """
+    path = os.path.abspath(filename)
+    folder, name = os.path.split(path)
+    con = connect(db_path)
+    row = con.execute('SELECT f.id, f.sha1, f.mtime_ns, f.size FROM files f JOIN folders d '
+                      'ON f.folder_id = d.id WHERE d.path = ? AND f.name = ?', (folder, name)).fetchone()
+    if row is None:
+        con.close()
+        raise ValueError('{} is not in the index {}, scan its folder first'.format(filename, db_path))
+    file_id, sha1, mtime_ns, size = row
+    if len(kwargs) > 0: # results with other arguments are cached separately
+        method_key = '{}{}'.format(method, sorted(kwargs.items()))
+    else:
+        method_key = method
+    stat = os.stat(path + '.tif')
+    if sha1 is None or stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+        # not hashed or modified since the scan
+        sha1 = _sha1(path + '.tif')
+    cached = con.execute('SELECT pixel_size, prefix FROM pixel_sizes WHERE file_id = ? AND '
+                         'method = ? AND sha1 = ?', (file_id, method_key, sha1)).fetchone()
+    if cached is None:
+        if method == 'get_pixel_size':
+            cached = fa.scale.get_pixel_size(filename, **kwargs)
+        elif method == 'extract_pixel_size':
+            cached = (fa.scale.extract_pixel_size(filename, **kwargs)[2], None)
+        elif method == 'extract_pixel_size_auto':
+            cached = (fa.scale.extract_pixel_size_auto(filename, **kwargs)[2], None)
+        else:
+            con.close()
+            raise ValueError("method must be 'get_pixel_size', 'extract_pixel_size' or "
+                             "'extract_pixel_size_auto'")
+        with con:
+            con.execute('INSERT OR REPLACE INTO pixel_sizes (file_id, method, sha1, pixel_size, '
+                        'prefix) VALUES (?, ?, ?, ?, ?)', (file_id, method_key, sha1) + tuple(cached))
+    con.close()
+    if method == 'get_pixel_size':
+        return (cached[0], cached[1])
+    return cached[0]
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 17:12:30 2026
+
+@author: yoonahshin
+"""
+import os
+import json
+import socket
+import datetime
+import threading
+import traceback
+import pandas as pd
+
+# Arguments of the batch functions that do not change the results, and so may
+# differ between a run and its resumption
+RUN_OPTIONS = ('img_num_list', 'show_image', 'save_image', 'save_df_indiv', 'show_overlay',\
+               'show_img', 'show_edge', 'show_scale_bar', 'save_df', 'store_dir',\
+               'prefetch', 'n_workers', 'n_stage_threads', 'memory_budget',\
+               'checkpoint_dir', 'resume',\
+               'catalog', 'profile_numbers', 'show_fig', 'save_fig')
+
+class Checkpoint:
+    """
+    Checkpoint of a batch run in the directory checkpoint_dir: the result of
+    every finished image is saved as a pickle file as soon as it is computed,
+    and manifest.json records the function, its arguments and the status of
+    every image ('done' or 'failed', with the error and its traceback).
+    """
+    def __init__(self, checkpoint_dir, function, params, resume=False):
+        self.directory = checkpoint_dir
+        self.path = os.path.join(checkpoint_dir, 'manifest.json')
+        self._lock = threading.Lock()
+        params = {key: value for key, value in params.items() if key not in RUN_OPTIONS}
+        params = json.loads(json.dumps(params, default=str))
+        if not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+        manifest = None
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                manifest = json.load(f)
+        if resume == True and manifest is not None:
+            if manifest['function'] != function or manifest['params'] != params:
+                changed = sorted(key for key in set(params) | set(manifest['params'])\
+                                 if params.get(key) != manifest['params'].get(key))
+                raise ValueError('The checkpoint in {} is of a run of {} with different '
+                                 'arguments ({}); use resume=False to start over'\
+                                 .format(checkpoint_dir, manifest['function'],\
+                                         ', '.join(changed) if len(changed) > 0 else 'function'))
+            self.manifest = manifest
+        else:
+            if manifest is not None:
+                # starting over: remove the results of the previous run
+                for name, entry in manifest['images'].items():
+                    if entry.get('file') is not None and\
+                       os.path.isfile(os.path.join(checkpoint_dir, entry['file'])):
+                        os.remove(os.path.join(checkpoint_dir, entry['file']))
+            self.manifest = {'function': function, 'params': params,\
+                             'created': str(datetime.datetime.now()), 'images': {}}
+        self.manifest['host'] = socket.gethostname()
+        self._save_manifest()
+
+    def _save_manifest(self):
+        # write to a temporary file first, so that an interrupted run never
+        # leaves a truncated manifest
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def is_done(self, name):
+        entry = self.manifest['images'].get(name)
+        return entry is not None and entry['status'] == 'done'
+
+    def save(self, name, result):
+        """
+        Saves the result of the image name (e.g. a data frame or a tuple of
+        data frames) and marks the image as done.
+        """
+        filename = '{}.pkl'.format(name.replace(os.sep, '__'))
+        tmp_path = os.path.join(self.directory, filename + '.tmp')
+        pd.to_pickle(result, tmp_path)
+        os.replace(tmp_path, os.path.join(self.directory, filename))
+        with self._lock:
+            attempts = self.manifest['images'].get(name, {}).get('attempts', 0)
+            self.manifest['images'][name] = {'status': 'done', 'file': filename,\
+                                             'attempts': attempts + 1,\
+                                             'time': str(datetime.datetime.now())}
+            self._save_manifest()
+        return None
+
+    def record_failure(self, name, error):
+        """
+        Marks the image name as failed with the exception error.
+        """
+        with self._lock:
+            attempts = self.manifest['images'].get(name, {}).get('attempts', 0)
+            self.manifest['images'][name] = {'status': 'failed', 'file': None,\
+                                             'attempts': attempts + 1,\
+                                             'time': str(datetime.datetime.now()),\
+                                             'error': type(error).__name__,\
+                                             'message': str(error),\
+                                             'traceback': ''.join(traceback.format_exception(\
+                                                 type(error), error, error.__traceback__))}
+            self._save_manifest()
+        return None
+
+    def load(self, name):
+        """
+        Returns the saved result of the image name.
+        """
+        return pd.read_pickle(os.path.join(self.directory, self.manifest['images'][name]['file']))
+
+    def failed(self, names=None):
+        """
+        Returns the list of failed images (among names, if given).
+        """
+        if names is None:
+            names = list(self.manifest['images'])
+        return [name for name in names if name in self.manifest['images']\
+                and self.manifest['images'][name]['status'] == 'failed']
+
+def error_report(checkpoint_dir):
+    """
+    Returns a pandas data frame with one row per image of the checkpointed run
+    in checkpoint_dir: status, number of attempts, time of the last attempt,
+    and for the failed images the exception, its message and its traceback.
+    """
+    with open(os.path.join(checkpoint_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    df = pd.DataFrame.from_dict(manifest['images'], orient='index',\
+                                columns=['status', 'attempts', 'time', 'error',\
+                                         'message', 'traceback'])
+    df.index.name = 'image'
+    return df
+
+def invalidate(checkpoint_dir, names):
+    """
+    Forgets the results of the images names in the checkpoint in
+    checkpoint_dir (e.g. because their files changed), so that they are
+    computed again when the run is resumed.
+    """
+    path = os.path.join(checkpoint_dir, 'manifest.json')
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    for name in names:
+        entry = manifest['images'].pop(name, None)
+        if entry is not None and entry.get('file') is not None and\
+           os.path.isfile(os.path.join(checkpoint_dir, entry['file'])):
+            os.remove(os.path.join(checkpoint_dir, entry['file']))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+    return None
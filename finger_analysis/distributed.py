@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:05:41 2026
+
+@author: yoonahshin
+
+Distributed batch runs over a shared file system (e.g. an NFS mount of the
+cluster nodes), without a job broker. A coordinator submits jobs (one batch
+function on one condition folder) to a queue directory; workers on any node
+claim the tasks (one image, or one AFM profile, each) with lock files, run
+them, and commit their results atomically; the merge step then returns, and
+saves, exactly what the batch function run on the whole folder would.
+
+    jobs = [fa.distributed.submit(queue, 'batch_get_a_b_p', folder, [28, 29, 34],
+                                  base_name='33deg_', suffix='_line2', h=h, alph=alph, t=6)
+            for folder, h, alph in conditions]
+    # on every node:  python -m finger_analysis.distributed worker QUEUE
+    results = fa.distributed.merge_all(queue)
+
+Queue directory layout:
+    jobs/<job>.json               function, folder, items and arguments of a job
+    claims/<job>/<item>.lock      claim of a task by a worker (created with
+                                  O_EXCL; touched while the worker runs it)
+    results/<job>/<item>/         checkpoint of the task (see checkpoint.py),
+                                  renamed into place when complete
+    results/<job>/merged/         checkpoint of the whole job, used by merge
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import hashlib
+import inspect
+import argparse
+import datetime
+import threading
+import multiprocessing
+import pandas as pd
+import finger_analysis as fa
+
+# Functions that can be run by the workers -> (module, name of the argument
+# listing the items, i.e. the tasks, of a job, names of the arguments giving
+# files or folders relative to the folder of the job)
+FUNCTIONS = {'batch_get_a_b_p': ('batch', 'img_num_list',\
+                                 ('base_name', 'dir_name_a', 'dir_name_b', 'dir_name_p')),
+             'batch_get_propagation_distance': ('batch', 'img_num_list',\
+                                                ('base_name', 'dir_name')),
+             'batch_new_method_propagation_distance': ('batch', 'img_num_list',\
+                                                       ('base_name', 'dir_name')),
+             'batch_get_propagation_direction': ('batch', 'img_num_list',\
+                                                 ('base_name', 'dir_name')),
+             'save_figures_and_results': ('afm_analysis', 'profile_numbers', ('directory',))}
+
+# Arguments writing the results of the whole job, which are only used by merge
+MERGE_OPTIONS = ('save_df', 'store_dir')
+
+def _function(name):
+    module, items_arg = FUNCTIONS[name][:2]
+    return getattr(getattr(fa, module), name), items_arg
+
+def _run_kwargs(spec):
+    # arguments of the function of the job, with the paths of its files in
+    # the folder of the job, so that the working directory is not changed
+    func = _function(spec['function'])[0]
+    parameters = inspect.signature(inspect.unwrap(func)).parameters
+    kwargs = dict(spec['kwargs'])
+    for arg in FUNCTIONS[spec['function']][2]:
+        if arg in kwargs or parameters[arg].default is not inspect.Parameter.empty:
+            kwargs[arg] = os.path.join(spec['directory'], kwargs.get(arg, parameters[arg].default))
+    return kwargs
+
+def _write_json(path, data):
+    tmp_path = '{}.tmp-{}'.format(path, _worker_id())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+def _worker_id():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+def _now(queue_dir):
+    # time of the file server, so that the leases do not depend on the clocks
+    # of the nodes agreeing
+    path = os.path.join(queue_dir, 'claims', '.clock-{}'.format(_worker_id()))
+    with open(path, 'w'):
+        pass
+    now = os.stat(path).st_mtime
+    os.remove(path)
+    return now
+
+def submit(queue_dir, function, directory, items, job=None, **kwargs):
+    """
+    Parameters
+    ----------
+    queue_dir : str
+        Queue directory, on a file system shared by the workers.
+    function : str
+        Name of the function, one of FUNCTIONS (e.g. 'batch_get_a_b_p').
+    directory : str
+        Folder of the images (or AFM profiles) of the condition; the file
+        names are relative to it, as are the excel files written by merge.
+    items : list
+        Image numbers (img_num_list), or profile numbers for
+        'save_figures_and_results'. Every item is one task.
+    job : str, optional
+        Name of the job. The default is the name of the folder, the function
+        and a hash of the arguments, so that submitting the same job again
+        does nothing.
+    **kwargs :
+        Other arguments of the function, e.g. base_name='33deg_', h=120,
+        alph=33, t=6, l='2_p1', save_df=True.
+
+    Returns
+    -------
+    Name of the job.
+
+    """
+    func, items_arg = _function(function)
+    directory = os.path.abspath(directory)
+    items = [int(item) for item in items]
+    spec = {'function': function, 'directory': directory, 'items': items,\
+            'kwargs': json.loads(json.dumps(kwargs, default=str))}
+    if job is None:
+        digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:8]
+        job = '{}_{}_{}'.format(os.path.basename(directory), function, digest)
+    spec['submitted'] = str(datetime.datetime.now())
+    for sub in ('jobs', 'claims', 'results'):
+        os.makedirs(os.path.join(queue_dir, sub, '' if sub == 'jobs' else job), exist_ok=True)
+    path = os.path.join(queue_dir, 'jobs', job + '.json')
+    if not os.path.isfile(path):
+        _write_json(path, spec)
+    return job
+
+def submit_conditions(queue_dir, function, conditions, **kwargs):
+    """
+    Submits one job per experimental condition. conditions is a list of
+    dictionaries with the 'directory' and the 'items' of the condition and
+    its own arguments, e.g. {'directory': '05.28.2019_6h_3-3new_ni110_120',
+    'items': [28, 29, 34], 'h': 120, 'alph': 33, 't': 6, 'l': '3-3'}; kwargs
+    are the arguments shared by all conditions. The workers take the tasks
+    of all the jobs in turn, so that all the conditions progress together.
+    Returns the list of the names of the jobs.
+    """
+    jobs = []
+    for condition in conditions:
+        condition = dict(condition)
+        directory = condition.pop('directory')
+        items = condition.pop('items')
+        job = condition.pop('job', None)
+        jobs.append(submit(queue_dir, function, directory, items, job, **dict(kwargs, **condition)))
+    return jobs
+
+def _jobs(queue_dir):
+    directory = os.path.join(queue_dir, 'jobs')
+    if not os.path.isdir(directory):
+        return {}
+    jobs = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename)) as f:
+                jobs[filename[:-len('.json')]] = json.load(f)
+    return jobs
+
+def _result_dir(queue_dir, job, item):
+    return os.path.join(queue_dir, 'results', job, str(item))
+
+def _claim_path(queue_dir, job, item):
+    return os.path.join(queue_dir, 'claims', job, '{}.lock'.format(item))
+
+def _pending(queue_dir, jobs):
+    # tasks without a committed result, taken from all the jobs in turn
+    tasks = []
+    for job, spec in jobs.items():
+        tasks.append([(job, item) for item in spec['items']\
+                      if not os.path.isdir(_result_dir(queue_dir, job, item))])
+    longest = max([len(job_tasks) for job_tasks in tasks], default=0)
+    return [job_tasks[i] for i in range(longest) for job_tasks in tasks if i < len(job_tasks)]
+
+def _holds(path):
+    # whether the lock file names this worker (a broken claim may have been
+    # taken over by another worker)
+    try:
+        with open(path) as f:
+            return json.load(f).get('worker') == _worker_id()
+    except (OSError, ValueError):
+        return False
+
+def _release(path):
+    if _holds(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _claim(queue_dir, job, item, lease):
+    """
+    Claims the task by creating its lock file, which fails if another worker
+    holds it. A claim not touched for lease seconds (its worker died) is
+    broken; if two workers break it at the same time, the one whose lock file
+    is removed by the other gives the task up, and if two workers still run
+    the same task, the first result to be committed is kept. A worker only
+    removes a lock file that names it.
+    """
+    path = _claim_path(queue_dir, job, item)
+    for attempt in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                stale = _now(queue_dir) - os.stat(path).st_mtime > lease
+            except FileNotFoundError:
+                continue # released meanwhile
+            if not stale or attempt > 0:
+                return False
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'worker': _worker_id(), 'claimed': str(datetime.datetime.now())}, f)
+        if not _holds(path):
+            return False
+        # the result may have been committed between listing and claiming
+        if os.path.isdir(_result_dir(queue_dir, job, item)):
+            _release(path)
+            return False
+        return True
+    return False
+
+def _heartbeat(path, interval, stop):
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except OSError:
+            return
+
+def run_task(queue_dir, job, item, spec=None):
+    """
+    Runs the task (job, item) and commits its checkpoint: the function is
+    run on the single item with a checkpoint in a temporary directory, which
+    is renamed to results/<job>/<item> when complete. A task that fails is
+    committed too, with its error (see checkpoint.error_report). Returns
+    True if the task succeeded.
+    """
+    if spec is None:
+        spec = _jobs(queue_dir)[job]
+    func, items_arg = _function(spec['function'])
+    final = _result_dir(queue_dir, job, item)
+    tmp = '{}.tmp-{}'.format(final, _worker_id())
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    succeeded = True
+    try:
+        kwargs = _run_kwargs(spec)
+        for arg in MERGE_OPTIONS:
+            kwargs.pop(arg, None)
+        kwargs[items_arg] = [item]
+        func(checkpoint_dir=os.path.abspath(tmp), resume=False, **kwargs)
+    except Exception as e:
+        succeeded = False
+        if not os.path.isfile(os.path.join(tmp, 'manifest.json')):
+            # failed before the checkpoint was opened, e.g. a wrong argument
+            checkpoint = fa.checkpoint.Checkpoint(tmp, spec['function'], {})
+            checkpoint.record_failure(str(item), e)
+    try:
+        os.rename(tmp, final)
+    except OSError:
+        # committed by another worker that broke a stale claim
+        shutil.rmtree(tmp, ignore_errors=True)
+    return succeeded
+
+def run_worker(queue_dir, max_tasks=None, lease=600, wait=0, poll=10):
+    """
+    Parameters
+    ----------
+    queue_dir : str
+        Queue directory.
+    max_tasks : int, optional
+        Maximum number of tasks to run. The default is None (no limit).
+    lease : float, optional
+        Claims not touched for lease seconds are considered abandoned (the
+        worker touches its claim every lease/4 seconds). The default is 600.
+    wait : float, optional
+        When no task is left, new jobs are waited for during wait seconds,
+        checking every poll seconds. The default is 0, i.e. the worker
+        returns as soon as the queue is empty.
+
+    Returns
+    -------
+    Dictionary with the numbers of tasks 'done' and 'failed' by this worker.
+
+    """
+    counts = {'done': 0, 'failed': 0}
+    idle_since = time.time()
+    while max_tasks is None or counts['done'] + counts['failed'] < max_tasks:
+        jobs = _jobs(queue_dir)
+        claimed = None
+        for job, item in _pending(queue_dir, jobs):
+            if _claim(queue_dir, job, item, lease):
+                claimed = (job, item)
+                break
+        if claimed is None:
+            if time.time() - idle_since >= wait:
+                break
+            time.sleep(poll)
+            continue
+        job, item = claimed
+        path = _claim_path(queue_dir, job, item)
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(path, lease/4, stop), daemon=True)
+        heartbeat.start()
+        try:
+            succeeded = run_task(queue_dir, job, item, jobs[job])
+        finally:
+            stop.set()
+            heartbeat.join()
+            _release(path)
+        counts['done' if succeeded == True else 'failed'] += 1
+        idle_since = time.time()
+    return counts
+
+def _worker_process(queue_dir, kwargs, counts):
+    import matplotlib
+    matplotlib.use('Agg')
+    result = run_worker(queue_dir, **kwargs)
+    counts.put(result)
+
+def run_local_workers(queue_dir, n_processes=2, **kwargs):
+    """
+    Runs n_processes worker processes on this machine until the queue is
+    empty (e.g. to test a queue before starting workers on the cluster
+    nodes). kwargs are passed to run_worker. Returns the list of the counts
+    of the workers.
+    """
+    context = multiprocessing.get_context('spawn')
+    counts = context.Queue()
+    processes = [context.Process(target=_worker_process, args=(queue_dir, kwargs, counts))\
+                 for i in range(n_processes)]
+    for process in processes:
+        process.start()
+    results = [counts.get() for process in processes]
+    for process in processes:
+        process.join()
+    return results
+
+def _task_manifest(queue_dir, job, item):
+    path = os.path.join(_result_dir(queue_dir, job, item), 'manifest.json')
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _task_failed(manifest):
+    return len(manifest['images']) == 0 or\
+        any(entry['status'] != 'done' for entry in manifest['images'].values())
+
+def status(queue_dir):
+    """
+    Returns a pandas data frame with one row per job: function, folder and
+    the numbers of tasks done, failed, running (claimed) and pending.
+    """
+    rows = []
+    for job, spec in _jobs(queue_dir).items():
+        row = {'job': job, 'function': spec['function'], 'directory': spec['directory'],\
+               'tasks': len(spec['items']), 'done': 0, 'failed': 0, 'running': 0, 'pending': 0}
+        for item in spec['items']:
+            manifest = _task_manifest(queue_dir, job, item)
+            if manifest is not None:
+                row['failed' if _task_failed(manifest) else 'done'] += 1
+            elif os.path.isfile(_claim_path(queue_dir, job, item)):
+                row['running'] += 1
+            else:
+                row['pending'] += 1
+        rows.append(row)
+    return pd.DataFrame(rows, columns=['job', 'function', 'directory', 'tasks', 'done',\
+                                       'failed', 'running', 'pending']).set_index('job')
+
+def retry_failed(queue_dir, jobs=None):
+    """
+    Removes the results of the failed tasks (of the given jobs, or of all the
+    jobs), so that the workers run them again. Returns the number of tasks.
+    """
+    n = 0
+    for job, spec in _jobs(queue_dir).items():
+        if jobs is not None and job not in jobs:
+            continue
+        for item in spec['items']:
+            manifest = _task_manifest(queue_dir, job, item)
+            if manifest is not None and _task_failed(manifest):
+                shutil.rmtree(_result_dir(queue_dir, job, item))
+                n += 1
+    return n
+
+def merge(queue_dir, job):
+    """
+    Returns the results of the job once all its tasks are done: the results
+    of the tasks are gathered into one checkpoint, and the function is run on
+    all the items with resume=True, so that it only concatenates them (and
+    writes the excel files and the result store if save_df or store_dir were
+    given), exactly as a run on the whole folder would.
+    """
+    spec = _jobs(queue_dir)[job]
+    func, items_arg = _function(spec['function'])
+    merged = os.path.join(queue_dir, 'results', job, 'merged')
+    manifests = {item: _task_manifest(queue_dir, job, item) for item in spec['items']}
+    missing = [str(item) for item, manifest in manifests.items() if manifest is None]
+    if len(missing) > 0:
+        raise RuntimeError('{} of {} tasks of {} are not done yet: {}'\
+                           .format(len(missing), len(manifests), job, ', '.join(missing)))
+    failed = {item: manifest for item, manifest in manifests.items() if _task_failed(manifest)}
+    if len(failed) > 0:
+        errors = ['{} ({})'.format(item, '; '.join('{}: {}'.format(entry.get('error'),\
+                                                                  entry.get('message'))\
+                                                   for entry in manifest['images'].values()))\
+                  for item, manifest in failed.items()]
+        raise RuntimeError('{} of {} tasks of {} failed: {}. See fa.distributed.status() and '
+                           'fa.distributed.retry_failed().'.format(len(failed), len(manifests),\
+                                                                   job, ', '.join(errors)))
+    first = manifests[spec['items'][0]]
+    checkpoint = fa.checkpoint.Checkpoint(merged, first['function'], first['params'])
+    for item, manifest in manifests.items():
+        task = _result_dir(queue_dir, job, item)
+        for name, entry in manifest['images'].items():
+            checkpoint.save(name, pd.read_pickle(os.path.join(task, entry['file'])))
+    kwargs = _run_kwargs(spec)
+    kwargs[items_arg] = spec['items']
+    return func(checkpoint_dir=os.path.abspath(merged), resume=True, **kwargs)
+
+def merge_all(queue_dir, jobs=None):
+    """
+    Returns a dictionary of job -> results of merge for all the jobs (or the
+    given jobs) of the queue.
+    """
+    if jobs is None:
+        jobs = list(_jobs(queue_dir))
+    return {job: merge(queue_dir, job) for job in jobs}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Worker and status of a finger_analysis '
+                                     'queue directory.')
+    parser.add_argument('command', choices=['worker', 'status', 'retry'])
+    parser.add_argument('queue_dir')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--max-tasks', type=int, default=None)
+    parser.add_argument('--lease', type=float, default=600)
+    parser.add_argument('--wait', type=float, default=0,\
+                        help='seconds to wait for new jobs once the queue is empty')
+    args = parser.parse_args(argv)
+    if args.command == 'worker':
+        kwargs = {'max_tasks': args.max_tasks, 'lease': args.lease, 'wait': args.wait}
+        if args.processes > 1:
+            counts = run_local_workers(args.queue_dir, args.processes, **kwargs)
+        else:
+            import matplotlib
+            matplotlib.use('Agg')
+            counts = [run_worker(args.queue_dir, **kwargs)]
+        print('{} tasks done, {} failed'.format(sum(c['done'] for c in counts),\
+                                                sum(c['failed'] for c in counts)))
+    elif args.command == 'status':
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(status(args.queue_dir).to_string())
+    else:
+        print('{} failed tasks will be run again'.format(retry_failed(args.queue_dir)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,13 +6,14 @@ Created on Mon Dec 27 08:44:35 2021
 @author: yoonahshin
 """
 import numpy as np
-import matplotlib.pyplot as plt
 import cv2
 from skimage import measure
 from skimage import color
 from skimage import feature
 import pandas as pd
+import finger_analysis as fa
 
+@fa.instrument.instrumented
 def get_edges_in_img(filename, data_bar_top=690):
     """
     Parameters
@@ -28,12 +29,15 @@ def get_edges_in_img(filename, data_bar_top=690):
     Processed image - edges in the oringinal image
 
     """
-    img = cv2.imread(filename+'.tif',0).copy()[:data_bar_top,:] # Read image in grayscale and crop the data bar area
+    with fa.instrument.stage('imread'):
+        img = fa.pipeline.imread(filename+'.tif',0)[:data_bar_top,:].copy() # Read image in grayscale and crop the data bar area
     blur = cv2.GaussianBlur(img,(7,7),0) # Apply Gaussian Filtering to denoise the image
     img_bin = cv2.threshold(blur,0,255,cv2.THRESH_BINARY+cv2.THRESH_OTSU)[1] # Get a binarized image
-    edges = feature.canny(img_bin) # Use the Canny filter to detect edges in the binarized image 
+    with fa.instrument.stage('canny'):
+        edges = feature.canny(img_bin) # Use the Canny filter to detect edges in the binarized image 
     return edges
 
+@fa.instrument.instrumented
 def get_line_drawn_in_img(filename, suffix, line_color='r', data_bar_top=690):
     """
     Parameters
@@ -56,14 +60,17 @@ def get_line_drawn_in_img(filename, suffix, line_color='r', data_bar_top=690):
 
     """
     if line_color == 'r':
-        img_red_line = cv2.imread(filename+suffix+'.tif').copy()[:data_bar_top,:,2] # Read image with a red line drawn
+        with fa.instrument.stage('imread'):
+            img_red_line = fa.pipeline.imread(filename+suffix+'.tif')[:data_bar_top,:,2].copy() # Read image with a red line drawn
         line = np.multiply(img_red_line==255, np.ones(img_red_line.shape)) # Image with only the red line
     elif line_color == 'k':
-        img_black_line = cv2.imread(filename+suffix+'.tif').copy()[:data_bar_top,:,:]
+        with fa.instrument.stage('imread'):
+            img_black_line = fa.pipeline.imread(filename+suffix+'.tif')[:data_bar_top,:,:].copy()
         line = np.multiply(img_black_line==[0,0,0], np.ones(img_black_line.shape)) # Image with only the black line
         line = line[:,:,2] # The channel of line can be one of amongst [:,:,0], [:,:,1] and [:,:,2]
     return line
 
+@fa.instrument.instrumented
 def get_coords_intersections(img_1, img_2, show_overlay=False):
     """
     Get regions where the two input images (i.e. ndarrays) cross, label the 
@@ -85,9 +92,11 @@ def get_coords_intersections(img_1, img_2, show_overlay=False):
     """
     intersections = np.multiply(img_1, img_2)
     column_labels = ['label','x', 'y']
-    label_image = measure.label(intersections)
+    with fa.instrument.stage('label'):
+        label_image = measure.label(intersections)
     image_label_overlay = color.label2rgb(label_image, image=intersections)
-    props = measure.regionprops(label_image)
+    with fa.instrument.stage('regionprops'):
+        props = measure.regionprops(label_image)
     # Initialize the data frame for storing the coordinates of intersections
     coords = np.zeros([len(props),len(column_labels)])
     i = 0
@@ -101,10 +110,12 @@ def get_coords_intersections(img_1, img_2, show_overlay=False):
     image_df = pd.DataFrame(coords, columns=column_labels)    
     sorted_df = image_df.sort_values('y').reset_index(drop=True) 
     if show_overlay==True:
+        import matplotlib.pyplot as plt
         plt.figure()
         plt.imshow(image_label_overlay)
     return sorted_df
 
+@fa.instrument.instrumented
 def get_wire_widths_along_line(sorted_df, pixel_size):
     """
     Calculates width of wires along the line. 
@@ -122,6 +133,7 @@ def get_wire_widths_along_line(sorted_df, pixel_size):
     a_along_line = pd.DataFrame(a_along_line, columns=['Wire width (\u03BCm)'])
     return a_along_line
 
+@fa.instrument.instrumented
 def get_finger_widths_along_line(sorted_df, pixel_size):
     """
     Calculates width of fingers along the line. 
@@ -139,6 +151,7 @@ def get_finger_widths_along_line(sorted_df, pixel_size):
     b_along_line = pd.DataFrame(b_along_line, columns=['Finger width (\u03BCm)'])
     return b_along_line
 
+@fa.instrument.instrumented
 def get_finger_periods_along_line(sorted_df, pixel_size):
     """
     Calculates period of fingers along the line. 
@@ -156,6 +169,7 @@ def get_finger_periods_along_line(sorted_df, pixel_size):
     p_along_line = pd.DataFrame(p_along_line, columns=['Finger period (\u03BCm)'])
     return p_along_line
 
+@fa.instrument.instrumented
 def propagation_distance_of_fingers(sorted_df_1, sorted_df_2, pixel_size):
     """
     Calculates propagation distances of fingers.
@@ -173,6 +187,7 @@ def propagation_distance_of_fingers(sorted_df_1, sorted_df_2, pixel_size):
     distance = pd.DataFrame(distance, columns=['Finger propagation distance (\u03BCm)'])
     return distance
 
+@fa.instrument.instrumented
 def new_method_propagation_distance_of_fingers(alpha, beta, sorted_df, pixel_size):
     """
     Calculates propagation distances of fingers based on a new method.
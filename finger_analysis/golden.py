@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:02:41 2026
+
+@author: yoonahshin
+
+Golden-output equivalence checks. The outputs of the batch functions and of
+scale.extract_pixel_size on the SEM images bundled in the repository are
+frozen once as CSV files, and any alternative implementation (e.g. a faster
+get_coords_intersections) registered with register_implementation is run
+against them. The batch cases take the pixel sizes from STATED_PIXEL_SIZES
+instead of reading them with OCR, so they run without Tesseract; only the
+extract_pixel_size case needs it. Run from the command line, for example:
+    python -m finger_analysis.golden --freeze
+    python -m finger_analysis.golden --implementations reference my_fast_edges
+"""
+import os
+import sys
+import json
+import time
+import datetime
+import argparse
+import importlib
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+# Folder of the golden files
+DEFAULT_GOLDEN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),\
+                                  'golden')
+
+# Pixel sizes stated in the data bars of the images of the batch cases
+# ('Image Pixel Size = 97.85 nm'), as scale.get_pixel_size returns them
+STATED_PIXEL_SIZES = {'33deg_028': (73.36, 'n'), '33deg_029': (97.85, 'n'),
+                      '33deg_034': (97.85, 'n'), '33deg_037': (97.85, 'n'),
+                      '33deg_040': (97.85, 'n')}
+
+def stated_pixel_size(filename, data_bar_min=690, data_bar_max=760):
+    """
+    Same as scale.get_pixel_size, but from STATED_PIXEL_SIZES instead of OCR
+    (filename may be a path).
+    """
+    return STATED_PIXEL_SIZES[os.path.basename(filename)]
+
+def _case_batch_get_a_b_p():
+    p = fa.benchmark.DEFAULT_PARAMS
+    a, b, pe = fa.batch.batch_get_a_b_p(p['base_name'], fa.benchmark.DEFAULT_IMG_NUM_LIST,\
+                                        threshold_beta=p['threshold_beta'],\
+                                        minLineLength_beta=p['minLineLength_beta'],\
+                                        maxLineGap_beta=p['maxLineGap_beta'],\
+                                        ori_l=p['ori_l'], ori_u=p['ori_u'],\
+                                        suffix=p['suffix_a_b_p'])
+    return {'wire_width': a, 'finger_width': b, 'finger_period': pe}
+
+def _case_batch_get_propagation_distance():
+    p = fa.benchmark.DEFAULT_PARAMS
+    d = fa.batch.batch_get_propagation_distance(p['base_name'], fa.benchmark.DEFAULT_IMG_NUM_LIST,\
+                                                suffix_1=p['suffix_1'], suffix_2=p['suffix_2'])
+    return {'propagation_distance': d}
+
+def _case_batch_new_method_propagation_distance():
+    # Only image 40 has the '_new_line_1' and '_new_line_2' annotations
+    p = fa.benchmark.DEFAULT_PARAMS
+    d = fa.batch.batch_new_method_propagation_distance(p['base_name'], [40],\
+                                                       suffix_1='_new_line_1',\
+                                                       suffix_2='_new_line_2',\
+                                                       threshold_beta=p['threshold_beta'],\
+                                                       minLineLength_beta=p['minLineLength_beta'],\
+                                                       maxLineGap_beta=p['maxLineGap_beta'],\
+                                                       ori_l=p['ori_l'], ori_u=p['ori_u'])
+    return {'propagation_distance': d}
+
+def _case_extract_pixel_size():
+    names = fa.batch.create_filename_list(fa.benchmark.DEFAULT_PARAMS['base_name'],\
+                                          fa.benchmark.DEFAULT_IMG_NUM_LIST)
+    rows = [fa.scale.extract_pixel_size(name) for name in names]
+    df = pd.DataFrame(rows, index=names, columns=['Number above the scale bar',\
+                                                  'Number of pixels in the scale bar',\
+                                                  'Pixel size'])
+    return {'pixel_size': df}
+
+# Name of case -> function returning a dictionary of output name -> data frame.
+# The functions are run with the data folder as working directory.
+CASES = {'batch_get_a_b_p': _case_batch_get_a_b_p,
+         'batch_get_propagation_distance': _case_batch_get_propagation_distance,
+         'batch_new_method_propagation_distance': _case_batch_new_method_propagation_distance,
+         'extract_pixel_size': _case_extract_pixel_size}
+
+# Replacements in place while a case runs, on top of those of the
+# implementation checked: the batch cases use the stated pixel sizes
+CASE_REPLACEMENTS = {'batch_get_a_b_p': {'scale.get_pixel_size': stated_pixel_size},
+                     'batch_get_propagation_distance': {'scale.get_pixel_size': stated_pixel_size},
+                     'batch_new_method_propagation_distance': {'scale.get_pixel_size': stated_pixel_size}}
+
+def _run_case(case):
+    with fa.util.replaced(CASE_REPLACEMENTS.get(case, {})):
+        return CASES[case]()
+
+# Name of implementation -> dictionary of 'module.function' -> replacement.
+# 'reference' is the code of the package as it is.
+IMPLEMENTATIONS = {'reference': {}}
+
+def register_implementation(name, replacements):
+    """
+    Registers an alternative implementation to be checked against the golden
+    files, e.g.
+        fa.golden.register_implementation('fast_intersections',
+            {'fingers.get_coords_intersections': my_get_coords_intersections})
+    The replacements are swapped into the submodules of the package while the
+    cases run, so the batch functions call them instead of the originals. The
+    replacements must take the same arguments as the originals.
+    """
+    for target in replacements:
+        module, func = target.rsplit('.', 1)
+        if not hasattr(importlib.import_module('finger_analysis.' + module), func):
+            raise ValueError('finger_analysis.{} does not exist'.format(target))
+    IMPLEMENTATIONS[name] = dict(replacements)
+    return None
+
+def _golden_path(golden_dir, case, output):
+    return os.path.join(golden_dir, '{}__{}.csv'.format(case, output))
+
+def _to_frame(df):
+    # Index levels are stored as columns named after store.INDEX_COLUMNS
+    df = df.copy()
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    names = fa.store.INDEX_COLUMNS[:df.index.nlevels] if df.index.nlevels <= 2\
+        else ['level_{}'.format(i) for i in range(df.index.nlevels)]
+    df.index.names = names
+    return df.reset_index()
+
+def _read_golden(path, n_index):
+    df = pd.read_csv(path)
+    return df.set_index(list(df.columns[:n_index]))
+
+def freeze(golden_dir=None, cases=None, data_dir=None):
+    """
+    Runs the cases with the reference implementation and saves their outputs
+    as the golden files (one CSV file per output, written with full float
+    precision), together with manifest.json describing the run. A case that
+    cannot run (e.g. when Tesseract is not installed) is recorded as skipped in
+    the manifest, unless it was frozen before, in which case its golden files
+    are left untouched.
+    Returns the manifest.
+    """
+    if golden_dir is None:
+        golden_dir = DEFAULT_GOLDEN_DIR
+    if cases is None:
+        cases = list(CASES)
+    if data_dir is None:
+        data_dir = fa.benchmark.DEFAULT_DATA_DIR
+    golden_dir = os.path.abspath(golden_dir)
+    if not os.path.isdir(golden_dir):
+        os.makedirs(golden_dir)
+    manifest_path = os.path.join(golden_dir, 'manifest.json')
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    else:
+        manifest = {'cases': {}}
+    manifest.update({'commit': fa.util.git_commit(),\
+                     'date': str(datetime.datetime.now()),\
+                     'numpy': np.__version__, 'pandas': pd.__version__})
+    with fa.util.working_directory(data_dir):
+        for case in cases:
+            try:
+                outputs = _run_case(case)
+            except Exception as e:
+                if 'outputs' not in manifest['cases'].get(case, {}):
+                    manifest['cases'][case] = {'skipped': '{}: {}'.format(type(e).__name__, e)}
+                continue
+            entry = {}
+            for output, df in outputs.items():
+                frame = _to_frame(df)
+                frame.to_csv(_golden_path(golden_dir, case, output), index=False,\
+                             float_format='%.17g')
+                entry[output] = {'index_levels': df.index.nlevels, 'rows': len(df),\
+                                 'columns': [str(col) for col in frame.columns]}
+            manifest['cases'][case] = {'outputs': entry}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def _str_index(series):
+    # The index read from a CSV file may not have the dtype of the original
+    series = series.copy()
+    if isinstance(series.index, pd.MultiIndex):
+        series.index = series.index.set_levels([level.astype(str) for level in series.index.levels])
+    else:
+        series.index = series.index.astype(str)
+    return series
+
+def compare_outputs(golden, current, rtol=1e-6, atol=1e-9, tolerances=None):
+    """
+    Compares a data frame with its golden counterpart column by column (the
+    rows are matched on the index, e.g. image and measurement number).
+
+    Parameters
+    ----------
+    golden : pandas data frame
+        Frozen output.
+    current : pandas data frame
+        Output of the implementation being checked.
+    rtol : float, optional
+        Relative tolerance. The default is 1e-6.
+    atol : float, optional
+        Absolute tolerance. The default is 1e-9.
+    tolerances : dict, optional
+        Dictionary of column name to (rtol, atol), overriding the tolerances
+        above for that column.
+
+    Returns
+    -------
+    pandas data frame with one row per column (metric): number of rows in the
+    golden and current outputs, number of rows found in only one of them,
+    maximum absolute and relative deviations, number of values outside the
+    tolerance, and 'passed'. nan is equal to nan.
+
+    """
+    if tolerances is None:
+        tolerances = {}
+    rows = []
+    for col in golden.columns:
+        if col not in current.columns:
+            rows.append({'metric': col, 'golden rows': len(golden), 'current rows': 0,\
+                         'unmatched rows': len(golden), 'max abs deviation': np.nan,\
+                         'max rel deviation': np.nan, 'mismatches': len(golden),\
+                         'passed': False})
+            continue
+        g = _str_index(golden[col]).rename('golden')
+        c = _str_index(current[col]).rename('current')
+        joined = pd.concat([g, c], axis=1, join='outer')
+        unmatched = int(joined.isna().any(axis=1).sum()\
+                        - (joined.golden.isna() & joined.current.isna()).sum())
+        g_values = pd.to_numeric(joined.golden, errors='coerce').to_numpy(dtype=float)
+        c_values = pd.to_numeric(joined.current, errors='coerce').to_numpy(dtype=float)
+        col_rtol, col_atol = tolerances.get(col, (rtol, atol))
+        close = np.isclose(c_values, g_values, rtol=col_rtol, atol=col_atol, equal_nan=True)
+        both = ~np.isnan(g_values) & ~np.isnan(c_values)
+        abs_dev = np.abs(c_values[both] - g_values[both])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_dev = abs_dev/np.abs(g_values[both])
+        rel_dev = rel_dev[np.isfinite(rel_dev)]
+        rows.append({'metric': col, 'golden rows': len(golden), 'current rows': len(current),\
+                     'unmatched rows': unmatched,\
+                     'max abs deviation': abs_dev.max() if len(abs_dev) > 0 else 0.0,\
+                     'max rel deviation': rel_dev.max() if len(rel_dev) > 0 else 0.0,\
+                     'mismatches': int((~close).sum()),\
+                     'passed': bool(close.all())})
+    return pd.DataFrame(rows)
+
+def _time_case(case, repeat):
+    times = []
+    outputs = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        outputs = _run_case(case)
+        times.append(time.perf_counter() - start)
+    return outputs, float(np.median(times))
+
+def run_equivalence(implementations=None, cases=None, golden_dir=None, data_dir=None,\
+                    repeat=3, rtol=1e-6, atol=1e-9, tolerances=None):
+    """
+    Parameters
+    ----------
+    implementations : list, optional
+        Names of registered implementations to check (see IMPLEMENTATIONS).
+        The default is all of them.
+    cases : list, optional
+        Names of cases to run (see CASES). The default is all the cases.
+    golden_dir : str, optional
+        Folder of the golden files. The default is DEFAULT_GOLDEN_DIR.
+    data_dir : str, optional
+        Folder of the images. The default is the folder bundled in the repository.
+    repeat : int, optional
+        Number of timed runs of every case. The default is 3.
+    rtol, atol, tolerances : optional
+        Tolerances, see compare_outputs.
+
+    Returns
+    -------
+    pandas data frame with one row per implementation, case, output and
+    metric: the deviations from the golden output (see compare_outputs), the
+    median run time of the case, the median run time of the reference
+    implementation and the speedup (reference time / time). A case without
+    golden files is reported with passed = None and the reason in the
+    'skipped' column, and is not a failure. An implementation that cannot run
+    a case is reported with passed = False and its error in the 'error' column.
+
+    """
+    if implementations is None:
+        implementations = list(IMPLEMENTATIONS)
+    if cases is None:
+        cases = list(CASES)
+    if golden_dir is None:
+        golden_dir = DEFAULT_GOLDEN_DIR
+    if data_dir is None:
+        data_dir = fa.benchmark.DEFAULT_DATA_DIR
+    golden_dir = os.path.abspath(golden_dir)
+    manifest_path = os.path.join(golden_dir, 'manifest.json')
+    if not os.path.isfile(manifest_path):
+        raise FileNotFoundError('No golden files in {}, run freeze() first'.format(golden_dir))
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    reports = []
+    with fa.util.working_directory(data_dir):
+        for case in cases:
+            entry = manifest['cases'].get(case, {'skipped': 'not frozen'})
+            if 'skipped' in entry:
+                reports.append(pd.DataFrame([{'implementation': name, 'case': case,\
+                                              'passed': None,\
+                                              'skipped': 'no golden files ({})'.format(entry['skipped'])}\
+                                             for name in implementations]))
+                continue
+            # The reference is timed in the same session as the alternatives
+            try:
+                reference_time = _time_case(case, repeat)[1]
+            except Exception as e:
+                reference_time = np.nan
+            for name in implementations:
+                try:
+                    with fa.util.replaced(IMPLEMENTATIONS[name]):
+                        outputs, run_time = _time_case(case, repeat)
+                except Exception as e:
+                    reports.append(pd.DataFrame([{'implementation': name, 'case': case,\
+                                                  'passed': False,\
+                                                  'error': '{}: {}'.format(type(e).__name__, e)}]))
+                    continue
+                for output, info in entry['outputs'].items():
+                    golden = _read_golden(_golden_path(golden_dir, case, output),\
+                                          info['index_levels'])
+                    if output in outputs:
+                        current = _to_frame(outputs[output]).set_index(list(golden.index.names))
+                        report = compare_outputs(golden, current, rtol, atol, tolerances)
+                    else:
+                        report = pd.DataFrame([{'metric': None, 'passed': False}])
+                    report.insert(0, 'output', output)
+                    report.insert(0, 'case', case)
+                    report.insert(0, 'implementation', name)
+                    report['time (s)'] = run_time
+                    report['reference time (s)'] = reference_time
+                    report['speedup'] = reference_time/run_time
+                    reports.append(report)
+    columns = ['implementation', 'case', 'output', 'metric', 'golden rows', 'current rows',\
+               'unmatched rows', 'max abs deviation', 'max rel deviation', 'mismatches',\
+               'passed', 'time (s)', 'reference time (s)', 'speedup', 'error', 'skipped']
+    if len(reports) == 0:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(reports, ignore_index=True).reindex(columns=columns)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check implementations of '
+                                     'finger_analysis against the golden outputs.')
+    parser.add_argument('--freeze', action='store_true',\
+                        help='save the outputs of the reference implementation as the golden files')
+    parser.add_argument('--golden-dir', default=None)
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--cases', nargs='*', default=None, choices=list(CASES))
+    parser.add_argument('--implementations', nargs='*', default=None)
+    parser.add_argument('--plugin', nargs='*', default=[],\
+                        help='modules to import before the run, which register implementations')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--rtol', type=float, default=1e-6)
+    parser.add_argument('--atol', type=float, default=1e-9)
+    args = parser.parse_args(argv)
+    for plugin in args.plugin:
+        importlib.import_module(plugin)
+    if args.freeze == True:
+        manifest = freeze(args.golden_dir, args.cases, args.data_dir)
+        for case, entry in manifest['cases'].items():
+            print('{:40s} {}'.format(case, entry.get('skipped', 'frozen')))
+        return 0
+    report = run_equivalence(args.implementations, args.cases, args.golden_dir,\
+                             args.data_dir, args.repeat, args.rtol, args.atol)
+    skipped = report[report.skipped.notna()]
+    checked = report[report.skipped.isna()]
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(checked.drop(columns='skipped').to_string(index=False))
+    for case, reason in skipped.groupby('case', sort=False).skipped.first().items():
+        print('skipped {}: {}'.format(case, reason))
+    # the skipped cases are neither passed nor failed, but a run in which
+    # nothing was checked fails
+    if len(checked) == 0:
+        return 1
+    return 0 if (checked.passed == True).all() else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
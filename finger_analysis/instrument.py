@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:02:18 2026
+
+@author: yoonahshin
+"""
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+import contextvars
+import tracemalloc
+
+# Instrumentation is off by default. When it is off, an instrumented function
+# only checks the flag below before calling the original function, and stage()
+# returns a shared no-op context manager.
+_enabled = False
+_trace_memory = False
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+_current_image = contextvars.ContextVar('finger_analysis_image', default=None)
+_null_stage = contextlib.nullcontext()
+# tracemalloc counts the allocations of all the threads: every time a stage
+# starts or ends while other threads are running, the epoch is incremented,
+# and the stages spanning a change of epoch get no peak allocation
+_concurrency_epoch = 0
+_run_peak = 0 # peak traced allocation of the run, before the last reset_peak
+
+def enable(memory=True, reset=True):
+    """
+    Turns the instrumentation on. If memory is True, the peak allocation of
+    every stage is recorded with tracemalloc (this slows down the run, so use
+    memory=False for timing only). tracemalloc traces the allocations of the
+    whole process, so the peak of a stage is only recorded when no other
+    thread runs during the stage; with reader or stage threads (prefetch > 0,
+    n_workers or n_stage_threads > 1 in the batch functions) the peaks of the
+    stages are None, and only the peak of the whole run (run_peak) is valid.
+    If reset is True, the previous records are removed.
+    """
+    global _enabled, _trace_memory, _run_peak
+    if reset == True:
+        clear()
+    _trace_memory = memory
+    if memory == True:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        _run_peak = 0
+    _enabled = True
+    return None
+
+def disable():
+    """
+    Turns the instrumentation off. The records are kept until clear() or
+    enable(reset=True) is called.
+    """
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory == True and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+    return None
+
+def is_enabled():
+    return _enabled
+
+def run_peak():
+    """
+    Peak traced allocation (bytes) of the process since enable(), over all
+    the threads, or None if the memory is not traced.
+    """
+    if _trace_memory == False or not tracemalloc.is_tracing():
+        return None
+    return max(_run_peak, tracemalloc.get_traced_memory()[1])
+
+def _other_threads():
+    # True if other threads are running, in which case the traced
+    # allocations cannot be attributed to the stages of this thread
+    global _concurrency_epoch
+    if threading.active_count() > 1:
+        with _lock:
+            _concurrency_epoch += 1
+        return True
+    return False
+
+def clear():
+    """
+    Removes all the records.
+    """
+    with _lock:
+        del _records[:]
+    return None
+
+def set_image(name):
+    """
+    Sets the image that the following stages are attributed to (e.g. at the top
+    of each iteration of a batch loop). Functions taking a file name as their
+    first argument set it automatically for the stages they run.
+    """
+    if _enabled == False:
+        return None
+    _current_image.set(name)
+    return None
+
+@contextlib.contextmanager
+def image(name):
+    """
+    Context manager attributing all the stages run inside it to the image name.
+    """
+    token = _current_image.set(name)
+    try:
+        yield
+    finally:
+        _current_image.reset(token)
+
+class _Stage:
+    """
+    Context manager recording wall time, CPU time (of the calling thread) and
+    peak traced allocation of a stage. Stages can be nested; the peak of a
+    stage includes the peaks of the stages nested in it. The peak is None if
+    other threads ran during the stage (see enable).
+    """
+    def __init__(self, name, image_name=None):
+        self.name = name
+        self.image_name = image_name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if len(stack) > 0 else None
+        self.path = self.name if self.parent is None else self.parent.path + '/' + self.name
+        if self.image_name is None:
+            self.image_name = _current_image.get()
+        self.peak = 0
+        self.start_mem = 0
+        if _trace_memory == True and tracemalloc.is_tracing() and not _other_threads():
+            global _run_peak
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, peak - self.parent.start_mem)
+            _run_peak = max(_run_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_mem = current
+        self.epoch = _concurrency_epoch
+        stack.append(self)
+        self.start = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.thread_time() - self.start_cpu
+        _local.stack.pop()
+        peak = None
+        if _trace_memory == True and tracemalloc.is_tracing() and not _other_threads()\
+           and self.epoch == _concurrency_epoch:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1] - self.start_mem)
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak,\
+                                       self.start_mem - self.parent.start_mem + peak)
+        record = {'stage': self.name, 'path': self.path, 'image': self.image_name,\
+                  'start': self.start, 'wall_s': wall, 'cpu_s': cpu,\
+                  'peak_bytes': peak, 'thread': threading.current_thread().name,\
+                  'pid': os.getpid(), 'error': None if exc_type is None else exc_type.__name__}
+        with _lock:
+            _records.append(record)
+        return False
+
+def stage(name):
+    """
+    Context manager timing a stage inside a function, e.g.
+        with fa.instrument.stage('imread'):
+            img = cv2.imread(filename+'.tif')
+    Returns a no-op context manager when the instrumentation is off.
+    """
+    if _enabled == False:
+        return _null_stage
+    return _Stage(name)
+
+def instrumented(func):
+    """
+    Decorator recording every call of the function as a stage named
+    'module.function'. If the first parameter of the function is 'filename',
+    the stage and the stages nested in it are attributed to that image.
+    """
+    name = '{}.{}'.format(func.__module__.split('.')[-1], func.__name__)
+    code = func.__code__
+    takes_filename = code.co_argcount > 0 and code.co_varnames[0] == 'filename'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _enabled == False:
+            return func(*args, **kwargs)
+        if takes_filename == True:
+            image_name = args[0] if len(args) > 0 else kwargs.get('filename')
+        else:
+            image_name = _current_image.get()
+        # set_image() calls inside the function do not leak out of it
+        with image(image_name), _Stage(name, image_name):
+            return func(*args, **kwargs)
+    return wrapper
+
+def get_records():
+    """
+    Returns a copy of the list of records (one dict per stage call).
+    """
+    with _lock:
+        return list(_records)
+
+def summary_table(by='stage', quantiles=(0.5, 0.95)):
+    """
+    Returns a pandas data frame summarizing the records grouped by 'stage'
+    (e.g. all the 'imread' stages together), 'path' (stage with its parents)
+    or a list such as ['image', 'stage']: number of calls, total, p50 and p95
+    of the wall time and the CPU time (s), and p50 and p95 of the peak
+    allocation (MB), nan for the stages run with other threads (see enable).
+    """
+    import pandas as pd
+    df = pd.DataFrame(get_records(), columns=['stage', 'path', 'image', 'start',\
+                                              'wall_s', 'cpu_s', 'peak_bytes',\
+                                              'thread', 'pid', 'error'])
+    df['peak_MB'] = df.peak_bytes.astype(float)/1e6
+    grouped = df.groupby(by, sort=False, dropna=False)
+    summary = grouped.wall_s.agg(['count', 'sum']).rename(columns={'sum': 'total wall (s)'})
+    for col, label in [('wall_s', 'wall (s)'), ('cpu_s', 'cpu (s)'), ('peak_MB', 'peak (MB)')]:
+        for q in quantiles:
+            summary['p{:g} {}'.format(100*q, label)] = grouped[col].quantile(q)
+    return summary.sort_values('total wall (s)', ascending=False)
+
+def export_trace(path, by='stage'):
+    """
+    Saves the records, the summary table (see summary_table) and the peak
+    allocation of the run (see run_peak) as a JSON file.
+    """
+    summary = summary_table(by)
+    trace = {'records': get_records(),\
+             'summary': summary.reset_index().to_dict(orient='records'),\
+             'run_peak_bytes': run_peak()}
+    directory = os.path.dirname(path)
+    if directory != '' and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(trace, f, indent=1, default=str)
+    return None
@@ -6,71 +6,316 @@ Created on Mon Dec  9 13:21:22 2019
 @author: yoonahshin
 """
 
+import os
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 import finger_analysis as fa
 
-def detect_lines(filename, threshold, minLineLength, maxLineGap,\
-                 data_bar_top=690, show_image=False, save_image=False): 
+# Fields of a line set: label (number of the line in the order of detection),
+# end points, length (pixels) and angle (deg) w.r.t. the x-axis
+LINE_DTYPE = np.dtype([('label', np.int32), ('x1', np.int32), ('y1', np.int32),\
+                       ('x2', np.int32), ('y2', np.int32), ('length', np.float64),\
+                       ('angle', np.float64)])
+
+class LineSet:
     """
-    For a given SEM image, this function crops the data bar area and detects lines
-    in the image using probabilistic Hough Transform (PHT) function in OpenCV.
-    The PHT function returns endpoints of the detected lines (x1,y1,x2,y2).
-    The detected lines can be drawn on the image with labels. PHT is an optimization
-    of Hough Transform. It doesn't take all the points into consideration, but instead
-    takes only a random subset of points which is sufficient for line detection.    
+    Lines detected with cv2.HoughLinesP, as a structured array (see LINE_DTYPE)
+    in the attribute lines. The lengths and angles are computed for all the
+    lines at once; the angle of a line is in (-90, 90] as np.arctan of its
+    slope, so a vertical line is at 90 deg (and a line of length 0 at nan).
+    LineSet(None), for no line found, is an empty set.
     """
+    def __init__(self, lines=None):
+        if lines is None:
+            lines = np.zeros((0,4), dtype=np.int32)
+        endpoints = np.asarray(lines).reshape(-1,4)
+        self.lines = np.zeros(len(endpoints), dtype=LINE_DTYPE)
+        self.lines['label'] = np.arange(len(endpoints))
+        for i, field in enumerate(('x1', 'y1', 'x2', 'y2')):
+            self.lines[field] = endpoints[:,i]
+        dx = endpoints[:,2].astype(np.float64) - endpoints[:,0]
+        dy = endpoints[:,3].astype(np.float64) - endpoints[:,1]
+        self.lines['length'] = np.hypot(dx, dy)
+        angle = np.degrees(np.arctan2(dy, dx))
+        angle[angle > 90] -= 180
+        angle[angle <= -90] += 180
+        angle[self.lines['length'] == 0] = np.nan
+        self.lines['angle'] = angle
+
+    @classmethod
+    def _from_array(cls, lines):
+        line_set = cls.__new__(cls)
+        line_set.lines = lines
+        return line_set
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __repr__(self):
+        return 'LineSet({} lines)'.format(len(self))
+
+    @property
+    def angle(self):
+        return self.lines['angle']
+
+    @property
+    def length(self):
+        return self.lines['length']
+
+    @property
+    def endpoints(self):
+        """
+        End points (x1,y1,x2,y2) of the lines, shaped like the output of cv2.HoughLinesP.
+        """
+        fields = ['x1', 'y1', 'x2', 'y2']
+        return np.stack([self.lines[field] for field in fields], axis=1).reshape(-1,1,4)
+
+    def select(self, angle_min=None, angle_max=None, min_length=None):
+        """
+        Returns the set of the lines with angle_min < angle < angle_max (deg)
+        and length >= min_length (pixels); None means no bound.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            if angle_min is not None:
+                keep &= self.angle > angle_min
+            if angle_max is not None:
+                keep &= self.angle < angle_max
+            if min_length is not None:
+                keep &= self.length >= min_length
+        return LineSet._from_array(self.lines[keep])
+
+    def mean_angle(self, weighted=True):
+        """
+        Mean angle (deg) of the lines, weighted by their lengths if weighted
+        is True. nan for an empty set.
+        """
+        valid = ~np.isnan(self.angle)
+        if not valid.any():
+            return np.nan
+        weights = self.length[valid] if weighted == True else None
+        return float(np.average(self.angle[valid], weights=weights))
+
+    def to_frame(self, col_name):
+        """
+        Data frame of the angles of the lines with the column names col_name,
+        indexed by the labels of the lines.
+        """
+        return pd.DataFrame(self.angle.reshape(-1,1), columns=col_name,\
+                            index=self.lines['label'].astype(np.int64))
+
+    def draw(self, img, color=(0,255,0), text_color=(255,255,255)):
+        """
+        Draws the lines on img with their labels.
+        """
+        for line in self.lines:
+            cv2.line(img, (int(line['x1']),int(line['y1'])), (int(line['x2']),int(line['y2'])),\
+                     color, 2)
+            cv2.putText(img, text=str(line['label']), org=(int(line['x1']),int(line['y1'])),\
+                        fontFace=1, fontScale=2, color=text_color, thickness=2)
+        return img
+
+def _finger_edges(filename, data_bar_top):
     # Image pre-processing
-    img = cv2.imread(filename+'.tif').copy()[0:data_bar_top,:,:] # crop data bar 
+    with fa.instrument.stage('imread'):
+        img = fa.pipeline.imread(filename+'.tif')[0:data_bar_top,:,:].copy() # crop data bar 
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) # convert to grayscale
-    blur = cv2.threshold(cv2.GaussianBlur(gray,(7,7),0),0,255,\
-                         cv2.THRESH_BINARY+cv2.THRESH_OTSU)[1] # Gaussian blur
-    edges = cv2.Canny(blur, 50, 200, apertureSize=5) # find edges in the image
+    smooth = cv2.GaussianBlur(gray,(7,7),0) # Gaussian blur
+    blur = cv2.threshold(smooth,0,255,cv2.THRESH_BINARY+cv2.THRESH_OTSU)[1] # binarize
+    with fa.instrument.stage('canny'):
+        edges = cv2.Canny(blur, 50, 200, apertureSize=5) # find edges in the image
+    return img, smooth, edges
+
+def _hough_lines(edges, threshold, minLineLength, maxLineGap):
     # Detect lines (outputs end points (x1,y1,x2,y2) of the detected lines)
-    lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180, threshold=threshold,\
-                            minLineLength=minLineLength, maxLineGap=maxLineGap)
+    with fa.instrument.stage('hough'):
+        lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180, threshold=threshold,\
+                                minLineLength=minLineLength, maxLineGap=maxLineGap)
+    if lines is None: # no line found
+        lines = np.zeros((0,1,4), dtype=np.int32)
+    return lines
+
+def _show_and_save_lines(img, lines, filename, threshold, minLineLength, maxLineGap,\
+                         show_image, save_image):
     # Draw the detected lines on the image and put labels for the detected lines 
-    n = len(lines) # number of detected lines
-    for i in range(n):
-        for x1,y1,x2,y2 in lines[i]:
-            cv2.line(img, (x1,y1),(x2,y2),(0,255,0),2)
-            cv2.putText(img, text=str(i), org=(x1,y1), fontFace=1,\
-                        fontScale=2, color=(255,255,255), thickness=2)
+    LineSet(lines).draw(img)
     # Show image with the lines and labels drawn
     if show_image == True: 
+        import matplotlib.pyplot as plt
         plt.figure()
         plt.imshow(img)
     # Save image with the lines and labels drawn
     if save_image == True: 
-        fa.output.save_fig(directory_name='Finger_Direction_Images',\
-                           save_name='{}_detected_lines_{}_{}_{}.tif'.format(filename,\
-                                                                             threshold,\
-                                                                             minLineLength,\
-                                                                             maxLineGap))
+        save_name = '{}_detected_lines_{}_{}_{}.tif'.format(filename, threshold,\
+                                                            minLineLength, maxLineGap)
+        if fa.render.is_active():
+            # drawn and saved in the background (see render.py)
+            fa.render.submit('output.draw_image', os.path.join('Finger_Direction_Images',\
+                                                               save_name), (img,),\
+                             savefig_kwargs={'bbox_inches': 'tight'})
+        else:
+            fa.output.save_fig(directory_name='Finger_Direction_Images', save_name=save_name)
+    return None
+
+@fa.instrument.instrumented
+def detect_lines(filename, threshold, minLineLength, maxLineGap,\
+                 data_bar_top=690, show_image=False, save_image=False): 
+    """
+    For a given SEM image, this function crops the data bar area and detects lines
+    in the image using probabilistic Hough Transform (PHT) function in OpenCV.
+    The PHT function returns endpoints of the detected lines (x1,y1,x2,y2).
+    The detected lines can be drawn on the image with labels. PHT is an optimization
+    of Hough Transform. It doesn't take all the points into consideration, but instead
+    takes only a random subset of points which is sufficient for line detection.
+    If no line is found, the array of lines is empty.
+    """
+    img, smooth, edges = _finger_edges(filename, data_bar_top)
+    lines = _hough_lines(edges, threshold, minLineLength, maxLineGap)
+    _show_and_save_lines(img, lines, filename, threshold, minLineLength, maxLineGap,\
+                         show_image, save_image)
     return lines
 
+def _edge_pixels(edges):
+    # coordinates of the edge pixels (cv2.findNonZero is much faster than np.nonzero)
+    points = cv2.findNonZero(edges)
+    if points is None:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    return points[:,0,1], points[:,0,0]
+
+def gate_edges(smooth, edges, ori_l, ori_u, tolerance=10, step=2):
+    """
+    Keeps the edge pixels of edges whose direction, perpendicular to the
+    gradient of the smoothed grayscale image smooth (central differences over
+    +-step pixels, computed at the edge pixels only), is within tolerance
+    (deg) of the range (ori_l, ori_u) (deg, w.r.t. the x-axis as in LineSet;
+    the range may wrap around +-90). Returns the gated edge image.
+    """
+    height, width = edges.shape
+    y, x = _edge_pixels(edges)
+    gx = smooth[y, np.minimum(x+step, width-1)].astype(np.float32)\
+         - smooth[y, np.maximum(x-step, 0)]
+    gy = smooth[np.minimum(y+step, height-1), x].astype(np.float32)\
+         - smooth[np.maximum(y-step, 0), x]
+    # direction of the edge, in the same convention as the angles of the lines
+    angle = np.degrees(np.arctan2(gx, -gy))
+    centre = (ori_l + ori_u)/2
+    half_width = (ori_u - ori_l)/2 + tolerance
+    keep = np.abs(np.mod(angle - centre + 90, 180) - 90) <= half_width
+    gated = np.zeros_like(edges)
+    gated[y[keep], x[keep]] = edges[y[keep], x[keep]]
+    return gated
+
+def _theta_ranges(ori_l, ori_u):
+    # ranges, within [0, pi), of the angle of the normal of the lines with an
+    # orientation in (ori_l, ori_u) (deg), as taken by cv2.HoughLines
+    low = np.deg2rad(ori_l + 90)
+    high = np.deg2rad(ori_u + 90)
+    shift = np.floor(low/np.pi)*np.pi
+    low -= shift
+    high -= shift
+    if high - low >= np.pi:
+        return [(0, np.pi)]
+    if high <= np.pi:
+        return [(low, high)]
+    return [(low, np.pi), (0, high - np.pi)]
+
+def hough_lines_in_range(edges, threshold, minLineLength, maxLineGap, ori_l, ori_u,\
+                         distance=1):
+    """
+    Line segments of the edge image edges with an orientation in the range
+    (ori_l, ori_u) (deg), shaped like the output of cv2.HoughLinesP. The
+    Hough transform (cv2.HoughLines) only votes for the angles in the range;
+    every line with at least threshold votes, from the most voted, is split
+    into the segments of its edge pixels (within distance pixels of the line)
+    separated by gaps of at most maxLineGap, and the segments at least
+    minLineLength long are kept. The pixels of a segment are not used again.
+    """
+    y, x = _edge_pixels(edges)
+    candidates = []
+    for low, high in _theta_ranges(ori_l, ori_u):
+        found = cv2.HoughLines(edges, rho=1, theta=np.pi/180, threshold=threshold,\
+                               min_theta=low, max_theta=high)
+        if found is not None:
+            candidates.append(found.reshape(-1,2))
+    segments = []
+    used = np.zeros(len(x), dtype=bool)
+    by_theta = {} # pixels sorted by their distance to the origin along every normal
+    for rho, theta in (np.concatenate(candidates) if len(candidates) > 0 else []):
+        cos, sin = np.cos(theta), np.sin(theta)
+        if theta not in by_theta:
+            r = x*cos + y*sin
+            order = np.argsort(r)
+            by_theta[theta] = (r[order], order)
+        r, order = by_theta[theta]
+        on_line = order[np.searchsorted(r, rho - distance):np.searchsorted(r, rho + distance, 'right')]
+        on_line = on_line[~used[on_line]]
+        if len(on_line) < 2:
+            continue
+        along = y[on_line]*cos - x[on_line]*sin # position along the line
+        order_along = np.argsort(along)
+        on_line = on_line[order_along]
+        along = along[order_along]
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(along) > maxLineGap) + 1, [len(along)]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if along[end-1] - along[start] >= minLineLength:
+                first, last = on_line[start], on_line[end-1]
+                segments.append([x[first], y[first], x[last], y[last]])
+                used[on_line[start:end]] = True
+    return np.array(segments, dtype=np.int32).reshape(-1,1,4)
+
+@fa.instrument.instrumented
+def detect_lines_in_range(filename, threshold, minLineLength, maxLineGap, ori_l=0,\
+                          ori_u=50, tolerance=10, data_bar_top=690, show_image=False,\
+                          save_image=False):
+    """
+    Same as detect_lines, but only the lines with an orientation in the range
+    (ori_l, ori_u) (deg) are detected: the edge pixels whose direction is not
+    within tolerance (deg) of the range are removed (see gate_edges), and the
+    Hough transform only votes for the angles in the range (see
+    hough_lines_in_range), so that the lines across the fingers (e.g. along
+    the aligned finger tips) are neither voted for nor returned.
+    """
+    img, smooth, edges = _finger_edges(filename, data_bar_top)
+    with fa.instrument.stage('gate'):
+        edges = gate_edges(smooth, edges, ori_l, ori_u, tolerance)
+    with fa.instrument.stage('hough'):
+        lines = hough_lines_in_range(edges, threshold, minLineLength, maxLineGap, ori_l, ori_u)
+    lines = LineSet(lines).select(ori_l, ori_u).endpoints
+    _show_and_save_lines(img, lines, filename, threshold, minLineLength, maxLineGap,\
+                         show_image, save_image)
+    return lines
+
+@fa.instrument.instrumented
 def compute_angles(lines, col_name):
     """
     Given a numpy array of lines, which consists of rows of end points of lines
     (x1,y1,x2,y2), this function calculates the angle of each of the lines from
-    (x1,y1,x2,y2) with respect to the x-axis.   
-    """
-    # Calculate angles of lines 
-    n = len(lines) # number of detected lines 
-    df = np.zeros((n,1)) # initialization of data frame
-    for i in range(n):
-        x1 = lines[i][0][0]  
-        y1 = lines[i][0][1]
-        x2 = lines[i][0][2]
-        y2 = lines[i][0][3]
-        angle= np.arctan((y2-y1)/(x2-x1))
-        angle *= 180/np.pi # convert unit from rad to deg 
-        df[i] = angle
-    df = pd.DataFrame(df, columns=col_name)
+    (x1,y1,x2,y2) with respect to the x-axis (see LineSet).
+    """
+    df = LineSet(lines).to_frame(col_name)
     return df
 
+@fa.service.remote
+@fa.instrument.instrumented
+def get_finger_lines(filename, threshold, minLineLength, maxLineGap,\
+                     data_bar_top=690, show_image=False, save_image=False,\
+                     ori_l=None, ori_u=None, tolerance=10):
+    """
+    For a given SEM image, this function detects lines in the image (see
+    detect_lines) and returns them as a LineSet. If ori_l and ori_u are
+    given, only the lines in this range of orientations are detected (see
+    detect_lines_in_range).
+    """
+    if ori_l is not None and ori_u is not None:
+        return LineSet(detect_lines_in_range(filename, threshold, minLineLength, maxLineGap,\
+                                             ori_l, ori_u, tolerance, data_bar_top,\
+                                             show_image, save_image))
+    return LineSet(detect_lines(filename, threshold, minLineLength,\
+                                maxLineGap, data_bar_top, show_image, save_image))
+
+@fa.service.remote
+@fa.instrument.instrumented
 def get_finger_orientation(filename, threshold, minLineLength, maxLineGap,\
                            data_bar_top=690, show_image=False, save_image=False,\
                            save_df=False):
@@ -80,14 +325,47 @@ def get_finger_orientation(filename, threshold, minLineLength, maxLineGap,\
     The number of lines detected will vary while you change the three parameters:
     threshold, minLineLength, and maxLineGap. 
     """
-    lines = detect_lines(filename, threshold, minLineLength,\
-                         maxLineGap, data_bar_top, show_image, save_image)
-    df = compute_angles(lines, col_name=['Finger orientation (deg)'])
+    lines = get_finger_lines(filename, threshold, minLineLength,\
+                             maxLineGap, data_bar_top, show_image, save_image)
+    df = lines.to_frame(col_name=['Finger orientation (deg)'])
     if save_df == True:
         excel_name = '{}_{}_{}_{}'.format(filename, threshold, minLineLength, maxLineGap)
         fa.output.make_dir_and_output_df_to_excel('Finger_Direction', df, excel_name, '')    
     return df
-    
+
+@fa.instrument.instrumented
+def get_drawn_lines(filename, suffix, line_color, threshold_l, minLineLength_l,\
+                    maxLineGap_l, data_bar_top=690, show_image=False):
+    """
+    For a given SEM image with a line drawn in red (line_color='r') or black
+    (line_color='k'), this function detects the drawn line and returns the
+    detected lines as a LineSet. The counterclockwise rotation is positive.
+    """
+    with fa.instrument.stage('imread'):
+        img = fa.pipeline.imread(filename+suffix+'.tif')[0:data_bar_top,:,:].copy()
+    if line_color == 'r':
+        red_line = np.multiply(img, img==[0,0,255]) # get red line in the image
+        with fa.instrument.stage('canny'):
+            edge = cv2.Canny(red_line, 100, 200, apertureSize=7)
+    else:
+        is_black = img.copy()
+        line = np.multiply(is_black==[0,0,0], np.ones(is_black.shape))
+        line_copy = np.uint8(line)
+        with fa.instrument.stage('canny'):
+            edge = cv2.Canny(line_copy,0,0)
+    with fa.instrument.stage('hough'):
+        lines = LineSet(cv2.HoughLinesP(edge, rho=1, theta=np.pi/180, threshold=threshold_l,\
+                                        minLineLength=minLineLength_l, maxLineGap=maxLineGap_l))
+    # Draw detected lines on the image and put label for each of them 
+    lines.draw(img, text_color=(0,0,0))
+    # Show image with the lines and labels drawn
+    if show_image == True: 
+        import matplotlib.pyplot as plt
+        plt.figure()
+        plt.imshow(img)
+    return lines
+
+@fa.instrument.instrumented
 def get_red_line_orientation(filename, suffix, threshold_l, minLineLength_l,\
                              maxLineGap_l, data_bar_top=690, img_show=False):
     """
@@ -95,27 +373,13 @@ def get_red_line_orientation(filename, suffix, threshold_l, minLineLength_l,\
     orientation of the red line in degrees with respect to the x-axis. 
     The counterclockwise rotation is positive.
     """
-    img = cv2.imread(filename+suffix+'.tif').copy()[0:data_bar_top,:,:]
-    red_line = np.multiply(img, img==[0,0,255]) # get red line in the image
-    red_line_edges = cv2.Canny(red_line, 100, 200, apertureSize=7)    
-    lines = cv2.HoughLinesP(red_line_edges, rho=1, theta=np.pi/180,\
-                            threshold=threshold_l, minLineLength=minLineLength_l,\
-                            maxLineGap=maxLineGap_l)
-    # Draw detected lines on the image and put label for each of them 
-    n = len(lines) # number of detected lines
-    for i in range(n):
-        for x1,y1,x2,y2 in lines[i]:
-            cv2.line(img, (x1,y1),(x2,y2),(0,255,0),2)
-            cv2.putText(img, text=str(i), org=(x1,y1), fontFace=1,\
-                        fontScale=2, color=(0,0,0), thickness=2)
-    # Show image with the lines and labels drawn
-    if img_show == True: 
-        plt.figure()
-        plt.imshow(img)
+    lines = get_drawn_lines(filename, suffix, 'r', threshold_l, minLineLength_l,\
+                            maxLineGap_l, data_bar_top, img_show)
     # Compute angles of the lines 
-    df = compute_angles(lines, col_name=['Red line orientation (deg)'])
+    df = lines.to_frame(col_name=['Red line orientation (deg)'])
     return df
 
+@fa.instrument.instrumented
 def get_black_line_orientation(filename, suffix, threshold_l, minLineLength_l,\
                                maxLineGap_l, data_bar_top=690, show_image=False):
     """
@@ -123,24 +387,8 @@ def get_black_line_orientation(filename, suffix, threshold_l, minLineLength_l,\
     orientation of the black line in degrees with respect to the x-axis. 
     The counterclockwise rotation is positive.
     """
-    img = cv2.imread(filename+suffix+'.tif').copy()[0:data_bar_top,:,:]
-    is_black = img.copy()
-    line = np.multiply(is_black==[0,0,0], np.ones(is_black.shape))
-    line_copy = np.uint8(line)
-    edge = cv2.Canny(line_copy,0,0)
-    lines = cv2.HoughLinesP(edge, rho=1, theta=np.pi/180, threshold=threshold_l,\
-                            minLineLength=minLineLength_l, maxLineGap=maxLineGap_l)
-    # Draw detected lines on the image and put labels 
-    n = len(lines)
-    for i in range(n):
-        for x1,y1,x2,y2 in lines[i]:
-            cv2.line(img, (x1,y1),(x2,y2),(0,255,0),2)
-            cv2.putText(img, text=str(i), org=(x1,y1),\
-                        fontFace=1, fontScale=2, color=(0,0,0), thickness=2)
-    # Show image with labels
-    if show_image == True:
-        plt.figure()
-        plt.imshow(img)
+    lines = get_drawn_lines(filename, suffix, 'k', threshold_l, minLineLength_l,\
+                            maxLineGap_l, data_bar_top, show_image)
     # Compute angles of the lines
-    df = compute_angles(lines, col_name=['Black line orientation (deg)'])
-    return df 
\ No newline at end of file
+    df = lines.to_frame(col_name=['Black line orientation (deg)'])
+    return df
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:29:05 2026
+
+@author: yoonahshin
+
+Memory-aware scheduling of the images of a batch run. The working set of an
+image is estimated before it is decoded, from the size of its frames in the
+TIFF headers and the intermediate arrays of the steps of the analysis
+(BYTES_PER_PIXEL), and an image is only read once its working set fits in
+the memory budget with the images already in flight. While the run goes on,
+the resident set size (RSS) of the process is sampled: the estimates are
+scaled by the ratio of the observed growth of the RSS to the estimated
+working sets, and the number of images computed at the same time is lowered
+when the RSS goes over the budget and raised again when there is room.
+
+    fa.batch_get_a_b_p('33deg_', range(1, 44), suffix='_line2', n_workers='auto',
+                       memory_budget=4*2**30)
+"""
+import os
+import sys
+import struct
+import threading
+
+# Peak bytes per pixel of the frame allocated by the steps of the
+# analysis, and bytes per pixel of their results kept until the end of the
+# analysis of the image, measured with tracemalloc on the bundled images.
+# The float64 images of get_line_drawn_in_img and the label image and
+# label2rgb overlay of get_coords_intersections dominate.
+BYTES_PER_PIXEL = {
+    'fingers.get_edges_in_img': (65, 1),
+    'fingers.get_line_drawn_in_img': (18, 8),
+    'fingers.get_coords_intersections': (103, 0),
+    'line_orientation.get_finger_lines': (7, 0),
+    'line_orientation.get_drawn_lines': (9, 0),
+}
+
+# TIFF field type -> struct format of one value
+_TIFF_TYPES = {3: 'H', 4: 'I', 16: 'Q'}
+
+def tiff_shape(path):
+    """
+    Returns (height, width, samples per pixel, bits per sample) of the first
+    image of the TIFF file path, read from its header without decoding it,
+    or None if path is not a TIFF file.
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(16)
+            if header[:2] == b'II':
+                order = '<'
+            elif header[:2] == b'MM':
+                order = '>'
+            else:
+                return None
+            version = struct.unpack(order+'H', header[2:4])[0]
+            if version == 42: # classic TIFF
+                f.seek(struct.unpack(order+'I', header[4:8])[0])
+                n_tags = struct.unpack(order+'H', f.read(2))[0]
+                entry, count_format, value_size = 12, 'I', 4
+            elif version == 43: # BigTIFF
+                f.seek(struct.unpack(order+'Q', header[8:16])[0])
+                n_tags = struct.unpack(order+'Q', f.read(8))[0]
+                entry, count_format, value_size = 20, 'Q', 8
+            else:
+                return None
+            ifd = f.read(n_tags*entry)
+    except OSError:
+        return None
+    tags = {}
+    for i in range(n_tags):
+        data = ifd[i*entry:(i+1)*entry]
+        tag, field_type = struct.unpack(order+'HH', data[:4])
+        count = struct.unpack(order+count_format, data[4:4+value_size])[0]
+        if field_type not in _TIFF_TYPES:
+            continue
+        value_format = _TIFF_TYPES[field_type]
+        if count*struct.calcsize(value_format) <= value_size: # value in the entry itself
+            tags[tag] = struct.unpack_from(order+value_format, data, 4 + value_size)[0]
+        else: # offset to the values, e.g. BitsPerSample of RGB images
+            tags[tag] = None
+    if 256 not in tags or 257 not in tags:
+        return None
+    bits = tags.get(258)
+    return (tags[257], tags[256], tags.get(277, 1), 8 if bits is None else bits)
+
+def working_set(files, steps=()):
+    """
+    Estimated working set (bytes) of the analysis of one image: its frames
+    files, a list of (path, flags) as passed to cv2.imread, decoded (1 byte
+    per pixel in grayscale and 3 in color), and the intermediates of steps
+    (keys of BYTES_PER_PIXEL, in the order they are run) on the first frame.
+    Returns None if a frame is not a TIFF file.
+    """
+    total = 0
+    pixels = None
+    for path, flags in files:
+        shape = tiff_shape(path)
+        if shape is None:
+            return None
+        height, width = shape[:2]
+        total += height*width*(1 if flags == 0 else 3)
+        if pixels is None:
+            pixels = height*width
+    peak = 0
+    kept = 0
+    for step in steps:
+        step_peak, step_kept = BYTES_PER_PIXEL[step]
+        peak = max(peak, kept + step_peak)
+        kept += step_kept
+    return total + (0 if pixels is None else pixels*peak)
+
+def current_rss():
+    """
+    Resident set size (bytes) of the process: from /proc on Linux, with
+    psutil if it is installed, or else the peak RSS so far.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss*1024 # bytes on macOS, KiB on Linux
+
+def available_memory():
+    """
+    Memory (bytes) available for new processes without swapping, or None if
+    it cannot be read.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES')*os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, AttributeError, OSError):
+        return None
+
+class MemoryScheduler:
+    """
+    Admits the images of a run (see pipeline.run_pipeline) so that their
+    estimated working sets fit in budget bytes, and limits the number of
+    images computed at the same time, between 1 and max_workers, from the
+    RSS of the process sampled every interval seconds.
+
+    Parameters
+    ----------
+    estimate : function
+        Function taking an item and returning its estimated working set in
+        bytes (e.g. with working_set), or None if it is not known; the
+        largest estimate so far is used then.
+    budget : int, optional
+        Memory (bytes) for the working sets, on top of the RSS of the
+        process when the run starts. The default is half the available memory.
+    max_workers : int, optional
+        Maximum number of images computed at the same time. The default is
+        the number of CPUs.
+    interval : float, optional
+        Sampling interval of the RSS (s). The default is 0.05.
+
+    """
+    def __init__(self, estimate, budget=None, max_workers=None, interval=0.05):
+        if budget is None:
+            available = available_memory()
+            budget = 2**31 if available is None else available//2
+        self.estimate = estimate
+        self.budget = int(budget)
+        self.max_workers = max(1, os.cpu_count() or 1) if max_workers is None else max(1, int(max_workers))
+        self.interval = interval
+        self.limit = self.max_workers # images computed at the same time
+        self.ratio = 1.0 # observed/estimated working set
+        self.baseline = current_rss()
+        self.peak = 0 # peak growth of the RSS during the run
+        self.max_running = 0
+        self.history = [] # (item, estimate, ratio, limit, peak growth of its window)
+        self._reserved = {} # item -> raw estimate
+        self._largest = 0
+        self._running = 0
+        self._window_peak = 0
+        self._window_reserved = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._monitor = threading.Thread(target=self._sample, name='fa-memory', daemon=True)
+        self._monitor.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            growth = current_rss() - self.baseline
+            with self._condition:
+                self.peak = max(self.peak, growth)
+                self._window_peak = max(self._window_peak, growth)
+                if growth > self.budget and self.limit > 1:
+                    # lower the concurrency right away, not only when an image is done
+                    self.limit = max(1, min(self.limit, self._running) - 1)
+
+    def acquire(self, item, timeout=None):
+        """
+        Waits until the working set of item fits in the budget (or no image
+        is in flight) and reserves it. Returns False if timeout (s) ran out.
+        """
+        estimate = self.estimate(item)
+        with self._condition:
+            if estimate is None:
+                estimate = self._largest
+            self._largest = max(self._largest, estimate)
+            fits = lambda: len(self._reserved) == 0\
+                or (sum(self._reserved.values()) + estimate)*self.ratio <= self.budget
+            if not self._condition.wait_for(fits, timeout):
+                return False
+            self._reserved[item] = estimate
+            self._window_reserved = max(self._window_reserved, sum(self._reserved.values()))
+        return True
+
+    def release(self, item):
+        """
+        Frees the reservation of item once it is computed, and updates the
+        ratio and the concurrency limit from the RSS observed since the last
+        image was done.
+        """
+        with self._condition:
+            estimate = self._reserved.pop(item, None)
+            if estimate is None:
+                return None
+            growth = max(self._window_peak, current_rss() - self.baseline)
+            if self._window_reserved > 0 and growth > 0:
+                observed = growth/self._window_reserved
+                self.ratio = min(max(0.5*self.ratio + 0.5*observed, 0.25), 8.0)
+            if growth > self.budget:
+                self.limit = max(1, self.limit - 1)
+            elif growth < 0.6*self.budget:
+                self.limit = min(self.max_workers, self.limit + 1)
+            self.history.append((item, estimate, self.ratio, self.limit, growth))
+            self._window_peak = 0
+            self._window_reserved = sum(self._reserved.values())
+            self._condition.notify_all()
+        return None
+
+    def run(self, compute, item, data):
+        """
+        Runs compute(item, data) when fewer than limit images are computed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._running < self.limit)
+            self._running += 1
+            self.max_running = max(self.max_running, self._running)
+        try:
+            return compute(item, data)
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def close(self):
+        """
+        Stops the sampling of the RSS.
+        """
+        self._stop.set()
+        self._monitor.join()
+        return None
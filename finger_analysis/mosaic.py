@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:02:37 2026
+
+@author: yoonahshin
+
+Tile-by-tile analysis of large mosaic TIFFs (e.g. stitched SEM mosaics of a
+whole patch) that do not fit in memory. The mosaic is read window by window,
+from a memory map of the file when it is uncompressed and otherwise by
+decoding only the strips or tiles of the file that overlap the window, and the
+edges, the Hough lines and the intersections with an annotation line are found
+tile by tile. The tiles overlap, and every result is kept by the one tile whose
+core (the tile without its overlap) contains it, so the peak memory is set by
+the tile size and not by the size of the mosaic.
+"""
+import collections
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+def _import_tifffile():
+    """
+    tifffile is an optional dependency (pip install finger_analysis[mosaic]).
+    Returns the tifffile module.
+    """
+    try:
+        import tifffile
+    except ImportError:
+        raise ImportError("Reading mosaics tile by tile needs tifffile. "
+                          "Install it with 'pip install tifffile'.")
+    return tifffile
+
+class MosaicReader:
+    """
+    Windowed reader of the first image of a TIFF file. Uncompressed images
+    are memory mapped; the strips or tiles of compressed images are decoded
+    on demand, and the most recently decoded ones are kept up to cache_bytes.
+    """
+    def __init__(self, path, cache_bytes=256*2**20):
+        tifffile = _import_tifffile()
+        self.path = path
+        self._tif = tifffile.TiffFile(path)
+        page = self._tif.pages.first
+        if page.samplesperpixel > 1 and page.planarconfig != 1:
+            self._tif.close()
+            raise ValueError('{}: only images with contiguous samples are supported'.format(path))
+        self._page = page
+        self.height = page.imagelength
+        self.width = page.imagewidth
+        self.samples = page.samplesperpixel
+        self.dtype = page.dtype
+        self._memmap = None
+        if page.is_memmappable:
+            self._memmap = tifffile.memmap(path, mode='r')
+        if page.is_tiled:
+            self._segment_shape = (page.tilelength, page.tilewidth)
+        else:
+            self._segment_shape = (page.rowsperstrip, self.width)
+        self._cache = collections.OrderedDict()
+        self._cache_bytes = cache_bytes
+        self._cached_bytes = 0
+
+    def close(self):
+        self._memmap = None
+        self._cache.clear()
+        self._tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _segment(self, i, j):
+        # decoded strip or tile (row i, column j of the segment grid)
+        key = (i, j)
+        segment = self._cache.get(key)
+        if segment is not None:
+            self._cache.move_to_end(key)
+            return segment
+        page = self._page
+        n_columns = -(-self.width // self._segment_shape[1])
+        index = i*n_columns + j
+        fh = self._tif.filehandle
+        fh.seek(page.dataoffsets[index])
+        data = fh.read(page.databytecounts[index])
+        segment = page.decode(data, index, jpegtables=page.jpegtables)[0]
+        segment = segment.reshape(segment.shape[-3:])
+        self._cache[key] = segment
+        self._cached_bytes += segment.nbytes
+        while self._cached_bytes > self._cache_bytes and len(self._cache) > 1:
+            self._cached_bytes -= self._cache.popitem(last=False)[1].nbytes
+        return segment
+
+    def read_raw(self, y0, y1, x0, x1):
+        """
+        Returns a copy of the window [y0:y1, x0:x1] of the image, with its
+        samples as stored in the file, as an array of shape (y1-y0, x1-x0,
+        samples).
+        """
+        if self._memmap is not None:
+            window = np.array(self._memmap[y0:y1, x0:x1])
+            return window.reshape(window.shape[:2] + (self.samples,))
+        window = np.empty((y1-y0, x1-x0, self.samples), dtype=self.dtype)
+        length, width = self._segment_shape
+        for i in range(y0 // length, (y1-1) // length + 1):
+            for j in range(x0 // width, (x1-1) // width + 1):
+                segment = self._segment(i, j)
+                top, left = i*length, j*width
+                a, b = max(y0, top), min(y1, top + length, self.height)
+                c, d = max(x0, left), min(x1, left + width, self.width)
+                window[a-y0:b-y0, c-x0:d-x0] = segment[a-top:b-top, c-left:d-left]
+        return window
+
+    def read(self, y0, y1, x0, x1, flags=1):
+        """
+        Returns the window [y0:y1, x0:x1] of the image as cv2.imread(path,
+        flags) would read it: 8-bit BGR for flags=1, 8-bit grayscale for
+        flags=0.
+        """
+        import cv2
+        window = self.read_raw(y0, y1, x0, x1)
+        if window.dtype == np.uint16:
+            window = (window >> 8).astype(np.uint8)
+        elif window.dtype != np.uint8:
+            raise ValueError('{}: {} images are not supported'.format(self.path, window.dtype))
+        if self.samples == 1:
+            gray = window[:,:,0]
+            return gray if flags == 0 else cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        rgb = window[:,:,:3]
+        if flags == 0:
+            return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+def open_mosaic(path, cache_bytes=256*2**20):
+    """
+    Opens the mosaic TIFF file at path for reading window by window (see
+    MosaicReader). Use it as a context manager, or close it when done.
+    """
+    return MosaicReader(path, cache_bytes)
+
+def iter_tiles(height, width, tile_size=2048, overlap=32):
+    """
+    Parameters
+    ----------
+    height, width : int
+        Size of the image in pixels.
+    tile_size : int, optional
+        Size of the core of the tiles in pixels. The default is 2048.
+    overlap : int, optional
+        Margin (pixels) added to every side of the core. The default is 32.
+
+    Returns
+    -------
+    Generator of (window, core) of the tiles in row-major order, both as
+    (y0, y1, x0, x1). The cores cover the image without overlapping; the
+    windows are the cores grown by overlap, clipped to the image.
+
+    """
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            core = (y, min(y + tile_size, height), x, min(x + tile_size, width))
+            window = (max(core[0] - overlap, 0), min(core[1] + overlap, height),\
+                      max(core[2] - overlap, 0), min(core[3] + overlap, width))
+            yield window, core
+
+def _height(reader, data_bar_top):
+    return reader.height if data_bar_top is None else min(reader.height, data_bar_top)
+
+def otsu_threshold(reader, data_bar_top=None, tile_size=2048):
+    """
+    Returns the Otsu threshold of the Gaussian-blurred (7x7) grayscale mosaic
+    above data_bar_top, i.e. the threshold cv2.THRESH_OTSU would choose for
+    the whole blurred image, from the histogram of the blurred tiles.
+    """
+    import cv2
+    height = _height(reader, data_bar_top)
+    hist = np.zeros(256)
+    for window, core in iter_tiles(height, reader.width, tile_size, overlap=3):
+        blur = cv2.GaussianBlur(reader.read(*window, flags=0), (7,7), 0)
+        blur = blur[core[0]-window[0]:core[1]-window[0], core[2]-window[2]:core[3]-window[2]]
+        hist += np.bincount(blur.ravel(), minlength=256)
+    # Between-class variance of every threshold; the first maximum is chosen
+    p = hist / hist.sum()
+    levels = np.arange(256)
+    w0 = np.cumsum(p)
+    mu = np.cumsum(p*levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (mu[-1]*w0 - mu)**2 / (w0*(1 - w0))
+    variance[~np.isfinite(variance)] = 0
+    return int(np.argmax(variance))
+
+def _tile_edges(reader, window, threshold):
+    # edges of a window, as fingers.get_edges_in_img finds them in an image
+    import cv2
+    from skimage import feature
+    blur = cv2.GaussianBlur(reader.read(*window, flags=0), (7,7), 0)
+    img_bin = cv2.threshold(blur, threshold, 255, cv2.THRESH_BINARY)[1]
+    with fa.instrument.stage('canny'):
+        return feature.canny(img_bin)
+
+@fa.instrument.instrumented
+def get_edges_in_mosaic(filename, data_bar_top=None, out=None, tile_size=2048, overlap=32):
+    """
+    Parameters
+    ----------
+    filename : str
+        File name of the mosaic without extension, e.g. 'patch_2_mosaic'.
+    data_bar_top : int, optional
+        y coordinate of top of data bar area, if the mosaic has one. The
+        default is None.
+    out : str, optional
+        Path of the .npy file the edges are written to, as a memory-mapped
+        array (one byte per pixel of the mosaic, on disk), so that only the
+        tiles are held in memory. The default is None, i.e. filename +
+        '_edges.npy' next to the mosaic (overwritten if it exists).
+    tile_size, overlap : int, optional
+        See iter_tiles.
+
+    Returns
+    -------
+    Edges in the mosaic, as fingers.get_edges_in_img finds them in an image
+    (the binarization uses the Otsu threshold of the whole mosaic), as a
+    numpy memmap of the out file.
+
+    """
+    with open_mosaic(filename+'.tif') as reader:
+        height = _height(reader, data_bar_top)
+        threshold = otsu_threshold(reader, data_bar_top, tile_size)
+        if out is None:
+            out = filename + '_edges.npy'
+        edges = np.lib.format.open_memmap(out, mode='w+', dtype=bool,\
+                                          shape=(height, reader.width))
+        for window, core in iter_tiles(height, reader.width, tile_size, overlap):
+            tile = _tile_edges(reader, window, threshold)
+            edges[core[0]:core[1], core[2]:core[3]] =\
+                tile[core[0]-window[0]:core[1]-window[0], core[2]-window[2]:core[3]-window[2]]
+    edges.flush()
+    return edges
+
+@fa.instrument.instrumented
+def detect_lines_in_mosaic(filename, threshold, minLineLength, maxLineGap,\
+                           data_bar_top=None, tile_size=2048, overlap=64):
+    """
+    Detects lines in the mosaic tile by tile with the probabilistic Hough
+    transform, as line_orientation.detect_lines does in an image. A line is
+    kept by the tile whose core contains its midpoint, so the lines in the
+    overlaps are not counted twice; lines longer than the tiles are found as
+    several segments.
+
+    Returns
+    -------
+    Array of the end points (x1,y1,x2,y2) of the detected lines in the
+    coordinates of the mosaic, shaped like the output of cv2.HoughLinesP.
+
+    """
+    import cv2
+    lines = []
+    with open_mosaic(filename+'.tif') as reader:
+        height = _height(reader, data_bar_top)
+        otsu = otsu_threshold(reader, data_bar_top, tile_size)
+        for window, core in iter_tiles(height, reader.width, tile_size, overlap):
+            blur = cv2.GaussianBlur(reader.read(*window, flags=0), (7,7), 0)
+            blur = cv2.threshold(blur, otsu, 255, cv2.THRESH_BINARY)[1]
+            with fa.instrument.stage('canny'):
+                edges = cv2.Canny(blur, 50, 200, apertureSize=5)
+            with fa.instrument.stage('hough'):
+                found = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180, threshold=threshold,\
+                                        minLineLength=minLineLength, maxLineGap=maxLineGap)
+            if found is None:
+                continue
+            found = found.reshape(-1, 4) + [window[2], window[0], window[2], window[0]]
+            x = (found[:,0] + found[:,2]) / 2
+            y = (found[:,1] + found[:,3]) / 2
+            in_core = (y >= core[0]) & (y < core[1]) & (x >= core[2]) & (x < core[3])
+            lines.append(found[in_core])
+    if len(lines) == 0:
+        return np.zeros((0,1,4), dtype=np.int32)
+    return np.concatenate(lines).astype(np.int32).reshape(-1,1,4)
+
+def get_finger_orientation_in_mosaic(filename, threshold, minLineLength, maxLineGap,\
+                                     data_bar_top=None, tile_size=2048, overlap=64):
+    """
+    Orientations (deg) of the lines detected in the mosaic w.r.t. the x-axis,
+    as line_orientation.get_finger_orientation computes them for an image.
+    """
+    lines = detect_lines_in_mosaic(filename, threshold, minLineLength, maxLineGap,\
+                                   data_bar_top, tile_size, overlap)
+    return fa.line_orientation.compute_angles(lines, col_name=['Finger orientation (deg)'])
+
+def _tile_line(reader, window, line_color):
+    # line drawn in a window of the annotated mosaic, as in
+    # fingers.get_line_drawn_in_img
+    img = reader.read(*window, flags=1)
+    if line_color == 'r':
+        return img[:,:,2] == 255
+    return np.all(img == 0, axis=2)
+
+@fa.instrument.instrumented
+def get_coords_intersections_in_mosaic(filename, suffix, line_color='r', data_bar_top=None,\
+                                       tile_size=2048, overlap=32):
+    """
+    Parameters
+    ----------
+    filename : str
+        File name of the mosaic without extension, e.g. 'patch_2_mosaic'.
+    suffix : str
+        Suffix of the annotated copy of the mosaic with a line drawn on it,
+        e.g. '_line'.
+    line_color : str, optional
+        Color of the line drawn, 'r' or 'k'. The default is 'r'.
+    data_bar_top : int, optional
+        y coordinate of top of data bar area, if the mosaic has one.
+    tile_size, overlap : int, optional
+        See iter_tiles. The crossed regions must be smaller than the overlap.
+
+    Returns
+    -------
+    A dataframe of sorted coordinates of the regions where the edges of the
+    mosaic cross the line, as fingers.get_coords_intersections returns for
+    the edges and the line of an image (the regions are labeled in the same
+    order), to be used with e.g. fingers.get_wire_widths_along_line.
+
+    """
+    from skimage import measure
+    rows = []
+    with open_mosaic(filename+'.tif') as reader, open_mosaic(filename+suffix+'.tif') as annotated:
+        height = _height(reader, data_bar_top)
+        threshold = otsu_threshold(reader, data_bar_top, tile_size)
+        for window, core in iter_tiles(height, reader.width, tile_size, overlap):
+            line = _tile_line(annotated, window, line_color)
+            if not line.any():
+                continue
+            intersections = np.logical_and(_tile_edges(reader, window, threshold), line)
+            with fa.instrument.stage('label'):
+                label_image = measure.label(intersections)
+            with fa.instrument.stage('regionprops'):
+                props = measure.regionprops(label_image)
+            for prop in props:
+                coords = prop.coords + [window[0], window[2]] # in the mosaic
+                y, x = coords.mean(axis=0)
+                if core[0] <= y < core[1] and core[2] <= x < core[3]:
+                    # the first pixel in raster order gives the label the
+                    # region has in the whole image
+                    rows.append((coords[0][0], coords[0][1], x, y))
+    rows.sort()
+    coords = np.zeros([len(rows),3])
+    for i, (row, column, x, y) in enumerate(rows):
+        coords[i,:] = [i+1, x, y]
+    image_df = pd.DataFrame(coords, columns=['label','x', 'y'])
+    sorted_df = image_df.sort_values('y').reset_index(drop=True)
+    return sorted_df
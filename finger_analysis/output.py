@@ -7,27 +7,50 @@ Created on Thu Jan  2 07:54:33 2020
 """
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import seaborn as sns
+import finger_analysis as fa
 # Plot settings
-#plt.rcParams.update({'font.size': 18}) 
-plt.rcParams['mathtext.fontset'] = 'custom'
-plt.rcParams['mathtext.it'] = 'Arial:italic'
-plt.rcParams['mathtext.rm'] = 'Arial'
-plt.rcParams["font.family"] = 'Arial'
+# matplotlib and seaborn are imported in the plotting functions, so that the
+# analysis functions can be used without loading them. The settings below are
+# applied by the plotting functions (or globally by calling set_plot_style()),
+# rather than changing plt.rcParams when the module is imported.
+PLOT_STYLE = {'mathtext.fontset': 'custom',
+              'mathtext.it': 'Arial:italic',
+              'mathtext.rm': 'Arial',
+              'font.family': 'Arial'}
 
+def set_plot_style():
+    """
+    Applies the plot settings in PLOT_STYLE to the global matplotlib settings,
+    e.g. at the top of a notebook.
+    """
+    import matplotlib.pyplot as plt
+    plt.rcParams.update(PLOT_STYLE)
+    return None
+
+@fa.instrument.instrumented
 def save_fig(directory_name, save_name):
     """
     If directory with name directory_name does not exist, create a directory
     with the name and save the figure in the directory. 
     """
+    import matplotlib.pyplot as plt
     if not os.path.isdir(directory_name):
         os.makedirs(directory_name)    
     path = os.path.join(directory_name, save_name)
-    plt.savefig(path, bbox_inches='tight')
+    with fa.instrument.stage('savefig'):
+        plt.savefig(path, bbox_inches='tight')
     return None
 
+def draw_image(img):
+    """
+    Shows the image img (ndarray) in a new figure and returns the figure.
+    """
+    import matplotlib.pyplot as plt
+    fig = plt.figure()
+    plt.imshow(img)
+    return fig
+
+@fa.instrument.instrumented
 def make_dir_and_output_df_to_excel(DirectoryName, df, filename, suffix):
     """
     If directory with name DirectoryName does not exist, create a directory 
@@ -37,15 +60,15 @@ def make_dir_and_output_df_to_excel(DirectoryName, df, filename, suffix):
     if not os.path.isdir(DirectoryName):
         os.makedirs(DirectoryName)
     path = os.path.join(DirectoryName, filename+suffix+'.xlsx')
-    writer = pd.ExcelWriter(path)
-    df.to_excel(writer)
-    writer.save()
+    with fa.instrument.stage('excel_write'), pd.ExcelWriter(path) as writer:
+        df.to_excel(writer)
     return None
 
+@fa.instrument.instrumented
 def plot_histogram(dir_name, h, alph, t, idx, suffix_name,\
                    x_label, y_label, x_min, x_max, tick_spacing,\
                    fontsize=22, save_format='png', plot_mean=False,\
-                   save_hist=False, color_user='b'):
+                   save_hist=False, color_user='b', store_dir=None):
     """
     dir_name = 'finger_period'
     h = 120 # initial film thickness (nm)
@@ -55,11 +78,46 @@ def plot_histogram(dir_name, h, alph, t, idx, suffix_name,\
     x_label = 'Natural period (\u03BCm)'
     x_min = 0
     x_max = 6
+    store_dir = 'results' # if given, the data is read from the result store
+    (see store.py) instead of the excel file; suffix_name is then matched
+    against l+suffix of the stored results.
     """
     filename = '{}nm_{}deg_{}h_{}'.format(h, alph, t, suffix_name)
-    x = pd.read_excel('{}/{}.xlsx'.format(dir_name, filename))
-    x = x.loc[:, ~x.columns.str.contains('^Unnamed')].iloc[:,idx]
+    if store_dir is None:
+        x = pd.read_excel('{}/{}.xlsx'.format(dir_name, filename))
+        x = x.loc[:, ~x.columns.str.contains('^Unnamed')].iloc[:,idx]
+    else:
+        x = fa.store.read_results(store_dir, dir_name,\
+                                  filters={'h': h, 'alpha': alph, 't': t})
+        x = x[x.l + x.suffix == suffix_name]
+        x = x[fa.store.metric_columns(x)].iloc[:,idx]
+    
+    import matplotlib.pyplot as plt
+    save_name = '{}_idx_{}.{}'.format(filename, idx, save_format)
+    if save_hist == True and fa.render.is_active():
+        # drawn and saved in the background (see render.py)
+        fa.render.submit('output.draw_histogram', os.path.join(dir_name, save_name),\
+                         (x, x_label, y_label, x_min, x_max, tick_spacing, fontsize,\
+                          plot_mean, color_user), savefig_kwargs={'bbox_inches': 'tight'},\
+                         rc=PLOT_STYLE)
+        return x.mean(), x.std(), len(x)
+    with plt.rc_context(PLOT_STYLE):
+        draw_histogram(x, x_label, y_label, x_min, x_max, tick_spacing, fontsize,\
+                       plot_mean, color_user)
+        if save_hist==True:
+            save_fig(dir_name, save_name)
     
+    return x.mean(), x.std(), len(x)
+
+def draw_histogram(x, x_label, y_label, x_min, x_max, tick_spacing, fontsize=22,\
+                   plot_mean=False, color_user='b'):
+    """
+    Draws the histogram of the values x as plot_histogram does, in the
+    current axes, and returns the figure.
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as ticker
+    import seaborn as sns
     ax = sns.distplot(x, hist_kws={'edgecolor':'k', 'color':color_user}, kde=False)
     if plot_mean == True:
         plt.axvline(x.mean(), color=color_user, linewidth=2.5, linestyle='--')
@@ -69,8 +127,4 @@ def plot_histogram(dir_name, h, alph, t, idx, suffix_name,\
     ax.set_ylabel(y_label, fontsize=fontsize)
     ax.set_xlim(xmin=x_min, xmax=x_max)
     ax.xaxis.set_major_locator(ticker.MultipleLocator(tick_spacing))
-    save_name = '{}_idx_{}.{}'.format(filename, idx, save_format)
-    if save_hist==True:
-        save_fig(dir_name, save_name)
-    
-    return x.mean(), x.std(), len(x)
+    return ax.figure
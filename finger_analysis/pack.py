@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 17:55:52 2026
+
+@author: yoonahshin
+
+Packs the TIFF images of a condition folder into uncompressed .npy arrays
+(one stacked array per image size and read mode), so that a folder analyzed
+many times is decoded only once. While a pack is in use, the functions of the
+package read their images from memory-mapped views of the arrays instead of
+decoding the TIFF files.
+"""
+import os
+import json
+import glob
+import datetime
+import contextlib
+import numpy as np
+import finger_analysis as fa
+
+INDEX_FILE = 'pack.json'
+
+def _modes(name):
+    # Read modes (cv2.imread flags) in which the functions read an image: the
+    # original images in color (line_orientation) and in grayscale (fingers,
+    # scale), the annotated images in color only
+    parsed = fa.catalog.parse_name(name)
+    if parsed is not None and parsed['suffix'] != '':
+        return (1,)
+    return (1, 0)
+
+def pack_folder(folder, pack_dir=None, pattern='*.tif', overwrite=False):
+    """
+    Parameters
+    ----------
+    folder : str
+        Folder of the images, e.g. a condition folder.
+    pack_dir : str, optional
+        Folder of the pack. The default is folder + '.fapack'.
+    pattern : str, optional
+        Pattern of the files to pack, e.g. '33deg_0*.tif'. The default is '*.tif'.
+    overwrite : bool, optional
+        If False and the pack is up to date (no file was added, removed or
+        modified since packing), nothing is done. The default is False.
+
+    Returns
+    -------
+    Path of the pack. Every image is decoded once in every read mode the
+    functions use; the frames with the same shape and read mode are stacked
+    into one array file, written frame by frame, so packing needs the memory
+    of a single frame.
+
+    """
+    import cv2
+    folder = os.path.abspath(folder)
+    if pack_dir is None:
+        pack_dir = folder.rstrip(os.sep) + '.fapack'
+    paths = sorted(glob.glob(os.path.join(folder, pattern)))
+    sources = {os.path.basename(p): [os.stat(p).st_mtime_ns, os.stat(p).st_size] for p in paths}
+    index_path = os.path.join(pack_dir, INDEX_FILE)
+    if overwrite == False and os.path.isfile(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['sources'] == sources:
+            return pack_dir
+    if not os.path.isdir(pack_dir):
+        os.makedirs(pack_dir)
+    # First pass: shapes of the frames, from the TIFF headers only (cv2.imread
+    # with flags 1 or 0 always returns 8-bit color or grayscale frames)
+    from PIL import Image
+    groups = {} # (flags, shape) -> list of file names
+    for path in paths:
+        name = os.path.basename(path)[:-len('.tif')]
+        with Image.open(path) as im:
+            width, height = im.size
+        for flags in _modes(name):
+            shape = (height, width, 3) if flags == 1 else (height, width)
+            groups.setdefault((flags, shape), []).append(os.path.basename(path))
+    # Second pass: write every group as one stacked array
+    for old in glob.glob(os.path.join(pack_dir, 'frames-*.npy')):
+        os.remove(old)
+    frames = {}
+    arrays = {}
+    for i, ((flags, shape), names) in enumerate(sorted(groups.items(), key=str)):
+        array_name = 'frames-{}.npy'.format(i)
+        out = np.lib.format.open_memmap(os.path.join(pack_dir, array_name), mode='w+',\
+                                        dtype=np.uint8, shape=(len(names),) + shape)
+        for j, name in enumerate(names):
+            with fa.instrument.stage('imread'):
+                img = cv2.imread(os.path.join(folder, name), flags)
+            if img is None or img.shape != shape:
+                raise ValueError('{} could not be read as a {} frame'.format(name, shape))
+            out[j] = img
+            frames['{}|{}'.format(name, flags)] = [array_name, j]
+        out.flush()
+        del out
+        arrays[array_name] = {'flags': flags, 'shape': [len(names)] + list(shape)}
+    index = {'folder': folder, 'created': str(datetime.datetime.now()),\
+             'sources': sources, 'arrays': arrays, 'frames': frames}
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path)
+    return pack_dir
+
+class ImagePack:
+    """
+    Read-only view of a pack written by pack_folder. The arrays are memory
+    mapped, so reading a frame only maps its pages, and nothing is decoded.
+    """
+    def __init__(self, pack_dir, check_sources=True):
+        self.directory = pack_dir
+        with open(os.path.join(pack_dir, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.folder = self.index['folder']
+        self.check_sources = check_sources
+        self._arrays = {}
+
+    def _array(self, array_name):
+        array = self._arrays.get(array_name)
+        if array is None:
+            array = np.load(os.path.join(self.directory, array_name), mmap_mode='r')
+            self._arrays[array_name] = array
+        return array
+
+    def names(self):
+        """
+        Returns the sorted list of the packed file names.
+        """
+        return sorted(self.index['sources'])
+
+    def frame(self, filename, flags=1):
+        """
+        Returns the memory-mapped frame of the file filename (e.g.
+        '33deg_028.tif') as read by cv2.imread(filename, flags), or None if it
+        is not in the pack. The frame is read-only.
+        """
+        entry = self.index['frames'].get('{}|{}'.format(filename, flags))
+        if entry is None:
+            return None
+        return self._array(entry[0])[entry[1]]
+
+    def get(self, path, flags=1):
+        """
+        Returns the frame of the file at path if it is in the folder of the
+        pack and was not modified since it was packed, otherwise None.
+        """
+        path = os.path.abspath(path)
+        folder, filename = os.path.split(path)
+        if folder != self.folder:
+            return None
+        source = self.index['sources'].get(filename)
+        if source is None:
+            return None
+        if self.check_sources == True:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            if [stat.st_mtime_ns, stat.st_size] != source:
+                return None
+        return self.frame(filename, flags)
+
+def open_pack(pack_dir, check_sources=True):
+    """
+    Opens the pack pack_dir. If check_sources is True, a frame is only used if
+    its TIFF file was not modified since packing (one os.stat per read).
+    """
+    return ImagePack(pack_dir, check_sources)
+
+@contextlib.contextmanager
+def use_pack(pack_dir, check_sources=True):
+    """
+    Context manager making the functions of the package read the images of
+    the pack instead of decoding the TIFF files, e.g.
+        with fa.pack.use_pack('05.28.2019_6h_3-3new_ni110_120.fapack'):
+            fa.batch.batch_get_a_b_p('33deg_', [28, 29, 34], ...)
+    Images that are not in the pack are read from their files as usual.
+    """
+    pack = pack_dir if isinstance(pack_dir, ImagePack) else open_pack(pack_dir, check_sources)
+    fa.pipeline._packs.append(pack)
+    try:
+        yield pack
+    finally:
+        fa.pipeline._packs.remove(pack)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:05:12 2026
+
+@author: yoonahshin
+"""
+import queue
+import threading
+import finger_analysis as fa
+
+# Images decoded ahead of time by the reader threads of run_pipeline.
+# (path, flags) -> [image, number of prefetches not yet released]
+_cache = {}
+_cache_lock = threading.Lock()
+# Packs in use (see pack.py), searched by imread after the prefetched images
+_packs = []
+# Marks the end of the items in a queue
+_DONE = object()
+
+def imread(path, flags=1):
+    """
+    Same as cv2.imread(path, flags), but returns the prefetched image if
+    path was prefetched with the same flags (see prefetch), or the
+    memory-mapped frame of a pack in use (see pack.use_pack). These images are
+    shared (and frames of a pack are read-only), so they must not be modified
+    in place; the functions of the package crop and copy them first.
+    """
+    with _cache_lock:
+        entry = _cache.get((path, flags))
+    if entry is not None:
+        return entry[0]
+    for pack in _packs:
+        img = pack.get(path, flags)
+        if img is not None:
+            return img
+    import cv2
+    return cv2.imread(path, flags)
+
+def prefetch(files):
+    """
+    Decodes the images in files, a list of (path, flags) as passed to
+    cv2.imread (flags=1 for color, 0 for grayscale), and keeps them in memory
+    until release is called with the returned keys.
+    """
+    import cv2
+    keys = []
+    for path, flags in files:
+        key = (path, flags)
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None:
+                entry[1] += 1
+                keys.append(key)
+                continue
+        if any(pack.get(path, flags) is not None for pack in _packs):
+            continue # read from the pack, nothing to decode
+        with fa.instrument.stage('imread'):
+            img = cv2.imread(path, flags) # cv2 releases the GIL while decoding
+        if img is None: # let the function reading it report the missing file
+            continue
+        with _cache_lock:
+            entry = _cache.setdefault(key, [img, 0])
+            entry[1] += 1
+        keys.append(key)
+    return keys
+
+def release(keys):
+    """
+    Releases images prefetched by prefetch.
+    """
+    with _cache_lock:
+        for key in keys:
+            entry = _cache.get(key)
+            if entry is None:
+                continue
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del _cache[key]
+    return None
+
+def run_pipeline(items, compute, read=None, write=None, n_readers=2, n_workers=1,\
+                 queue_size=4, scheduler=None):
+    """
+    Runs compute on every item with the reading and writing of the items
+    overlapped with the computation, so that the run time is bounded by the
+    slowest of the three stages rather than by their sum:
+        reader threads:  data = read(item)
+        compute workers: result = compute(item, data)
+        writer thread:   write(item, result)
+    The stages are connected by queues of at most queue_size items, so at most
+    about queue_size + n_readers items are read ahead of the computation.
+    cv2, file I/O and the Tesseract subprocess release the GIL, so the reader
+    and writer threads run while the workers compute.
+
+    Parameters
+    ----------
+    items : list
+        Items to process, e.g. a list of file names.
+    compute : function
+        Function taking an item and the data read for it, and returning the result.
+    read : function, optional
+        Function taking an item and returning the data needed to compute it,
+        e.g. decoded images. The default reads nothing (data is None).
+    write : function, optional
+        Function taking an item and its result, e.g. to save the result. The
+        default writes nothing.
+    n_readers : int, optional
+        Number of reader threads. If 0, read is called by the workers right
+        before compute. The default is 2.
+    n_workers : int, optional
+        Number of compute workers. With 1 worker, compute runs in the calling
+        thread (so it may show figures). The default is 1.
+    queue_size : int, optional
+        Maximum number of items waiting between two stages. The default is 4.
+    scheduler : memory.MemoryScheduler, optional
+        If given, an item is only read once the scheduler admits its working
+        set, and at most scheduler.limit of the n_workers workers compute at
+        the same time (see memory.py).
+
+    Returns
+    -------
+    List of the results, in the order of items. If any stage raises an
+    exception, the pipeline stops and the first exception is raised.
+
+    """
+    items = list(items)
+    results = [None]*len(items)
+    if read is None:
+        read = lambda item: None
+    if n_readers == 0 and n_workers <= 1 and write is None and scheduler is None:
+        # Nothing to overlap
+        for i, item in enumerate(items):
+            results[i] = compute(item, read(item))
+        return results
+    if n_readers == 0:
+        # No prefetch: the workers read right before computing
+        read_then_compute = compute
+        item_read = read
+        compute = lambda item, data: read_then_compute(item, item_read(item))
+        read = lambda item: None
+        n_readers = 1
+
+    stop = threading.Event()
+    errors = []
+    lock = threading.Lock()
+    read_q = queue.Queue(queue_size)
+    write_q = queue.Queue(queue_size)
+    pending = iter(enumerate(items))
+    finished = {'readers': 0, 'workers': 0}
+
+    def fail(e):
+        with lock:
+            errors.append(e)
+        stop.set()
+
+    def put(q, value):
+        # Waits for room in the queue unless the pipeline is stopping
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def stage_done(stage, n, q, n_next):
+        # The last thread of a stage tells every thread of the next stage
+        with lock:
+            finished[stage] += 1
+            last = finished[stage] == n
+        if last:
+            for i in range(n_next):
+                put(q, _DONE)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                with lock:
+                    nxt = next(pending, None)
+                if nxt is None:
+                    break
+                i, item = nxt
+                if scheduler is not None:
+                    # waits for memory for the working set of the item
+                    while not scheduler.acquire(item, timeout=0.1):
+                        if stop.is_set():
+                            return
+                if not put(read_q, (i, item, read(item))):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            stage_done('readers', n_readers, read_q, max(n_workers, 1))
+
+    def worker():
+        try:
+            while True:
+                task = get(read_q)
+                if task is _DONE:
+                    break
+                i, item, data = task
+                if scheduler is None:
+                    results[i] = compute(item, data)
+                else:
+                    try:
+                        results[i] = scheduler.run(compute, item, data)
+                    finally:
+                        scheduler.release(item)
+                if write is not None and not put(write_q, (i, item, results[i])):
+                    break
+        except BaseException as e:
+            fail(e)
+        finally:
+            stage_done('workers', max(n_workers, 1), write_q, 1)
+
+    def writer():
+        try:
+            while True:
+                task = get(write_q)
+                if task is _DONE:
+                    break
+                i, item, result = task
+                write(item, result)
+        except BaseException as e:
+            fail(e)
+
+    threads = [threading.Thread(target=reader, name='fa-reader-{}'.format(i), daemon=True)\
+               for i in range(n_readers)]
+    if write is not None:
+        threads.append(threading.Thread(target=writer, name='fa-writer', daemon=True))
+    if n_workers > 1:
+        threads += [threading.Thread(target=worker, name='fa-worker-{}'.format(i), daemon=True)\
+                    for i in range(n_workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        if n_workers <= 1:
+            worker()
+    finally:
+        for thread in threads:
+            thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return results
+
+def run_stages(stages, n_threads=4):
+    """
+    Runs the stages of the analysis of one image, each as soon as the stages
+    it depends on are done, so that independent stages (e.g. the orientation
+    of the wires and the edges of the fingers) run at the same time.
+
+    Parameters
+    ----------
+    stages : dict
+        Dictionary of stage name -> (function, tuple of names of the stages it
+        depends on). The function is called with the results of those stages,
+        in the same order, e.g.
+            {'edges': (lambda: get_edges_in_img(name), ()),
+             'line': (lambda: get_line_drawn_in_img(name, suffix), ()),
+             'intersections': (get_coords_intersections, ('edges', 'line'))}
+    n_threads : int, optional
+        Number of threads running the stages. With 1 thread, the stages run
+        one after the other in the calling thread, in the order of the
+        dictionary as far as the dependencies allow. The default is 4.
+
+    Returns
+    -------
+    Dictionary of stage name -> result. If a stage raises an exception, the
+    stages not started yet are cancelled and the exception is raised.
+
+    """
+    for name, (func, deps) in stages.items():
+        for dep in deps:
+            if dep not in stages:
+                raise ValueError("stage '{}' depends on unknown stage '{}'".format(name, dep))
+    results = {}
+    remaining = dict(stages)
+    if n_threads <= 1:
+        while len(remaining) > 0:
+            ready = [name for name, (func, deps) in remaining.items()\
+                     if all(dep in results for dep in deps)]
+            if len(ready) == 0:
+                raise ValueError('the stages {} depend on each other'.format(list(remaining)))
+            name = ready[0]
+            func, deps = remaining.pop(name)
+            results[name] = func(*[results[dep] for dep in deps])
+        return results
+    import contextvars
+    import concurrent.futures as cf
+    running = {}
+    with cf.ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix='fa-stage') as executor:
+        try:
+            while len(remaining) > 0 or len(running) > 0:
+                ready = [name for name, (func, deps) in remaining.items()\
+                         if all(dep in results for dep in deps)]
+                for name in ready:
+                    func, deps = remaining.pop(name)
+                    # the stages see the same context (e.g. the image being
+                    # instrumented) as the calling thread
+                    context = contextvars.copy_context()
+                    future = executor.submit(context.run, func, *[results[dep] for dep in deps])
+                    running[future] = name
+                if len(running) == 0:
+                    raise ValueError('the stages {} depend on each other'.format(list(remaining)))
+                done, not_done = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+    return results
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:08:18 2026
+
+@author: yoonahshin
+
+Rendering of the saved figures off the critical path. While a render queue
+is active, the functions saving figures (detect_lines with save_image=True,
+plot_histogram with save_hist=True, and corner, root and side of
+afm_analysis.py with save_fig=True) send the data of the plot to the queue
+instead of drawing it, and separate processes draw and save the figures with
+the Agg backend, so the analysis never waits for matplotlib:
+
+    with fa.render.rendering():
+        fa.save_figures_and_results(20, 0, 60, save_fig=True)
+    # all the figures are written here
+
+A figure is described by the name of a drawing function ('module.function'
+of the package, returning the figure) and its arguments, which are pickled
+when the figure is submitted, so the data may be modified afterwards.
+"""
+import os
+import atexit
+import pickle
+import importlib
+import contextlib
+import traceback
+import itertools
+import multiprocessing
+import queue as queue_module
+
+_active = None # render queue in use (see start)
+
+def _draw_and_save(draw, path, args, kwargs, savefig_kwargs, rc):
+    import matplotlib.pyplot as plt
+    module, func = draw.rsplit('.', 1)
+    func = getattr(importlib.import_module('finger_analysis.' + module), func)
+    directory = os.path.dirname(path)
+    if directory != '' and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    with plt.rc_context(rc):
+        fig = func(*args, **kwargs)
+        if fig is None:
+            fig = plt.gcf()
+        fig.savefig(path, **savefig_kwargs)
+    plt.close('all')
+    return None
+
+def _render_loop(tasks, done):
+    import matplotlib
+    matplotlib.use('Agg')
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, payload = task
+        try:
+            _draw_and_save(*pickle.loads(payload))
+            done.put((task_id, None))
+        except Exception:
+            done.put((task_id, traceback.format_exc()))
+
+class RenderQueue:
+    """
+    Queue of figures to draw and save, rendered by n_processes processes with
+    the Agg backend.
+    """
+    def __init__(self, n_processes=1):
+        context = multiprocessing.get_context('spawn')
+        self._tasks = context.Queue()
+        self._done = context.Queue()
+        self._ids = itertools.count()
+        self._pending = {} # task id -> path
+        self.errors = {} # path -> traceback
+        self.n_rendered = 0
+        self._processes = [context.Process(target=_render_loop, args=(self._tasks, self._done),\
+                                           daemon=True) for i in range(n_processes)]
+        for process in self._processes:
+            process.start()
+
+    def submit(self, draw, path, args=(), kwargs=None, savefig_kwargs=None, rc=None):
+        """
+        Queues the figure drawn by draw(*args, **kwargs) ('module.function',
+        e.g. 'afm_analysis.draw_plot'), to be saved with
+        fig.savefig(path, **savefig_kwargs) within plt.rc_context(rc).
+        Returns immediately.
+        """
+        if self._processes is None:
+            raise RuntimeError('the render queue was joined')
+        path = os.path.abspath(path)
+        payload = pickle.dumps((draw, path, tuple(args), kwargs or {},\
+                                savefig_kwargs or {}, rc or {}), protocol=pickle.HIGHEST_PROTOCOL)
+        task_id = next(self._ids)
+        self._pending[task_id] = path
+        self._tasks.put((task_id, payload))
+        self._collect(block=False)
+        return None
+
+    def _collect(self, block):
+        while len(self._pending) > 0:
+            try:
+                task_id, error = self._done.get(block=block, timeout=1 if block else None)
+            except queue_module.Empty:
+                if not block:
+                    return None
+                if not any(process.is_alive() for process in self._processes):
+                    raise RuntimeError('the rendering processes exited with {} figures '
+                                       'not saved'.format(len(self._pending)))
+                continue
+            path = self._pending.pop(task_id)
+            if error is None:
+                self.n_rendered += 1
+            else:
+                self.errors[path] = error
+        return None
+
+    def flush(self):
+        """
+        Waits until all the submitted figures are saved. Raises a RuntimeError
+        listing the figures that could not be drawn (their tracebacks are in
+        the attribute errors).
+        """
+        self._collect(block=True)
+        if len(self.errors) > 0:
+            errors = self.errors
+            self.errors = {}
+            raise RuntimeError('{} figures could not be saved: {}\n{}'\
+                               .format(len(errors), ', '.join(errors), list(errors.values())[0]))
+        return None
+
+    def join(self):
+        """
+        Flushes the queue and stops the rendering processes.
+        """
+        if self._processes is None:
+            return None
+        try:
+            self.flush()
+        finally:
+            for process in self._processes:
+                self._tasks.put(None)
+            for process in self._processes:
+                process.join()
+            self._processes = None
+        return None
+
+def start(n_processes=1):
+    """
+    Starts a render queue and makes the functions of the package use it.
+    It is joined by join(), or else when the interpreter exits.
+    """
+    global _active
+    if _active is None:
+        _active = RenderQueue(n_processes)
+    return _active
+
+def is_active():
+    return _active is not None
+
+def submit(draw, path, args=(), kwargs=None, savefig_kwargs=None, rc=None):
+    """
+    Submits a figure to the active render queue (see RenderQueue.submit).
+    """
+    return _active.submit(draw, path, args, kwargs, savefig_kwargs, rc)
+
+def flush():
+    """
+    Waits until all the figures submitted to the active render queue are saved.
+    """
+    if _active is not None:
+        _active.flush()
+    return None
+
+def join():
+    """
+    Flushes and stops the active render queue; the figures are drawn inline
+    again afterwards.
+    """
+    global _active
+    render_queue = _active
+    _active = None
+    if render_queue is not None:
+        render_queue.join()
+    return None
+
+@contextlib.contextmanager
+def rendering(n_processes=1):
+    """
+    Context manager rendering the saved figures in n_processes background
+    processes; all the figures are saved when it exits.
+    """
+    previous = is_active()
+    render_queue = start(n_processes)
+    try:
+        yield render_queue
+    finally:
+        if previous == False:
+            join()
+
+atexit.register(join)
@@ -5,21 +5,35 @@ Created on Tue Dec 28 00:31:40 2021
 
 @author: yoonahshin
 """
+import os
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
-import pytesseract
 import re
-pytesseract.pytesseract.tesseract_cmd = r'/usr/local/Cellar/tesseract/4.1.0/bin/tesseract'
-# One can find full path to their tesseract executable by typing command as 
-# written below on terminal on Mac OS:
-# brew list tesseract
+import finger_analysis as fa
+
+def _get_pytesseract():
+    """
+    Imports pytesseract on first use and points it to the local installation
+    of Tesseract OCR. The path is taken from the environment variable
+    TESSERACT_CMD if it is set, otherwise the Homebrew installation below is
+    used if it exists, otherwise tesseract is looked up on the PATH.
+    One can find full path to their tesseract executable by typing command as
+    written below on terminal on Mac OS:
+    brew list tesseract
+    """
+    import pytesseract
+    tesseract_cmd = os.environ.get('TESSERACT_CMD',\
+                                   r'/usr/local/Cellar/tesseract/4.1.0/bin/tesseract')
+    if os.path.isfile(tesseract_cmd):
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    return pytesseract
 
 # The function "get_pixel_size()" is copied from Maxwell A. L'Etoile's 
 # get_pixel_size() in scale.py. 
 # Here, I added comments that describe each line of the code. 
 
+@fa.service.remote
+@fa.instrument.instrumented
 def get_pixel_size(filename, data_bar_min=690, data_bar_max=760):
     """
     returns the stated pixel size in the data bar.
@@ -27,13 +41,17 @@ def get_pixel_size(filename, data_bar_min=690, data_bar_max=760):
     pixel_size and the prefix of the unit, for example: 
     (97.85, n)
     """
-    full_img = cv2.imread(filename+'.tif',0) # read in image file as a grayscale 
-    data_bar = full_img.copy()[data_bar_min:data_bar_max,:] # take the data bar area from the original image
+    with fa.instrument.stage('imread'):
+        full_img = fa.pipeline.imread(filename+'.tif',0) # read in image file as a grayscale 
+    data_bar = full_img[data_bar_min:data_bar_max,:].copy() # take the data bar area from the original image
     
     # convert the data_bar(type: ndarray) to text(type: str)
     # Since data_bar is an numpy array, use Image.fromarray() function
     # to read in the data_bar image 
-    bar_text = pytesseract.image_to_string(Image.fromarray(data_bar))
+    from PIL import Image
+    pytesseract = _get_pytesseract()
+    with fa.instrument.stage('ocr'):
+        bar_text = pytesseract.image_to_string(Image.fromarray(data_bar))
     # remove all the spacings in the text, and then convert to lower-case letters
     bar_text = bar_text.replace(' ','').lower()
     # find index of starting point of the word 'pixelsize'
@@ -51,6 +69,7 @@ def get_pixel_size(filename, data_bar_min=690, data_bar_max=760):
     
     return (pixel_size, prefix)
 
+@fa.instrument.instrumented
 def read_number_above_scale_bar(filename, y_min=713, y_max=750,\
                                 x_min=0, x_max=190, show_img=False):
     """
@@ -74,18 +93,23 @@ def read_number_above_scale_bar(filename, y_min=713, y_max=750,\
     Number on the scale bar. TYPE 'int'
     
     """
-    img = cv2.imread(filename+'.tif',0) # Read image in grayscale
-    data_bar = img.copy()[y_min:y_max,x_min:x_max]
+    with fa.instrument.stage('imread'):
+        img = fa.pipeline.imread(filename+'.tif',0) # Read image in grayscale
+    data_bar = img[y_min:y_max,x_min:x_max].copy()
     if show_img == True:
+        import matplotlib.pyplot as plt
         plt.imshow(data_bar)
     # Read text on the scale bar using pytesseract    
-    bar_text = pytesseract.image_to_string(data_bar,\
-                                           config='--psm 6 --oem 3 -c tessedit_char_whitelist=0123456789')
+    pytesseract = _get_pytesseract()
+    with fa.instrument.stage('ocr'):
+        bar_text = pytesseract.image_to_string(data_bar,\
+                                               config='--psm 6 --oem 3 -c tessedit_char_whitelist=0123456789')
     bar_text = re.findall(r'\d+', bar_text) # extracts numbers from str
     bar_text = int(bar_text[0])
     
     return bar_text
     
+@fa.instrument.instrumented
 def get_number_of_pixels_in_scale_bar(filename, y_min_bar=730, y_max_bar=760,\
                                       x_min_bar=5, x_max_bar=190, e_w=1, s_w=1,\
                                       threshold=25, minLineLength=25, maxLineGap=10,\
@@ -126,18 +150,22 @@ def get_number_of_pixels_in_scale_bar(filename, y_min_bar=730, y_max_bar=760,\
     
     """
     # Image processing
-    img = cv2.imread(filename+'.tif',0)
-    scale_bar = img.copy()[y_min_bar:y_max_bar,x_min_bar:x_max_bar]
-    edges = cv2.Canny(scale_bar, threshold1=125, threshold2=255, apertureSize=5)
+    with fa.instrument.stage('imread'):
+        img = fa.pipeline.imread(filename+'.tif',0)
+    scale_bar = img[y_min_bar:y_max_bar,x_min_bar:x_max_bar].copy()
+    with fa.instrument.stage('canny'):
+        edges = cv2.Canny(scale_bar, threshold1=125, threshold2=255, apertureSize=5)
     
     # Show edge image of scale bar
     if show_edge == True: 
+        import matplotlib.pyplot as plt
         plt.imshow(edges)
     
     # Probabilistic Hough Transform directly returns the two endpoints of lines
-    lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180,\
-                            threshold=threshold, minLineLength=minLineLength,\
-                            maxLineGap=maxLineGap)
+    with fa.instrument.stage('hough'):
+        lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180,\
+                                threshold=threshold, minLineLength=minLineLength,\
+                                maxLineGap=maxLineGap)
     # Draw detected lines and get their pixel numbers
     n = len(lines) # number of detect lines from the edge image
     df = np.zeros(n) # dataframe for storing pixel numbers of the detected lines
@@ -149,6 +177,7 @@ def get_number_of_pixels_in_scale_bar(filename, y_min_bar=730, y_max_bar=760,\
     
     # Show scale bar
     if show_scale_bar == True:
+        import matplotlib.pyplot as plt
         plt.figure()
         plt.imshow(scale_bar)
     
@@ -157,6 +186,304 @@ def get_number_of_pixels_in_scale_bar(filename, y_min_bar=730, y_max_bar=760,\
     
     return num_pixels_scale_bar
 
+# Layouts of the data bar found by locate_data_bar, one per
+# (instrument, image height, image width), kept for the session
+_layouts = {}
+
+def _runs(mask):
+    """
+    Starts and ends (exclusive) of the runs of True in a 1d boolean array.
+    """
+    padded = np.concatenate([[False], mask, [False]])
+    change = np.flatnonzero(padded[1:] != padded[:-1])
+    return change[0::2], change[1::2]
+
+def _row_modes(img):
+    """
+    Counts of every gray level (columns) in every row of a uint8 image.
+    """
+    n = img.shape[0]
+    return np.bincount((np.arange(n)[:,np.newaxis]*256 + img).ravel(),\
+                       minlength=n*256).reshape(n, 256)
+
+def _find_data_bar_top(gray, search_fraction=0.4, min_uniform=0.9, min_background=0.7):
+    """
+    y coordinate of the top of the data bar: the first row, in the lower
+    search_fraction of the image, that is uniform (min_uniform of its pixels
+    at one gray level, as the border or the background of the data bar, but
+    never the noisy SEM image) and below which min_background of the pixels
+    are at the background gray level of the data bar.
+    """
+    height, width = gray.shape
+    offset = int(height*(1 - search_fraction))
+    counts = _row_modes(gray[offset:])
+    uniform = counts.max(axis=1) >= min_uniform*width
+    below = counts[::-1].cumsum(axis=0)[::-1] # counts of the rows from r to the bottom
+    n_below = (len(counts) - np.arange(len(counts)))*width
+    background = below.max(axis=1) >= min_background*n_below
+    candidates = np.flatnonzero(uniform & background)
+    if len(candidates) == 0:
+        return None
+    return offset + int(candidates[0])
+
+def _longest_runs(ink, max_length):
+    # longest run of every row of ink shorter than max_length (border lines excluded)
+    best = np.zeros((ink.shape[0], 3), dtype=int) # length, start, end
+    for i, row in enumerate(ink):
+        starts, ends = _runs(row)
+        lengths = ends - starts
+        lengths[lengths > max_length] = 0
+        if len(lengths) > 0 and lengths.max() > 0:
+            k = np.argmax(lengths)
+            best[i] = lengths[k], starts[k], ends[k]
+    return best
+
+def _vertical_extent(ink, row, columns):
+    # lengths of the vertical runs of ink from row up (row included) and
+    # from row down (row excluded) in each of columns
+    col = ink[:, columns]
+    above = np.cumprod(col[row::-1], axis=0).sum(axis=0)
+    below = np.cumprod(col[row+1:], axis=0).sum(axis=0)
+    return above, below
+
+def _has_end_ticks(ink, row, x_start, x_end, min_height=3, reach=3):
+    """
+    True if the run of ink from x_start to x_end (exclusive) in row has a
+    tick at both ends: within reach pixels of each end, ink rising above and
+    falling below the bar, at least min_height pixels high in all, as a
+    scale bar. The middle of the bar gives its thickness. The borders of the
+    data bar, the corners of frames and the text have no such ticks.
+    """
+    width = ink.shape[1]
+    mid_above, mid_below = _vertical_extent(ink, row, [(x_start + x_end)//2])
+    def tick(columns):
+        above, below = _vertical_extent(ink, row, columns)
+        return bool(((above > mid_above[0]) & (below > mid_below[0])\
+                     & (above + below >= min_height)).any())
+    left = np.arange(max(x_start - reach, 0), min(x_start + reach + 1, width))
+    right = np.arange(max(x_end - 1 - reach, 0), min(x_end + reach, width))
+    return tick(left) and tick(right)
+
+def _locate_layout(gray, min_length=25, bottom_margin=3):
+    height, width = gray.shape
+    top = _find_data_bar_top(gray)
+    if top is None:
+        return None
+    band = gray[top:]
+    background = int(_row_modes(band).sum(axis=0).argmax())
+    ink = np.abs(band.astype(np.int16) - background) > 64
+    # candidates: the runs of ink with a tick at both ends, neither touching
+    # the sides of the image nor in its last rows (the border of the frame)
+    best = None # length, row, start, end
+    for row in range(len(band) - bottom_margin):
+        starts, ends = _runs(ink[row])
+        for x_start, x_end in zip(starts, ends):
+            length = x_end - x_start
+            if length < min_length or length > width//2 or x_start == 0 or x_end == width:
+                continue
+            if best is not None and length <= best[0]:
+                continue
+            if _has_end_ticks(ink, row, x_start, x_end):
+                best = (length, row, int(x_start), int(x_end))
+    if best is None:
+        return None
+    length, row, x_start, x_end = best
+    # the rows of the bar: the rows around row with ink all along the bar
+    # between its ticks
+    inside = ink[:, x_start+4:x_end-4].all(axis=1)
+    r0 = row
+    while r0 > 0 and inside[r0-1]:
+        r0 -= 1
+    r1 = row + 1
+    while r1 < len(band) and inside[r1]:
+        r1 += 1
+    return {'data_bar_top': top, 'background': background,\
+            'bar_rows': (top + r0, top + r1), 'bar_x': (x_start, x_end)}
+
+@fa.instrument.instrumented
+def locate_data_bar(filename, instrument=None, relocate=False):
+    """
+    Finds the data bar and the scale bar of an image by row and column
+    projections of its gray levels, instead of hand-specified crop areas.
+    The layout found is cached per instrument and image size for the
+    session, so only the first image of each instrument and resolution is
+    searched (or every image with relocate=True).
+
+    Parameters
+    ----------
+    filename : str
+        Image file name without extension.
+    instrument : str, optional
+        Name of the instrument (e.g. 'Harvard CNS' or 'MIT CMSE'), part of
+        the cache key with the image size. The default is None.
+    relocate : bool, optional
+        If True, the layout is searched in this image and replaces the
+        cached one. The default is False.
+
+    Returns
+    -------
+    Dictionary of the layout: 'data_bar_top' (y coordinate of the top of the
+    data bar), 'background' (gray level of the data bar), 'bar_rows' (y range
+    of the scale bar) and 'bar_x' (x range of the scale bar in the image the
+    layout was found in). With pix_size_given='auto', the batch functions
+    crop the images at the data_bar_top found here (see get_data_bar_top)
+    instead of their data_bar_top argument.
+
+    """
+    with fa.instrument.stage('imread'):
+        gray = fa.pipeline.imread(filename+'.tif',0)
+    return _layout(gray, filename, instrument, relocate)
+
+def get_data_bar_top(filename, instrument=None):
+    """
+    y coordinate of the top of the data bar of the image, from the layout
+    cached for its instrument and size (read from the TIFF header), or else
+    from the layout located in this image (see locate_data_bar).
+    """
+    shape = fa.memory.tiff_shape(filename+'.tif')
+    if shape is not None:
+        layout = _layouts.get((instrument, shape[0], shape[1]))
+        if layout is not None:
+            return layout['data_bar_top']
+    return locate_data_bar(filename, instrument)['data_bar_top']
+
+def _layout(gray, filename, instrument, relocate):
+    key = (instrument, gray.shape[0], gray.shape[1])
+    if relocate == False and key in _layouts:
+        return _layouts[key]
+    layout = _locate_layout(gray)
+    if layout is None:
+        raise ValueError('no data bar with a scale bar was found in {}'.format(filename))
+    _check_layout(gray, filename, layout)
+    _layouts[key] = layout
+    return layout
+
+def _check_layout(gray, filename, layout, tolerance=0.25, margin=8, e_w=1, s_w=1,\
+                  threshold=25, minLineLength=25, maxLineGap=10):
+    """
+    Raises a ValueError, so that the layout is not cached, if the scale bar
+    measured between its ticks differs by more than tolerance (relative)
+    from the longest line found, as in get_number_of_pixels_in_scale_bar, by
+    the Hough transform of the edges of the area around the located bar
+    (margin pixels around it), or if no line is found there. The Hough
+    measure includes the letters touching the end of the bar in some images
+    (e.g. 162 instead of 136 pixels), hence the tolerance.
+    """
+    measured = _measure_scale_bar(gray, layout)
+    if measured is None:
+        raise ValueError('no scale bar in the rows of the layout found in {}'.format(filename))
+    num_pixels, (x_start, x_end) = measured
+    r0, r1 = layout['bar_rows']
+    scale_bar = gray[max(r0 - margin, layout['data_bar_top']):min(r1 + margin, gray.shape[0]),\
+                     max(x_start - margin, 0):min(x_end + margin, gray.shape[1])]
+    edges = cv2.Canny(scale_bar, threshold1=125, threshold2=255, apertureSize=5)
+    lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180, threshold=threshold,\
+                            minLineLength=minLineLength, maxLineGap=maxLineGap)
+    if lines is None:
+        raise ValueError('no line was found by the Hough transform around the scale bar '
+                         'located in {}; the layout is not used'.format(filename))
+    hough = float(np.max(lines[:,0,2] - lines[:,0,0]) - (2*e_w + s_w))
+    if abs(num_pixels - hough) > tolerance*hough:
+        raise ValueError('the scale bar located in {} is {:g} pixels long, but {:g} pixels '
+                         'with the Hough transform; the layout is not used'\
+                         .format(filename, num_pixels, hough))
+    return None
+
+def clear_layouts():
+    """
+    Forgets the data bar layouts cached by locate_data_bar.
+    """
+    _layouts.clear()
+    return None
+
+def _measure_scale_bar(gray, layout, min_length=25):
+    """
+    Length (pixels) of the scale bar in the rows of layout, between the
+    centres of its end ticks (or between its ends without ticks), and the x
+    range of the bar. None if there is no bar in these rows.
+    """
+    width = gray.shape[1]
+    top = layout['data_bar_top']
+    r0, r1 = layout['bar_rows']
+    ink = np.abs(gray[top:].astype(np.int16) - layout['background']) > 64
+    r0 -= top
+    r1 -= top
+    runs = _longest_runs(ink[r0:r1], width//2)
+    i = int(np.argmax(runs[:,0]))
+    if runs[i,0] < min_length:
+        return None
+    x_start, x_end = int(runs[i,1]), int(runs[i,2])
+    # height of the ink through the bar in every column around it (run-length
+    # of the ticks above and below the bar rows)
+    columns = ink[:, max(x_start-3, 0):min(x_end+3, width)]
+    above = np.cumprod(columns[r0-1::-1] if r0 > 0 else columns[:0], axis=0).sum(axis=0)
+    below = np.cumprod(columns[r1:], axis=0).sum(axis=0)
+    extent = above + below
+    ticks = np.flatnonzero((extent >= 0.6*extent.max()) & (extent >= 2))
+    if len(ticks) == 0:
+        return float(x_end - 1 - x_start), (x_start, x_end)
+    groups = np.split(ticks, np.flatnonzero(np.diff(ticks) > 1) + 1)
+    if len(groups) < 2:
+        return float(x_end - 1 - x_start), (x_start, x_end)
+    left = groups[0].mean() + max(x_start-3, 0)
+    right = groups[-1].mean() + max(x_start-3, 0)
+    return float(right - left), (x_start, x_end)
+
+def _scale_bar(gray, filename, instrument):
+    # layout and measured scale bar, with the layout searched again in this
+    # image if it has no bar in the rows of the cached one
+    layout = _layout(gray, filename, instrument, False)
+    measured = _measure_scale_bar(gray, layout)
+    if measured is None:
+        layout = _layout(gray, filename, instrument, True)
+        measured = _measure_scale_bar(gray, layout)
+        if measured is None:
+            raise ValueError('no scale bar was found in {}'.format(filename))
+    return layout, measured
+
+@fa.instrument.instrumented
+def measure_scale_bar(filename, instrument=None, show_scale_bar=False):
+    """
+    Number of pixels in the scale bar of the image, measured between the
+    centres of its end ticks in the rows of the cached layout (see
+    locate_data_bar); the layout is searched again in this image if no bar is
+    found in these rows.
+    """
+    with fa.instrument.stage('imread'):
+        gray = fa.pipeline.imread(filename+'.tif',0)
+    layout, measured = _scale_bar(gray, filename, instrument)
+    num_pixels, (x_start, x_end) = measured
+    if show_scale_bar == True:
+        import matplotlib.pyplot as plt
+        plt.figure()
+        plt.imshow(gray[layout['data_bar_top']:,:], cmap='gray')
+        r0, r1 = layout['bar_rows']
+        plt.axhspan(r0 - layout['data_bar_top'] - 0.5, r1 - layout['data_bar_top'] - 0.5,\
+                    xmin=x_start/gray.shape[1], xmax=x_end/gray.shape[1], color='r', alpha=0.3)
+    return num_pixels
+
+def _number_box(gray, layout, x_range, gap=8):
+    """
+    Area (y_min, y_max, x_min, x_max) of the number above the scale bar: the
+    first group of ink columns, from the left, between the top of the data
+    bar and the scale bar.
+    """
+    top = layout['data_bar_top']
+    r0 = layout['bar_rows'][0]
+    x_min = max(x_range[0] - 10, 0)
+    x_max = min(x_range[1] + 10, gray.shape[1])
+    area = np.abs(gray[top+2:r0-1, x_min:x_max].astype(np.int16) - layout['background']) > 64
+    # the ticks of the bar may rise into this area
+    area[:, :max(x_range[0] - x_min + 4, 0)] = False
+    columns = np.flatnonzero(area.any(axis=0))
+    if len(columns) == 0:
+        return (top, r0, x_min, x_max)
+    groups = np.split(columns, np.flatnonzero(np.diff(columns) > gap) + 1)
+    return (top + 2, r0 - 1, max(x_min + int(groups[0][0]) - 3, 0),\
+            min(x_min + int(groups[0][-1]) + 4, gray.shape[1]))
+
+@fa.service.remote
+@fa.instrument.instrumented
 def extract_pixel_size(filename, y_min=713, y_max=750, x_min=5, x_max=190,\
                        y_min_bar=730, y_max_bar=760, x_min_bar=5, x_max_bar=190,\
                        e_w=1, s_w=1, threshold=25, minLineLength=25, maxLineGap=10,\
@@ -175,4 +502,23 @@ def extract_pixel_size(filename, y_min=713, y_max=750, x_min=5, x_max=190,\
                                                 show_edge, show_scale_bar)
     pix_size = text/num_pix
     
-    return (text, num_pix, pix_size)
\ No newline at end of file
+    return (text, num_pix, pix_size)
+
+@fa.instrument.instrumented
+def extract_pixel_size_auto(filename, instrument=None, show_img=False, show_scale_bar=False):
+    """
+    Same as extract_pixel_size, with the data bar, the scale bar and the
+    number above it located automatically (see locate_data_bar) instead of
+    given crop areas. Returns a tuple of (number above the scale bar, number
+    of pixels in the scale bar, pixel size).
+    """
+    with fa.instrument.stage('imread'):
+        gray = fa.pipeline.imread(filename+'.tif',0)
+    layout, (num_pix, x_range) = _scale_bar(gray, filename, instrument)
+    if show_scale_bar == True:
+        measure_scale_bar(filename, instrument, show_scale_bar)
+    y_min, y_max, x_min, x_max = _number_box(gray, layout, x_range)
+    text = read_number_above_scale_bar(filename, y_min, y_max, x_min, x_max, show_img)
+    pix_size = text/num_pix
+    
+    return (text, num_pix, pix_size)
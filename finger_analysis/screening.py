@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:11:54 2026
+
+@author: yoonahshin
+
+Quick screening of large folders before the full analysis. Every image is
+checked on a downsampled copy of its frame: the finger orientations (Hough
+parameters scaled with the image), the annotation line, the edges and their
+intersections with the line, and the scale bar of the data bar (without
+OCR). The images that pass all the checks are then analyzed at full
+resolution by refine.
+
+    screened = fa.screening.screen_folder('33deg_', range(1, 44), suffixes=('_line2',))
+    results = fa.screening.refine(screened, fa.batch_get_a_b_p, '33deg_', suffix='_line2')
+"""
+import os
+import cv2
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+# Checks of an image, in the order they are run; an image passes if all are True
+CHECKS = ('readable', 'fingers', 'annotation', 'intersections', 'data_bar')
+
+def _odd(n):
+    n = max(3, int(round(n)))
+    return n if n % 2 == 1 else n + 1
+
+def _downsample(img, scale):
+    if scale == 1:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def _hough(edges, threshold, minLineLength, maxLineGap, scale):
+    # Hough transform with the parameters given for the full resolution image
+    lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180,\
+                            threshold=max(1, int(round(threshold*scale))),\
+                            minLineLength=max(1, minLineLength*scale),\
+                            maxLineGap=max(1, maxLineGap*scale))
+    return fa.line_orientation.LineSet(lines)
+
+def _data_bar_check(gray, y_min=713, y_max=750, x_min=5, x_max=190, y_min_bar=730,\
+                    y_max_bar=760, x_min_bar=5, x_max_bar=190, threshold=25,\
+                    minLineLength=25, maxLineGap=10):
+    """
+    Checks the data bar of the full resolution grayscale frame without OCR:
+    the area of the number has some text (pixels far from the background) in
+    it, and a scale
+    bar is found as scale.get_number_of_pixels_in_scale_bar finds it.
+    Returns (passed, length of the scale bar in pixels or nan).
+    """
+    if gray.shape[0] < max(y_max, y_max_bar):
+        return False, np.nan
+    text = gray[y_min:y_max, x_min:x_max]
+    ink = np.mean(np.abs(text.astype(int) - np.median(text)) > 64)
+    scale_bar = gray[y_min_bar:y_max_bar, x_min_bar:x_max_bar]
+    edges = cv2.Canny(scale_bar, threshold1=125, threshold2=255, apertureSize=5)
+    lines = cv2.HoughLinesP(edges, rho=1, theta=np.pi/180, threshold=threshold,\
+                            minLineLength=minLineLength, maxLineGap=maxLineGap)
+    if lines is None:
+        return False, np.nan
+    length = float(np.max(lines[:,0,2] - lines[:,0,0]))
+    return bool(0.005 < ink < 0.5 and length > 0), length
+
+def screen_image(filename, suffixes=('_line1',), line_color='r', scale=0.5,\
+                 data_bar_top=690, threshold=100, minLineLength=100, maxLineGap=10,\
+                 ori_l=0, ori_u=50, min_lines=3, min_intersections=4, pix_size=None):
+    """
+    Parameters
+    ----------
+    filename : str
+        File name of the image without extension, e.g. '33deg_029'.
+    suffixes : tuple, optional
+        Suffixes of the annotated images the analysis needs, e.g. ('_line2',)
+        or ('_line_1', '_line_2'). The intersections are found with the line
+        of the last one. The default is ('_line1',).
+    line_color : str, optional
+        Color of the annotation lines, 'r' or 'k'. The default is 'r'.
+    scale : float, optional
+        Downsampling factor of the frames. The fingers should stay a couple of
+        pixels wide in the downsampled frame. The default is 0.5.
+    data_bar_top : int, optional
+        y coordinate of top of data bar area. The default is 690.
+    threshold, minLineLength, maxLineGap : int, optional
+        Hough parameters of the finger orientation at full resolution (as
+        threshold_beta, ... of batch_get_a_b_p); they are scaled with scale.
+    ori_l, ori_u : float, optional
+        Range of the finger orientations (deg). The default is 0 to 50.
+    min_lines, min_intersections : int, optional
+        Minimum numbers of finger lines in the range and of intersections of
+        the edges with the line for the image to pass. The defaults are 3 and 4.
+    pix_size : float, optional
+        Pixel size (μm) of the full resolution image, e.g. nominal. If None,
+        the rough widths are given in pixels of the full resolution image.
+
+    Returns
+    -------
+    Dictionary of the checks (see CHECKS), 'passed', the 'reason' the image
+    failed, and rough metrics: number of finger lines, 'beta' and 'alpha'
+    (deg), number of intersections, median wire width, finger width and
+    period along the line, and the scale bar length (pixels).
+
+    """
+    result = {check: False for check in CHECKS}
+    result.update({'passed': False, 'reason': '', 'n_lines': 0, 'beta': np.nan,\
+                   'alpha': np.nan, 'n_intersections': 0, 'wire_width': np.nan,\
+                   'finger_width': np.nan, 'period': np.nan, 'scale_bar_pixels': np.nan})
+    def failed(reason):
+        result['reason'] = reason
+        return result
+    with fa.instrument.stage('imread'):
+        gray = fa.pipeline.imread(filename+'.tif', 0) if os.path.isfile(filename+'.tif') else None
+    if gray is None:
+        return failed('image not readable')
+    result['readable'] = True
+    small = _downsample(gray[:data_bar_top,:], scale)
+    # Finger orientation (as line_orientation.detect_lines)
+    k = _odd(7*scale)
+    binary = cv2.threshold(cv2.GaussianBlur(small, (k,k), 0), 0, 255,\
+                           cv2.THRESH_BINARY+cv2.THRESH_OTSU)[1]
+    with fa.instrument.stage('hough'):
+        lines = _hough(cv2.Canny(binary, 50, 200, apertureSize=5), threshold,\
+                       minLineLength, maxLineGap, scale)
+    lines = lines.select(ori_l, ori_u)
+    result['n_lines'] = len(lines)
+    result['beta'] = lines.mean_angle(weighted=False)
+    result['fingers'] = len(lines) >= min_lines
+    # Data bar (full resolution, it is small)
+    result['data_bar'], result['scale_bar_pixels'] = _data_bar_check(gray)
+    # Annotation lines (as fingers.get_line_drawn_in_img)
+    line = None
+    for suffix in suffixes:
+        path = filename+suffix+'.tif'
+        img = fa.pipeline.imread(path, 1) if os.path.isfile(path) else None
+        if img is None:
+            return failed('missing annotation {}'.format(suffix))
+        img = img[:data_bar_top]
+        if line_color == 'r':
+            mask = img[:,:,2] == 255
+        else:
+            mask = np.all(img == 0, axis=2)
+        if not mask.any():
+            return failed('no line in annotation {}'.format(suffix))
+        # any line pixel in the area of a downsampled pixel is kept
+        line = _downsample(mask.astype(np.uint8)*255, scale) > 0
+    result['annotation'] = True
+    line_lines = _hough(cv2.Canny(line.astype(np.uint8)*255, 100, 200, apertureSize=7),\
+                        100, 100, 5, scale)
+    result['alpha'] = line_lines.mean_angle(weighted=False)
+    # Edges and their intersections with the line (as get_edges_in_img and
+    # get_coords_intersections)
+    from skimage import feature
+    with fa.instrument.stage('canny'):
+        edges = feature.canny(binary)
+    sorted_df = fa.fingers.get_coords_intersections(edges, line)
+    result['n_intersections'] = len(sorted_df)
+    result['intersections'] = len(sorted_df) >= min_intersections
+    if len(sorted_df) >= 4:
+        pixel = (1 if pix_size is None else pix_size)/scale
+        result['wire_width'] = float(fa.fingers.get_wire_widths_along_line(sorted_df, pixel).median().iloc[0])
+        result['finger_width'] = float(fa.fingers.get_finger_widths_along_line(sorted_df, pixel).median().iloc[0])
+        result['period'] = float(fa.fingers.get_finger_periods_along_line(sorted_df, pixel).median().iloc[0])
+    reasons = [check for check in CHECKS if result[check] == False]
+    result['passed'] = len(reasons) == 0
+    result['reason'] = '' if len(reasons) == 0 else 'failed ' + ', '.join(reasons)
+    return result
+
+@fa.instrument.instrumented
+def screen_folder(base_name, img_num_list, zeropad=3, prefetch=2, n_workers=1, **kwargs):
+    """
+    Screens the images base_name + number (see screen_image for kwargs), with
+    the next images decoded while the current one is screened. Returns a
+    pandas data frame with one row per image (index: image name).
+    """
+    filename_list = fa.batch.create_filename_list(base_name, img_num_list, zeropad)
+    suffixes = kwargs.get('suffixes', ('_line1',))
+    def compute(name, pix_size):
+        fa.instrument.set_image(name)
+        try:
+            return screen_image(name, **kwargs)
+        except Exception as e: # e.g. a corrupted file
+            return {'readable': False, 'passed': False,\
+                    'reason': '{}: {}'.format(type(e).__name__, e)}
+    files = lambda name: [(name+'.tif', 0)] + [(name+suffix+'.tif', 1) for suffix in suffixes]
+    results = fa.batch._run_images(filename_list, compute, files, prefetch=prefetch,\
+                                   n_workers=n_workers)
+    fa.instrument.set_image(None)
+    df = pd.DataFrame(results, index=pd.Index(filename_list, name='image'))
+    return df.reindex(columns=list(CHECKS) + [column for column in df.columns\
+                                              if column not in CHECKS])
+
+def refine(screened, batch_function, base_name, zeropad=3, **kwargs):
+    """
+    Runs batch_function (e.g. fa.batch_get_a_b_p) at full resolution on the
+    images of screened (the data frame of screen_folder) that passed, with
+    the arguments kwargs. Returns its results, or None if no image passed.
+    """
+    names = screened.index[screened.passed == True]
+    img_num_list = [int(name[len(base_name):]) for name in names]
+    if len(img_num_list) == 0:
+        return None
+    return batch_function(base_name, img_num_list, zeropad=zeropad, **kwargs)
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:05:06 2026
+
+@author: yoonahshin
+
+Local analysis service. A long-lived server process keeps OpenCV,
+scikit-image and pytesseract loaded, a pool of worker threads, and caches of
+the decoded images and of the pixel sizes read with OCR shared by all its
+clients, so that notebooks and scripts (and several users of the same
+machine) do not import the libraries and decode and OCR the same images again
+and again. Start it with
+
+    python -m finger_analysis.service --workers 4
+
+and make the functions of the package run in it with
+
+    with fa.service.use_service():
+        fa.batch_get_a_b_p('33deg_', [28, 29, 34], ...)
+
+The server listens on a Unix socket (localhost TCP on other systems), and
+only accepts clients that know the key it writes to a file readable by its
+user only.
+"""
+import os
+import sys
+import stat
+import pickle
+import socket
+import time
+import inspect
+import argparse
+import threading
+import functools
+import contextlib
+import contextvars
+import collections
+import multiprocessing.connection
+import finger_analysis as fa
+
+# Functions that can be run in the service ('module.function')
+FUNCTIONS = ('batch.batch_get_a_b_p', 'batch.batch_get_propagation_distance',\
+             'batch.batch_new_method_propagation_distance',\
+             'batch.batch_get_propagation_direction',\
+             'line_orientation.get_finger_orientation', 'line_orientation.get_finger_lines',\
+             'scale.extract_pixel_size',\
+             'scale.get_pixel_size')
+
+SERVICE_DIR = os.path.join(os.path.expanduser('~'), '.finger_analysis')
+
+# Address of the service used by the decorated functions (see use_service)
+_address = contextvars.ContextVar('service_address', default=None)
+# True in the server process, whose functions never forward their calls
+_serving = False
+
+def default_address():
+    """
+    Address of the service: the environment variable FINGER_ANALYSIS_SERVICE
+    (a socket path, or host:port), otherwise ~/.finger_analysis/service.sock
+    (localhost:6070 where Unix sockets are not available).
+    """
+    address = os.environ.get('FINGER_ANALYSIS_SERVICE')
+    if address is None:
+        if hasattr(socket, 'AF_UNIX'):
+            return os.path.join(SERVICE_DIR, 'service.sock')
+        return ('localhost', 6070)
+    if ':' in address and not os.sep in address:
+        host, port = address.rsplit(':', 1)
+        return (host, int(port))
+    return address
+
+def _key_path(address):
+    if isinstance(address, tuple):
+        return os.path.join(SERVICE_DIR, 'service-{}-{}.key'.format(*address))
+    return address + '.key'
+
+def _write_key(address):
+    key = os.urandom(32)
+    path = _key_path(address)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.S_IRUSR | stat.S_IWUSR)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+def _read_key(address):
+    path = _key_path(address)
+    if not os.path.isfile(path):
+        raise ConnectionError('No finger_analysis service at {} (start one with '
+                              'python -m finger_analysis.service)'.format(address))
+    with open(path, 'rb') as f:
+        return f.read()
+
+class ImageCache:
+    """
+    Shared cache of decoded images, used by pipeline.imread like a pack (see
+    pack.py): get decodes the image on the first request and keeps it, read
+    only, until the file changes or the cache exceeds max_bytes.
+    """
+    def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, flags=1):
+        import cv2
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (os.path.abspath(path), flags)
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None and entry[0] == (st.st_mtime_ns, st.st_size):
+                self._images.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        with fa.instrument.stage('imread'):
+            img = cv2.imread(path, flags)
+        if img is None:
+            return None
+        img.setflags(write=False)
+        with self._lock:
+            self.misses += 1
+            old = self._images.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1].nbytes
+            self._images[key] = ((st.st_mtime_ns, st.st_size), img)
+            self.bytes += img.nbytes
+            while self.bytes > self.max_bytes and len(self._images) > 1:
+                self.bytes -= self._images.popitem(last=False)[1][1].nbytes
+        return img
+
+def _memoized(func, cache, lock):
+    # Pixel sizes read with OCR, keyed by the image file (path, modification
+    # time, size) and the arguments; calls showing figures are not cached
+    signature = inspect.signature(inspect.unwrap(func))
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        if any(name.startswith('show') and value == True for name, value in arguments.items()):
+            return func(*args, **kwargs)
+        path = os.path.abspath(arguments.pop('filename') + '.tif')
+        try:
+            st = os.stat(path)
+        except OSError:
+            return func(*args, **kwargs)
+        key = (func.__name__, path, st.st_mtime_ns, st.st_size, tuple(sorted(arguments.items())))
+        with lock:
+            if key in cache:
+                return cache[key]
+        result = func(*args, **kwargs)
+        with lock:
+            cache[key] = result
+        return result
+    return wrapper
+
+class _WorkingDirectories:
+    """
+    The file names in the requests are relative to the working directory of
+    the client. Requests from the same directory run at the same time; a
+    request from another directory waits until they are done.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._directory = None
+        self._active = 0
+
+    @contextlib.contextmanager
+    def use(self, directory):
+        with self._condition:
+            while self._active > 0 and self._directory != directory:
+                self._condition.wait()
+            if self._active == 0:
+                os.chdir(directory)
+                self._directory = directory
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+def _function(name):
+    if name not in FUNCTIONS:
+        raise ValueError('{} cannot be run in the service'.format(name))
+    module, func = name.split('.')
+    return getattr(getattr(fa, module), func)
+
+def serve(address=None, n_workers=4, cache_bytes=2**30, ready=None):
+    """
+    Parameters
+    ----------
+    address : str or tuple, optional
+        Path of the Unix socket, or (host, port). The default is
+        default_address().
+    n_workers : int, optional
+        Number of requests run at the same time. The default is 4.
+    cache_bytes : int, optional
+        Maximum size of the decoded images kept in memory. The default is 1 GiB.
+    ready : function, optional
+        Called with the address once the service accepts connections (e.g.
+        main prints it). The default is None.
+
+    Returns
+    -------
+    None. Serves requests until a client calls shutdown() or Ctrl-C.
+
+    """
+    global _serving
+    _serving = True
+    if address is None:
+        address = default_address()
+    # Warm up: import the heavy libraries once
+    import cv2, matplotlib
+    matplotlib.use('Agg')
+    from skimage import feature, measure
+    try:
+        fa.scale._get_pytesseract()
+    except ImportError:
+        pass # reported by the requests that need OCR
+    images = ImageCache(cache_bytes)
+    fa.pipeline._packs.append(images)
+    ocr_cache = {}
+    ocr_lock = threading.Lock()
+    for func in ('get_pixel_size', 'extract_pixel_size'):
+        setattr(fa.scale, func, _memoized(getattr(fa.scale, func), ocr_cache, ocr_lock))
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address) # socket left by a server that did not shut down
+    key = _write_key(address)
+    listener = multiprocessing.connection.Listener(address, authkey=key)
+    if isinstance(address, str):
+        os.chmod(address, stat.S_IRUSR | stat.S_IWUSR)
+    workers = threading.Semaphore(n_workers)
+    directories = _WorkingDirectories()
+    started = time.time()
+    stop = threading.Event()
+    counts = collections.Counter()
+    counts_lock = threading.Lock() # the requests are counted by the handler threads
+
+    def stats():
+        with counts_lock:
+            requests = dict(counts)
+        return {'pid': os.getpid(), 'uptime': time.time() - started,\
+                'n_workers': n_workers, 'requests': requests,\
+                'cached_images': len(images._images), 'cached_bytes': images.bytes,\
+                'image_hits': images.hits, 'image_misses': images.misses,\
+                'cached_pixel_sizes': len(ocr_cache)}
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                command = request.get('command')
+                try:
+                    if command == 'call':
+                        func = _function(request['function'])
+                        with workers, directories.use(request['cwd']):
+                            result = func(*request['args'], **request['kwargs'])
+                        with counts_lock:
+                            counts[request['function']] += 1
+                        conn.send(('ok', result))
+                    elif command == 'stats':
+                        conn.send(('ok', stats()))
+                    elif command == 'shutdown':
+                        conn.send(('ok', None))
+                        stop.set()
+                        # wake up the accept call
+                        multiprocessing.connection.Client(address, authkey=key).close()
+                        return
+                    else:
+                        raise ValueError('unknown command {}'.format(command))
+                except Exception as e:
+                    # exceptions that cannot be rebuilt by the client (e.g.
+                    # of libraries it does not have) are sent as RuntimeError
+                    try:
+                        pickle.loads(pickle.dumps(e))
+                    except Exception:
+                        e = RuntimeError('{}: {}'.format(type(e).__name__, e))
+                    conn.send(('error', e))
+
+    try:
+        if ready is not None:
+            ready(address)
+        while not stop.is_set():
+            try:
+                conn = listener.accept()
+            except (multiprocessing.AuthenticationError, OSError):
+                continue
+            if stop.is_set():
+                conn.close()
+                break
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        fa.pipeline._packs.remove(images)
+        if os.path.exists(_key_path(address)):
+            os.remove(_key_path(address))
+    return None
+
+class ServiceClient:
+    """
+    Connection to the service at address (the default is default_address()).
+    call('batch.batch_get_a_b_p', '33deg_', [28, 29], ...) runs the function
+    in the service with the file names relative to the current working
+    directory, and returns its result or raises its exception.
+    """
+    def __init__(self, address=None):
+        if address is None:
+            address = default_address()
+        self.address = address
+        self._conn = multiprocessing.connection.Client(address, authkey=_read_key(address))
+
+    def _request(self, request):
+        self._conn.send(request)
+        status, result = self._conn.recv()
+        if status == 'error':
+            raise result
+        return result
+
+    def call(self, function, *args, **kwargs):
+        return self._request({'command': 'call', 'function': function, 'args': args,\
+                              'kwargs': kwargs, 'cwd': os.getcwd()})
+
+    def stats(self):
+        """
+        Returns a dictionary of the state of the service (requests served,
+        cached images and pixel sizes, ...).
+        """
+        return self._request({'command': 'stats'})
+
+    def shutdown(self):
+        """
+        Stops the service.
+        """
+        return self._request({'command': 'shutdown'})
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def connect(address=None):
+    """
+    Returns a ServiceClient connected to the service at address.
+    """
+    return ServiceClient(address)
+
+@contextlib.contextmanager
+def use_service(address=None):
+    """
+    Context manager making the functions listed in FUNCTIONS run in the
+    service at address instead of in this process, with the same arguments
+    and results. Calls showing figures still run in this process.
+    """
+    if address is None:
+        address = default_address()
+    token = _address.set(address)
+    try:
+        yield
+    finally:
+        _address.reset(token)
+
+def remote(func):
+    """
+    Decorator forwarding the calls of the function to the service while
+    use_service is active.
+    """
+    name = '{}.{}'.format(func.__module__.split('.')[-1], func.__name__)
+    signature = inspect.signature(inspect.unwrap(func))
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        address = _address.get()
+        if address is None or _serving == True:
+            return func(*args, **kwargs)
+        arguments = signature.bind(*args, **kwargs).arguments
+        if any(arg.startswith('show') and value == True for arg, value in arguments.items()):
+            return func(*args, **kwargs)
+        with ServiceClient(address) as client:
+            return client.call(name, *args, **kwargs)
+    return wrapper
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the finger_analysis analysis service.')
+    parser.add_argument('--address', default=None,\
+                        help='socket path or host:port (default: ~/.finger_analysis/service.sock)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--cache-mb', type=int, default=1024)
+    args = parser.parse_args(argv)
+    if args.address is not None:
+        os.environ['FINGER_ANALYSIS_SERVICE'] = args.address
+    serve(default_address(), args.workers, args.cache_mb*2**20,\
+          ready=lambda address: print('finger_analysis service listening on {} ({} workers)'\
+                                      .format(address, args.workers), flush=True))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
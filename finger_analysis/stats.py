@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:24:44 2026
+
+@author: yoonahshin
+
+Confidence intervals of the mean and standard deviation of every metric by
+clustered bootstrap: the images of a condition, not the measurements, are
+resampled with replacement, since the measurements of one image (e.g. the
+widths of neighbouring fingers) are not independent. All the conditions and
+metrics are resampled together: one matrix of image indices gives the
+number of times every image is drawn in every resample, and the sums of the
+resamples are computed from the sums per image, so the measurements
+themselves are never resampled.
+
+    ci = fa.stats.bootstrap_ci({(120, 33, 6, '2'): fa.batch_get_a_b_p('33deg_', range(1, 44), suffix='_line2'),
+                                (120, 40, 6, '2'): fa.batch_get_a_b_p('40deg_', range(1, 31), suffix='_line2')},
+                               names=['h', 'alpha', 't', 'l'])
+    ci = fa.stats.bootstrap_stored_results('results')
+"""
+import warnings
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+# Maximum number of (resample, image, metric) cells computed at once; the
+# resamples are drawn in chunks so that the memory used stays bounded
+_MAX_CELLS = 2**22
+
+def _frame_to_long(df):
+    # data frame returned by a batch function (indexed by image name and
+    # measurement number) -> columns image, metric, value
+    flat = pd.DataFrame(df.to_numpy(), columns=df.columns)
+    flat.insert(0, 'image', df.index.get_level_values(0).astype(str))
+    return flat.melt(id_vars='image', var_name='metric', value_name='value')
+
+def results_to_long(results, names=None):
+    """
+    Long data frame (columns: *names, image, metric, value, without nan) of
+    the results of the batch functions. results is one data frame, a tuple of
+    data frames (as returned by batch_get_a_b_p), or a dictionary of
+    condition -> data frame or tuple, where condition is a tuple of values
+    of the columns names (e.g. (h, alpha, t, l)) or a single value.
+    """
+    if not isinstance(results, dict):
+        results = {None: results}
+        names = []
+    elif names is None:
+        n_levels = max(len(key) if isinstance(key, tuple) else 1 for key in results)
+        names = ['condition'] if n_levels == 1 else\
+            ['condition_{}'.format(i) for i in range(n_levels)]
+    long_dfs = []
+    for key, frames in results.items():
+        if isinstance(frames, pd.DataFrame):
+            frames = (frames,)
+        values = key if isinstance(key, tuple) else (key,)
+        for frame in frames:
+            long_df = _frame_to_long(frame)
+            for name, value in reversed(list(zip(names, values))):
+                long_df.insert(0, name, value)
+            long_dfs.append(long_df)
+    long_df = pd.concat(long_dfs, ignore_index=True)
+    long_df['value'] = pd.to_numeric(long_df['value'], errors='coerce')
+    return long_df[long_df.value.notna()].reset_index(drop=True)
+
+def bootstrap_long(long_df, by, n_resamples=2000, confidence=0.95, seed=None):
+    """
+    Parameters
+    ----------
+    long_df : pandas.DataFrame
+        Long data frame with the columns by, image, metric and value (see
+        results_to_long and aggregate.stored_results_long).
+    by : list
+        Columns defining a condition. The images of a condition are resampled
+        together for all its metrics. Missing values (None or nan) are kept
+        as a condition of their own.
+    n_resamples : int, optional
+        Number of bootstrap resamples. The default is 2000.
+    confidence : float, optional
+        Confidence level of the intervals. The default is 0.95.
+    seed : int, optional
+        Seed of the resampling.
+
+    Returns
+    -------
+    A data frame indexed by (*by, metric) with the number of measurements
+    and images, and for the mean and the standard deviation of the
+    measurements: the value, the lower and upper bounds of the percentile
+    confidence interval and the bootstrap standard error, e.g. mean,
+    mean_ci_low, mean_ci_high, mean_se. The intervals are nan for the
+    conditions with a single image.
+
+    """
+    by = list(by)
+    df = long_df[by + ['image', 'metric', 'value']].copy()
+    df['square'] = df.value**2
+    # sums per image: one row per (condition, image), one column per metric
+    sums = df.groupby(by + ['image', 'metric'], sort=True, observed=True, dropna=False)\
+        .agg(s=('value', 'sum'), q=('square', 'sum'), n=('value', 'count')).unstack('metric')
+    metrics = list(sums['s'].columns)
+    s = sums['s'].to_numpy(dtype=float, na_value=0)
+    q = sums['q'].to_numpy(dtype=float, na_value=0)
+    n = sums['n'].to_numpy(dtype=float, na_value=0)
+    clusters = sums.index.to_frame(index=False)
+    # the images of a condition are contiguous rows
+    condition = clusters.groupby(by, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    start = np.flatnonzero(np.r_[True, condition[1:] != condition[:-1]])
+    n_images = np.diff(np.r_[start, len(condition)])
+    n_clusters, n_metrics = s.shape
+
+    def statistics(s_c, q_c, n_c):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = s_c/n_c
+            std = np.sqrt(np.maximum(q_c - s_c*mean, 0)/(n_c - 1))
+        mean[n_c == 0] = np.nan
+        std[n_c < 2] = np.nan
+        return mean, std
+
+    rng = np.random.default_rng(seed)
+    offset = start[condition]
+    size = n_images[condition]
+    chunk = max(1, _MAX_CELLS//max(1, n_clusters*n_metrics))
+    means, stds = [], []
+    for first in range(0, n_resamples, chunk):
+        b = min(chunk, n_resamples - first)
+        # index matrix: column j draws an image of the condition of image j,
+        # so every condition is resampled with as many images as it has
+        index = offset + (rng.random((b, n_clusters))*size).astype(np.int64)
+        counts = np.bincount((index + n_clusters*np.arange(b)[:, np.newaxis]).ravel(),\
+                             minlength=b*n_clusters).reshape(b, n_clusters).astype(float)
+        # sums of every resample for every condition and metric: (b, conditions, metrics)
+        totals = [np.add.reduceat(counts[:, :, np.newaxis]*x[np.newaxis], start, axis=1)\
+                  for x in (s, q, n)]
+        mean, std = statistics(*totals)
+        means.append(mean)
+        stds.append(std)
+    mean_estimate, std_estimate = statistics(*[np.add.reduceat(x, start, axis=0) for x in (s, q, n)])
+    alpha = (1 - confidence)/2
+    index = pd.MultiIndex.from_frame(clusters[by].iloc[start].reset_index(drop=True))
+    columns = {'count': np.add.reduceat(n, start, axis=0),\
+               'images': np.add.reduceat((n > 0).astype(float), start, axis=0)}
+    for name, estimate, resampled in (('mean', mean_estimate, means), ('std', std_estimate, stds)):
+        resampled = np.concatenate(resampled, axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning) # all-nan slices
+            low, high = np.nanquantile(resampled, [alpha, 1 - alpha], axis=0)
+            se = np.nanstd(resampled, axis=0, ddof=1)
+        single = (columns['images'] < 2)
+        low[single] = high[single] = se[single] = np.nan
+        columns[name] = estimate
+        columns[name+'_ci_low'] = low
+        columns[name+'_ci_high'] = high
+        columns[name+'_se'] = se
+    result = pd.concat({name: pd.DataFrame(value, index=index, columns=metrics)\
+                        .rename_axis(columns='metric').stack()\
+                        for name, value in columns.items()}, axis=1)
+    result = result[result['count'] > 0]
+    result['count'] = result['count'].astype(np.int64)
+    result['images'] = result['images'].astype(np.int64)
+    return result
+
+def bootstrap_ci(results, names=None, n_resamples=2000, confidence=0.95, seed=None):
+    """
+    Clustered bootstrap confidence intervals of the results of the batch
+    functions (see results_to_long for results and names, and bootstrap_long
+    for the rest). Returns a data frame indexed by (*names, metric).
+    """
+    long_df = results_to_long(results, names)
+    by = [col for col in long_df.columns if col not in ('image', 'metric', 'value')]
+    if len(by) == 0: # a single condition
+        long_df.insert(0, 'condition', '')
+        return bootstrap_long(long_df, ['condition'], n_resamples, confidence, seed)\
+            .droplevel('condition')
+    return bootstrap_long(long_df, by, n_resamples, confidence, seed)
+
+def bootstrap_stored_results(store_dir, datasets=None, filters=None,\
+                             by=('h', 'alpha', 't', 'l', 'suffix'), n_resamples=2000,\
+                             confidence=0.95, seed=None, file_format='parquet'):
+    """
+    Clustered bootstrap confidence intervals of every metric of every data set
+    and condition of the result store (see store.py), the counterpart of
+    aggregate.aggregate_results. Returns a data frame indexed by
+    (dataset, *by, metric) (see bootstrap_long).
+    """
+    long_df = fa.aggregate.stored_results_long(store_dir, datasets, filters, file_format)
+    return bootstrap_long(long_df, ['dataset'] + list(by), n_resamples, confidence, seed)
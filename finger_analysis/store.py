@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:05:12 2026
+
+@author: yoonahshin
+"""
+import os
+import glob
+import uuid
+import datetime
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+# Columns describing the experimental condition of each stored row
+CONDITION_COLUMNS = ['h', 'alpha', 't', 'l', 'suffix']
+# Columns holding the (image name, measurement number) index of the data frames
+# returned by the batch functions
+INDEX_COLUMNS = ['image', 'measurement']
+
+def _import_pyarrow():
+    """
+    pyarrow is an optional dependency (pip install finger_analysis[store]).
+    Returns the pyarrow.dataset module.
+    """
+    try:
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ImportError("The result store needs pyarrow. "
+                          "Install it with 'pip install pyarrow'.")
+    return ds
+
+def results_to_table(df, h, alpha, t, l, suffix=''):
+    """
+    Flattens a data frame returned by one of the batch functions (i.e. indexed
+    by image name and measurement number) into a flat data frame with the
+    index and the experimental condition as typed columns.
+    """
+    flat = df.copy()
+    flat.index = flat.index.set_names(INDEX_COLUMNS[:flat.index.nlevels])
+    flat = flat.reset_index()
+    if 'image' in flat.columns:
+        flat['image'] = flat['image'].astype(str)
+    if 'measurement' in flat.columns:
+        flat['measurement'] = flat['measurement'].astype(np.int64)
+    flat.insert(0, 'suffix', str(suffix))
+    flat.insert(0, 'l', str(l))
+    flat.insert(0, 't', float(t))
+    flat.insert(0, 'alpha', float(alpha))
+    flat.insert(0, 'h', float(h))
+    return flat
+
+def append_results(store_dir, dataset, df, h, alpha, t, l, suffix='',\
+                   file_format='parquet'):
+    """
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the result store. It is created if it does not exist.
+    dataset : str
+        Name of the data set within the store, e.g. 'wire_width'. Each data set
+        is a directory of files sharing the same columns.
+    df : DataFrame
+        Data frame returned by one of the batch functions.
+    h, alpha, t, l, suffix :
+        Experimental condition: initial film thickness (nm), initial edge
+        orientation (deg), annealing time (hour), label of the patch and the
+        suffix of the annotated images.
+    file_format : str, optional
+        'parquet' or 'feather'. The default is 'parquet'.
+
+    Returns
+    -------
+    Path of the written file. Every call writes a new file in the data set
+    directory, so appending never rewrites the results stored before.
+
+    """
+    _import_pyarrow()
+    import pyarrow as pa
+    directory = os.path.join(store_dir, dataset)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    flat = results_to_table(df, h, alpha, t, l, suffix)
+    stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    name = 'part-{}-{}.{}'.format(stamp, uuid.uuid4().hex[:8], file_format)
+    path = os.path.join(directory, name)
+    table = pa.Table.from_pandas(flat, preserve_index=False)
+    # Write to a temporary file first, so that readers never see a partial file
+    tmp_path = os.path.join(directory, '.' + name + '.tmp')
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, tmp_path)
+    elif file_format == 'feather':
+        import pyarrow.feather as feather
+        feather.write_feather(table, tmp_path)
+    else:
+        raise ValueError("file_format must be 'parquet' or 'feather'")
+    os.replace(tmp_path, path)
+    return path
+
+def replace_results(store_dir, dataset, df, h, alpha, t, l, suffix='',\
+                    file_format='parquet'):
+    """
+    Same as append_results, but the results stored before for the same
+    experimental condition are removed, e.g. to update the results of a
+    condition as new images of it are analyzed. The new file is written
+    before the old rows are removed, and the older files are rewritten
+    atomically without the rows of the condition (or deleted if nothing else
+    is left in them). Returns the path of the written file.
+    """
+    ds = _import_pyarrow()
+    directory = os.path.join(store_dir, dataset)
+    old_files = sorted(glob.glob(os.path.join(directory, 'part-*.{}'.format(file_format))))
+    path = append_results(store_dir, dataset, df, h, alpha, t, l, suffix, file_format)
+    condition = _filter_expression({'h': float(h), 'alpha': float(alpha), 't': float(t),\
+                                    'l': str(l), 'suffix': str(suffix)})
+    for old_file in old_files:
+        data = ds.dataset(old_file, format=file_format)
+        if data.count_rows(filter=condition) == 0:
+            continue
+        kept = data.to_table(filter=~condition)
+        if kept.num_rows == 0:
+            os.remove(old_file)
+            continue
+        tmp_path = os.path.join(directory, '.' + os.path.basename(old_file) + '.tmp')
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(kept, tmp_path)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(kept, tmp_path)
+        os.replace(tmp_path, old_file)
+    return path
+
+def _filter_expression(filters):
+    """
+    Converts a dictionary of filters, for example {'h': 120, 'alpha': [20, 33]},
+    into a pyarrow expression. A list (or tuple) of values matches any of them.
+    """
+    ds = _import_pyarrow()
+    expression = None
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple, set, np.ndarray)):
+            term = ds.field(column).isin(list(value))
+        else:
+            term = ds.field(column) == value
+        expression = term if expression is None else expression & term
+    return expression
+
+def read_results(store_dir, dataset, columns=None, filters=None,\
+                 file_format='parquet', restore_index=False):
+    """
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the result store.
+    dataset : str
+        Name of the data set within the store, e.g. 'wire_width'.
+    columns : list, optional
+        Columns to read. The default is all the columns. Only the requested
+        columns are read from disk.
+    filters : dict, optional
+        Dictionary of column name to value (or list of values), for example
+        {'h': 120, 'alpha': [20, 33], 't': 6}. The filters are pushed down to
+        the reader, so row groups that do not match are skipped.
+    file_format : str, optional
+        'parquet' or 'feather'. The default is 'parquet'.
+    restore_index : bool, optional
+        If True, sets the (image, measurement) index back, so that the result
+        looks like the data frame returned by the batch function.
+
+    Returns
+    -------
+    pandas data frame of the stored results.
+
+    """
+    ds = _import_pyarrow()
+    directory = os.path.join(store_dir, dataset)
+    if not os.path.isdir(directory):
+        return pd.DataFrame(columns=columns)
+    # Only the files written by append_results are read (e.g. an exported excel
+    # file saved in the same directory is skipped)
+    files = sorted(glob.glob(os.path.join(directory, 'part-*.{}'.format(file_format))))
+    if len(files) == 0:
+        return pd.DataFrame(columns=columns)
+    data = ds.dataset(files, format=file_format)
+    expression = None if filters is None else _filter_expression(filters)
+    table = data.to_table(columns=columns, filter=expression)
+    df = table.to_pandas()
+    if restore_index == True and set(INDEX_COLUMNS).issubset(df.columns):
+        df = df.set_index(INDEX_COLUMNS)
+        df.index.names = [None, None]
+    return df
+
+def list_datasets(store_dir):
+    """
+    Returns a sorted list of the names of the data sets in the result store.
+    """
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(name for name in os.listdir(store_dir)\
+                  if os.path.isdir(os.path.join(store_dir, name)))
+
+def metric_columns(df):
+    """
+    Returns the list of columns of a stored data frame that are measurements,
+    i.e. neither the experimental condition nor the index columns.
+    """
+    return [col for col in df.columns\
+            if col not in CONDITION_COLUMNS and col not in INDEX_COLUMNS]
+
+def export_results_to_excel(store_dir, dataset, filename, filters=None,\
+                            DirectoryName=None, file_format='parquet'):
+    """
+    Reads the results in the data set that match the filters and saves them as
+    an excel file with name filename.xlsx in the directory DirectoryName (the
+    default is the name of the data set). Excel export is only done on demand,
+    the store itself keeps the results in the columnar format.
+    """
+    df = read_results(store_dir, dataset, filters=filters, file_format=file_format)
+    if DirectoryName is None:
+        DirectoryName = dataset
+    fa.output.make_dir_and_output_df_to_excel(DirectoryName, df, filename, '')
+    return df
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:02:44 2026
+
+@author: yoonahshin
+"""
+import os
+import numpy as np
+import pandas as pd
+import cv2
+
+# Gray levels of the rendered regions
+SUBSTRATE = 70 # exposed substrate (fingers and the region outside the original edge)
+WIRE = 200 # wires between the fingers
+FILM = 185 # continuous film beyond the finger tips
+RED = (0, 0, 255) # BGR colour of the annotation lines
+
+def _unit(angle):
+    """
+    Unit vector of the given angle (deg) in image coordinates (y pointing
+    down), so that compute_angles in line_orientation.py returns the same angle
+    for a line along it.
+    """
+    return np.array([np.cos(np.deg2rad(angle)), np.sin(np.deg2rad(angle))])
+
+def _cross(a, b):
+    return a[0]*b[1] - a[1]*b[0]
+
+def render_finger_image(width=1024, height=768, data_bar_top=None, pixel_size=0.09785,\
+                        wire_width=0.75, finger_width=2.1, beta=20, alpha=-40,\
+                        propagation_distance=37, origin=None, phase=0, noise=6,\
+                        blur=1.5, scale_bar_length=10, seed=None):
+    """
+    Renders an SEM-like image of a finger and wire array with a data bar.
+
+    Parameters
+    ----------
+    width, height : int, optional
+        Size of the image in pixels. The default is 1024x768.
+    data_bar_top : int, optional
+        y coordinate of the top of the data bar. The default is 690 for a
+        768 pixel high image, scaled with the height otherwise.
+    pixel_size : float, optional
+        Pixel size (μm). The default is 0.09785 (i.e. 97.85 nm).
+    wire_width, finger_width : float, optional
+        Width of wires and fingers (μm) perpendicular to the wires.
+    beta : float, optional
+        Orientation of wires and fingers (deg) w.r.t. the x-axis.
+    alpha : float, optional
+        Orientation of the original film edge (deg) w.r.t. the x-axis.
+    propagation_distance : float, optional
+        Length of the fingers (μm) along beta, from the original edge to the tips.
+    origin : tuple, optional
+        (x, y) of a point on the original edge. The default is 30% of the width
+        and the middle of the height above the data bar.
+    phase : float, optional
+        Shift (μm) of the wire array perpendicular to the wires.
+    noise : float, optional
+        Standard deviation of the Gaussian noise added to the gray levels.
+    blur : float, optional
+        Standard deviation (pixels) of the Gaussian blur of the edges.
+    scale_bar_length : float, optional
+        Length of the scale bar (μm) drawn in the data bar. A ValueError is
+        raised if it does not fit in the width of the image.
+    seed : int, optional
+        Seed of the random noise.
+
+    Returns
+    -------
+    Tuple of (img, truth, geometry). img is a uint8 BGR image (like the images
+    read with cv2.imread). truth is a dictionary of the ground truth. geometry
+    is used by the functions drawing the annotation lines.
+
+    """
+    rng = np.random.default_rng(seed)
+    if data_bar_top is None:
+        data_bar_top = int(round(height*690/768))
+    if origin is None:
+        origin = (0.3*width, 0.5*data_bar_top)
+    origin = np.asarray(origin, dtype=float)
+    a_px = wire_width/pixel_size
+    b_px = finger_width/pixel_size
+    p_px = a_px + b_px
+    d_px = propagation_distance/pixel_size
+    d_hat = _unit(beta) # along the wires
+    n_hat = np.array([-d_hat[1], d_hat[0]]) # perpendicular to the wires
+    e_hat = _unit(alpha) # along the original edge
+    if abs(_cross(e_hat, d_hat)) < 1e-6:
+        raise ValueError('alpha and beta must not be parallel')
+
+    # Distance along the wires from the original edge (s) and position across
+    # the wires (v) of every pixel above the data bar
+    y, x = np.mgrid[0:data_bar_top, 0:width].astype(np.float32)
+    dx = x - origin[0]
+    dy = y - origin[1]
+    s = (e_hat[0]*dy - e_hat[1]*dx)/_cross(e_hat, d_hat)
+    v = dx*n_hat[0] + dy*n_hat[1] - phase/pixel_size
+    is_wire = np.mod(v, p_px) < a_px
+    gray = np.full(s.shape, SUBSTRATE, dtype=np.float32)
+    gray[(s >= 0) & (s < d_px) & is_wire] = WIRE
+    gray[s >= d_px] = FILM
+    if blur > 0:
+        gray = cv2.GaussianBlur(gray, (0, 0), blur)
+    if noise > 0:
+        gray += rng.normal(0, noise, gray.shape).astype(np.float32)
+    # Keep the gray levels below 255, so that no pixel is mistaken for a line
+    gray = np.clip(gray, 0, 240).astype(np.uint8)
+
+    img = np.zeros((height, width), dtype=np.uint8)
+    img[:data_bar_top, :] = gray
+    scale_bar_pixels = _draw_data_bar(img, data_bar_top, pixel_size, scale_bar_length)
+    img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+    theta = np.deg2rad(abs(alpha - beta))
+    truth = {'width': width, 'height': height, 'data_bar_top': data_bar_top,\
+             'pixel_size': pixel_size, 'wire_width': wire_width,\
+             'finger_width': finger_width, 'period': wire_width + finger_width,\
+             'beta': beta, 'alpha': alpha,\
+             'propagation_distance': propagation_distance,\
+             'wire_width_along_line': wire_width/abs(np.sin(theta)),\
+             'finger_width_along_line': finger_width/abs(np.sin(theta)),\
+             'period_along_line': (wire_width + finger_width)/abs(np.sin(theta)),\
+             'scale_bar_length': scale_bar_length,\
+             'scale_bar_pixels': scale_bar_pixels}
+    geometry = {'origin': origin, 'd_hat': d_hat, 'n_hat': n_hat, 'e_hat': e_hat,\
+                'a_px': a_px, 'b_px': b_px, 'p_px': p_px, 'd_px': d_px,\
+                'phase_px': phase/pixel_size, 'width': width,\
+                'data_bar_top': data_bar_top}
+    return img, truth, geometry
+
+def _draw_data_bar(img, data_bar_top, pixel_size, scale_bar_length):
+    """
+    Draws the data bar (as in the images of the Harvard CNS SEM): the stated
+    pixel size and a scale bar with its length written above it. The
+    positions and the font are those of a 1024x768 image with a 78 pixel high
+    data bar, scaled with the width and the height of the data bar. The
+    default crop areas in scale.py fit the data bar of a 1024x768 image.
+    Returns the number of pixels of the scale bar.
+    """
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    img[data_bar_top:, :] = 0
+    width = img.shape[1]
+    bar_height = img.shape[0] - data_bar_top
+    sx = width/1024
+    sy = bar_height/78
+    scale_bar_pixels = int(round(scale_bar_length/pixel_size))
+    x1 = max(1, int(round(10*sx)))
+    x2 = x1 + scale_bar_pixels
+    if x2 >= width - 1:
+        raise ValueError('the scale bar ({} pixels) does not fit in the width of '
+                         'the image ({} pixels); use a shorter scale_bar_length'\
+                         .format(scale_bar_pixels, width))
+    font_scale = 0.6*min(sx, sy)
+    y_text = data_bar_top + int(0.45*bar_height)
+    cv2.putText(img, 'Pixel Size = {:.2f} nm'.format(pixel_size*1000),\
+                (int(round(300*sx)), y_text), font, font_scale, 255, 1, cv2.LINE_AA)
+    cv2.putText(img, '{:g}'.format(scale_bar_length),\
+                (int(round(60*sx)), data_bar_top + int(round(45*sy))),\
+                font, font_scale, 255, 1, cv2.LINE_AA)
+    y_bar = data_bar_top + int(round(58*sy))
+    tick = max(1, int(round(4*sy)))
+    cv2.line(img, (x1, y_bar), (x2, y_bar), 255, 1)
+    cv2.line(img, (x1, y_bar-tick), (x1, y_bar+tick), 255, 1)
+    cv2.line(img, (x2, y_bar-tick), (x2, y_bar+tick), 255, 1)
+    return scale_bar_pixels
+
+def _inside(point, geometry, margin=5):
+    return margin <= point[0] < geometry['width'] - margin\
+        and margin <= point[1] < geometry['data_bar_top'] - margin
+
+def _point(geometry, s, v):
+    """
+    Image coordinates of the point at distance s along the wires from the
+    original edge and position v across the wires.
+    """
+    origin = geometry['origin']
+    d_hat = geometry['d_hat']
+    n_hat = geometry['n_hat']
+    e_hat = geometry['e_hat']
+    # Point on the original edge with position v across the wires
+    t = (v + geometry['phase_px'])/(e_hat @ n_hat)
+    return origin + t*e_hat + s*d_hat
+
+def _finger_centres(geometry, s_list, margin=5):
+    """
+    Positions v across the wires of the centres of all the fingers for which
+    the points at all the distances in s_list are inside the image.
+    """
+    p_px = geometry['p_px']
+    v_max = np.hypot(geometry['width'], geometry['data_bar_top'])*2
+    k = np.arange(-int(v_max/p_px) - 1, int(v_max/p_px) + 2)
+    v = k*p_px + geometry['a_px'] + geometry['b_px']/2
+    keep = [all(_inside(_point(geometry, s, vi), geometry, margin) for s in s_list) for vi in v]
+    return v[np.array(keep, dtype=bool)]
+
+def draw_a_b_p_line(img, geometry, s_fraction=0.5, thickness=2):
+    """
+    Draws a red line parallel to the original edge across the fingers (at
+    s_fraction of the propagation distance from the edge), as used by
+    batch_get_a_b_p. Both ends of the line are in the middle of a finger.
+    Returns the image with the line drawn.
+    """
+    img = img.copy()
+    s = s_fraction*geometry['d_px']
+    v = _finger_centres(geometry, [s], margin=10)
+    if len(v) < 2:
+        raise ValueError('the image is too small for the finger period')
+    p1 = _point(geometry, s, v.min())
+    p2 = _point(geometry, s, v.max())
+    cv2.line(img, tuple(int(round(c)) for c in p1), tuple(int(round(c)) for c in p2),\
+             RED, thickness)
+    return img
+
+def draw_propagation_lines(img, geometry, overshoot=10, thickness=2):
+    """
+    Draws the two annotations used by batch_get_propagation_distance:
+    line_1 along the original edge, and line_2 along the centre of every
+    finger that is fully inside the image, from just before the original edge
+    to just past the tip. Returns the tuple of images (line_1, line_2).
+    """
+    d_px = geometry['d_px']
+    v = _finger_centres(geometry, [-overshoot, d_px + overshoot], margin=5)
+    img_1 = img.copy()
+    p1 = _point(geometry, 0, v.min() - geometry['p_px'])
+    p2 = _point(geometry, 0, v.max() + geometry['p_px'])
+    cv2.line(img_1, tuple(int(round(c)) for c in p1), tuple(int(round(c)) for c in p2),\
+             RED, thickness)
+    img_2 = img.copy()
+    for vi in v:
+        p1 = _point(geometry, -overshoot, vi)
+        p2 = _point(geometry, d_px + overshoot, vi)
+        cv2.line(img_2, tuple(int(round(c)) for c in p1), tuple(int(round(c)) for c in p2),\
+                 RED, thickness)
+    return img_1, img_2
+
+def write_synthetic_dataset(directory, n_images, base_name='synth_', start=1,\
+                            zeropad=3, annotations=True, jitter=0.05, seed=0,\
+                            **kwargs):
+    """
+    Parameters
+    ----------
+    directory : str
+        Directory the images are written to. It is created if it does not exist.
+    n_images : int
+        Number of images.
+    base_name : str, optional
+        Base name of the images, e.g. 'synth_' gives 'synth_001.tif', ...
+    start : int, optional
+        Number of the first image. The default is 1.
+    zeropad : int, optional
+        Number of digits of the image number. The default is 3.
+    annotations : bool, optional
+        If True, also writes the annotated images '_line1' (see draw_a_b_p_line)
+        and '_line_1', '_line_2' (see draw_propagation_lines).
+    jitter : float, optional
+        Relative random variation of wire width, finger width and propagation
+        distance between images. The default is 0.05.
+    seed : int, optional
+        Seed of the random variation and noise.
+    **kwargs :
+        Passed to render_finger_image (e.g. width, height, beta, alpha).
+
+    Returns
+    -------
+    pandas data frame of the ground truth of every image, also saved as
+    'ground_truth.csv' in the directory.
+
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(start, start + n_images):
+        params = dict(kwargs)
+        for key, default in [('wire_width', 0.75), ('finger_width', 2.1),\
+                             ('propagation_distance', 37)]:
+            params[key] = params.get(key, default)*(1 + jitter*rng.uniform(-1, 1))
+        params['phase'] = params.get('phase', rng.uniform(0, 3))
+        params['seed'] = int(rng.integers(2**31))
+        img, truth, geometry = render_finger_image(**params)
+        name = base_name + str(i).zfill(zeropad)
+        cv2.imwrite(os.path.join(directory, name + '.tif'), img)
+        if annotations == True:
+            cv2.imwrite(os.path.join(directory, name + '_line1.tif'),\
+                        draw_a_b_p_line(img, geometry))
+            img_1, img_2 = draw_propagation_lines(img, geometry)
+            cv2.imwrite(os.path.join(directory, name + '_line_1.tif'), img_1)
+            cv2.imwrite(os.path.join(directory, name + '_line_2.tif'), img_2)
+        truth['filename'] = name
+        rows.append(truth)
+    df = pd.DataFrame(rows).set_index('filename')
+    df.to_csv(os.path.join(directory, 'ground_truth.csv'))
+    return df
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:14:37 2026
+
+@author: yoonahshin
+
+Tracking of the finger tips in a time series of images of the same region
+(e.g. in-situ annealing). The fingers are found in the first frame from its
+annotations, as in batch_get_propagation_distance: line_1 along the original
+edge and line_2 along the centre of every finger. In the later frames, every
+tip is only searched for along the centre line of its finger, in a short
+window around its previous position, so a frame costs a local search instead
+of the full analysis.
+
+    tracks = fa.tracking.track_fingers('33deg_', range(1, 11), times=range(0, 10))
+    velocities = fa.tracking.propagation_velocities(tracks)
+"""
+import cv2
+import numpy as np
+import pandas as pd
+import finger_analysis as fa
+
+DISTANCE = 'Finger propagation distance (μm)'
+VELOCITY = 'Finger propagation velocity (μm/h)'
+
+@fa.instrument.instrumented
+def detect_finger_tips(filename, suffix_1='_line_1', suffix_2='_line_2', line_color='r',\
+                       data_bar_top=690, reverse_sort=False):
+    """
+    Parameters
+    ----------
+    filename : str
+        File name of the first image without extension, e.g. '33deg_001'.
+    suffix_1, suffix_2 : str, optional
+        Suffixes of the images with the line along the original edge and the
+        lines along the centre of the fingers. The defaults are '_line_1' and '_line_2'.
+    line_color : str, optional
+        Color of the lines, 'r' or 'k'. The default is 'r'.
+    data_bar_top : int, optional
+        y coordinate of top of data bar area. The default is 690.
+    reverse_sort : bool, optional
+        If True, the tips are paired with the points on the original edge in
+        reversed order (see batch_new_method_propagation_distance).
+
+    Returns
+    -------
+    A dataframe with one row per finger: the point on the original edge
+    (x0, y0), the unit vector along the finger (ux, uy) and the tip (x, y).
+
+    """
+    edges = fa.fingers.get_edges_in_img(filename, data_bar_top)
+    line_1 = fa.fingers.get_line_drawn_in_img(filename, suffix_1, line_color, data_bar_top)
+    line_2 = fa.fingers.get_line_drawn_in_img(filename, suffix_2, line_color, data_bar_top)
+    sorted_df_init = fa.fingers.get_coords_intersections(line_1, line_2)
+    sorted_df_tips = fa.fingers.get_coords_intersections(edges, line_2)
+    if reverse_sort == True:
+        sorted_df_tips = sorted_df_tips.iloc[::-1].reset_index(drop=True)
+    if len(sorted_df_init) != len(sorted_df_tips) or len(sorted_df_init) == 0:
+        raise ValueError('{}: {} fingers cross the original edge but {} tips were found'\
+                         .format(filename, len(sorted_df_init), len(sorted_df_tips)))
+    origin = sorted_df_init[['x', 'y']].to_numpy()
+    tip = sorted_df_tips[['x', 'y']].to_numpy()
+    u = tip - origin
+    u /= np.linalg.norm(u, axis=1)[:, np.newaxis]
+    return pd.DataFrame({'x0': origin[:,0], 'y0': origin[:,1], 'ux': u[:,0], 'uy': u[:,1],\
+                         'x': tip[:,0], 'y': tip[:,1]}, index=pd.Index(range(len(tip)), name='finger'))
+
+def _locate_tips(gray, origin, u, s_prev, back, search, step=0.5):
+    """
+    Distances (pixels) of the tips from the original edge, searched for along
+    the centre line of every finger from s_prev - back to s_prev + search: the
+    tip is the first crossing from the dark finger to the bright film of the
+    Otsu threshold of the blurred search area, interpolated between the
+    samples. nan where no tip is found in the window.
+    """
+    s = s_prev[:, np.newaxis] + np.arange(-back, search + step, step)[np.newaxis, :]
+    x = origin[:, 0:1] + s*u[:, 0:1]
+    y = origin[:, 1:2] + s*u[:, 1:2]
+    height, width = gray.shape
+    inside = (x >= 0) & (x <= width - 1) & (y >= 0) & (y <= height - 1)
+    if not inside.any():
+        return np.full(len(s_prev), np.nan)
+    # Only the area around the search windows is blurred and sampled
+    margin = 4
+    x_lo = max(int(np.floor(x[inside].min())) - margin, 0)
+    x_hi = min(int(np.ceil(x[inside].max())) + margin + 1, width)
+    y_lo = max(int(np.floor(y[inside].min())) - margin, 0)
+    y_hi = min(int(np.ceil(y[inside].max())) + margin + 1, height)
+    blur = cv2.GaussianBlur(gray[y_lo:y_hi, x_lo:x_hi], (7,7), 0)
+    threshold = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY+cv2.THRESH_OTSU)[0]
+    profile = cv2.remap(blur.astype(np.float32), (x - x_lo).astype(np.float32),\
+                        (y - y_lo).astype(np.float32), cv2.INTER_LINEAR)
+    profile[~inside] = np.nan
+    with np.errstate(invalid='ignore'):
+        crossing = (profile[:, :-1] < threshold) & (profile[:, 1:] >= threshold)
+    found = crossing.any(axis=1)
+    k = np.argmax(crossing, axis=1)
+    rows = np.arange(len(k))
+    p1 = profile[rows, k]
+    p2 = profile[rows, k + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s_tip = s[rows, k] + step*(threshold - p1)/(p2 - p1)
+    s_tip[~found] = np.nan
+    return s_tip
+
+def _drift(first, current, origin, half, drift, max_drift):
+    """
+    Shift (dx, dy) of current with respect to the first frame, within
+    max_drift pixels of the previous shift drift: the areas of the first
+    frame around the points origin on the original edge (which do not change
+    as the fingers grow) are matched in current, and the shift maximizing the
+    sum of their correlations is refined to a fraction of a pixel. Matching
+    against the first frame keeps the errors from adding up along the series.
+    """
+    height, width = first.shape
+    m = int(np.ceil(max_drift))
+    dx, dy = np.round(drift).astype(int)
+    score = np.zeros((2*m + 1, 2*m + 1), dtype=np.float32)
+    for x, y in np.round(origin).astype(int):
+        if min(x, x + dx) - half - m < 0 or min(y, y + dy) - half - m < 0\
+            or max(x, x + dx) + half + m >= width or max(y, y + dy) + half + m >= height:
+            continue
+        template = first[y-half:y+half+1, x-half:x+half+1]
+        area = current[y+dy-half-m:y+dy+half+m+1, x+dx-half-m:x+dx+half+m+1]
+        score += cv2.matchTemplate(area, template, cv2.TM_CCOEFF_NORMED)
+    j, i = np.unravel_index(np.argmax(score), score.shape)
+    shift = np.array([dx + i - m, dy + j - m], dtype=float)
+    # parabola through the maximum and its neighbours
+    for axis, k in ((1, i), (0, j)):
+        if 0 < k < 2*m:
+            line = score[j, k-1:k+2] if axis == 1 else score[k-1:k+2, i]
+            denominator = line[0] - 2*line[1] + line[2]
+            if denominator < 0:
+                shift[1 - axis] += 0.5*(line[0] - line[2])/denominator
+    return shift
+
+@fa.instrument.instrumented
+def track_fingers(base_name, img_num_list, times, zeropad=3, suffix_1='_line_1',\
+                  suffix_2='_line_2', line_color='r', data_bar_top=690, search=40,\
+                  back=10, max_drift=None, pix_size=None, reverse_sort=False,\
+                  save_df=False, h=120, alph=33, l='1', dir_name='finger_tracking'):
+    """
+    Parameters
+    ----------
+    base_name : str
+        Base name of the images, e.g. '33deg_'.
+    img_num_list : list
+        Numbers of the images in time order. Only the first one needs the
+        annotations suffix_1 and suffix_2 (see detect_finger_tips).
+    times : list
+        Annealing time (h) of every image.
+    zeropad : int, optional
+        Number of digits of the image number. The default is 3.
+    data_bar_top : int, optional
+        y coordinate of top of data bar area. The default is 690.
+    search, back : float, optional
+        The tip of a finger is searched for from back pixels behind to search
+        pixels ahead of its previous position. The defaults are 40 and 10.
+    max_drift : float, optional
+        If given, the drift of the sample since the previous frame, up to max_drift
+        pixels, is measured around the original edge and followed. It should
+        be smaller than half the finger period. The default is None (no drift).
+    pix_size : float, optional
+        Pixel size (μm). If None, read from the data bar of the first image.
+    save_df : bool, optional
+        If True, saves the tracks to an excel file in dir_name, named after
+        h (nm), alph (deg) and l.
+
+    Returns
+    -------
+    A dataframe indexed by (image, finger) with the time (h), the position of
+    the tip (x, y) and the propagation distance (μm) from the original edge.
+    The distance is nan in the frames where the tip was not found in its
+    search window; the search then goes on from the last position found.
+
+    """
+    filename_list = fa.batch.create_filename_list(base_name, img_num_list, zeropad)
+    times = np.asarray(list(times), dtype=float)
+    if len(times) != len(filename_list):
+        raise ValueError('{} times given for {} images'.format(len(times), len(filename_list)))
+    fingers = detect_finger_tips(filename_list[0], suffix_1, suffix_2, line_color,\
+                                 data_bar_top, reverse_sort)
+    if pix_size is None:
+        pix_size = fa.scale.get_pixel_size(filename_list[0])[0]/1000
+    origin = fingers[['x0', 'y0']].to_numpy(copy=True)
+    u = fingers[['ux', 'uy']].to_numpy(copy=True)
+    tip = fingers[['x', 'y']].to_numpy(copy=True)
+    s_prev = np.sum((tip - origin)*u, axis=1)
+    origin_first = origin.copy()
+    state = {'first': None, 'drift': np.zeros(2)}
+    def compute(name, data):
+        fa.instrument.set_image(name)
+        with fa.instrument.stage('imread'):
+            gray = fa.pipeline.imread(name+'.tif', 0)[:data_bar_top,:]
+        if max_drift is not None:
+            if state['first'] is None:
+                state['first'] = gray
+            else:
+                with fa.instrument.stage('register'):
+                    drift = _drift(state['first'], gray, origin_first, int(search),\
+                                   state['drift'], max_drift)
+                origin[:] = origin_first + drift
+                state['drift'] = drift
+        with fa.instrument.stage('search'):
+            s_tip = _locate_tips(gray, origin, u, s_prev, back, search)
+        s_prev[:] = np.where(np.isnan(s_tip), s_prev, s_tip)
+        position = origin + s_tip[:, np.newaxis]*u
+        return pd.DataFrame({'x': position[:,0], 'y': position[:,1],\
+                             DISTANCE: s_tip*pix_size}, index=fingers.index)
+    # one reader thread decodes the next frames, which are tracked in order
+    files = lambda name: [(name+'.tif', 0)]
+    results = fa.batch._run_images(filename_list, compute, files, prefetch=1, n_workers=1)
+    fa.instrument.set_image(None)
+    for result, time in zip(results, times):
+        result.insert(0, 'time (h)', time)
+    df = pd.concat(results, keys=filename_list, names=['image', 'finger'])
+    if save_df == True:
+        output_name = '{}nm_{}deg_{}'.format(h, alph, l)
+        fa.output.make_dir_and_output_df_to_excel(dir_name, df, output_name, '_tracks')
+    return df
+
+def propagation_velocities(tracks):
+    """
+    Propagation velocity (μm/h) of every finger of tracks (see track_fingers):
+    the slope of the least squares line of its propagation distance against
+    time, over the frames where its tip was found. Returns a dataframe indexed
+    by finger with the velocity and the number of frames used.
+    """
+    t = tracks['time (h)'].unstack('finger').to_numpy()
+    d = tracks[DISTANCE].unstack('finger').to_numpy()
+    w = ~np.isnan(d)
+    t = np.where(w, t, 0)
+    d = np.where(w, d, 0)
+    n = w.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = (n*np.sum(t*d, axis=0) - t.sum(axis=0)*d.sum(axis=0))\
+                   /(n*np.sum(t*t, axis=0) - t.sum(axis=0)**2)
+    velocity[n < 2] = np.nan
+    index = tracks[DISTANCE].unstack('finger').columns
+    return pd.DataFrame({VELOCITY: velocity, 'n_frames': n}, index=index)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:58:12 2026
+
+@author: yoonahshin
+
+Helpers shared by the modules of the package that time, check and record runs.
+"""
+import os
+import importlib
+import contextlib
+import subprocess
+
+def git_commit():
+    """
+    Short hash of the commit of the repository the package is in, or None
+    if it is not in a git repository (or git is not installed).
+    """
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],\
+                             cwd=os.path.dirname(os.path.abspath(__file__)),\
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+@contextlib.contextmanager
+def working_directory(path):
+    """
+    Context manager changing the working directory to path, for the command
+    line tools that run the functions of the package on the files of a folder
+    by their names. It changes the directory of the whole process, so library
+    code passes the paths of the files instead.
+    """
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+@contextlib.contextmanager
+def replaced(replacements):
+    """
+    Context manager swapping functions of the submodules of the package,
+    given as a dictionary of 'module.function' -> replacement (e.g.
+    {'scale.get_pixel_size': my_get_pixel_size}), and restoring them on exit.
+    The functions of the package call the replacements in the meantime.
+    """
+    originals = []
+    try:
+        for target, replacement in replacements.items():
+            module, func = target.rsplit('.', 1)
+            module = importlib.import_module('finger_analysis.' + module)
+            originals.append((module, func, getattr(module, func)))
+            setattr(module, func, replacement)
+        yield
+    finally:
+        for module, func, original in reversed(originals):
+            setattr(module, func, original)
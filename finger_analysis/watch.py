@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 17:52:44 2026
+
+@author: yoonahshin
+
+Incremental analysis of a folder that the microscope keeps adding images to.
+The folder is polled, and only the images that are new or changed (together
+with their annotated copies) are analyzed; the results of the condition in
+the result store and the excel files are then updated in place.
+"""
+import os
+import re
+import json
+import time
+import inspect
+import logging
+import datetime
+import finger_analysis as fa
+
+logger = logging.getLogger(__name__)
+
+def _batch_function(analysis):
+    return {'a_b_p': fa.batch.batch_get_a_b_p,\
+            'propagation_distance': fa.batch.batch_get_propagation_distance,\
+            'new_method_propagation_distance': fa.batch.batch_new_method_propagation_distance,\
+            'propagation_direction': fa.batch.batch_get_propagation_direction}[analysis]
+
+# Analysis -> (names of the arguments giving the suffixes of the annotated
+# images, names of the arguments giving the data sets of the result store)
+ANALYSES = {'a_b_p': (('suffix',), ('dir_name_a', 'dir_name_b', 'dir_name_p')),
+            'propagation_distance': (('suffix_1', 'suffix_2'), ('dir_name',)),
+            'new_method_propagation_distance': (('suffix_1', 'suffix_2'), ('dataset',)),
+            'propagation_direction': ((), ('dir_name',))}
+
+# Analysis -> names of the arguments giving the folders of the excel files,
+# which are kept in the folder of the images
+OUTPUT_DIRS = {'a_b_p': ('dir_name_a', 'dir_name_b', 'dir_name_p'),
+               'propagation_distance': ('dir_name',),
+               'new_method_propagation_distance': ('dir_name',),
+               'propagation_direction': ('dir_name',)}
+
+def _argument(func, kwargs, name):
+    # value of an argument of the batch function: given, or else its default
+    if name in kwargs:
+        return kwargs[name]
+    return inspect.signature(inspect.unwrap(func)).parameters[name].default
+
+def _signature(path):
+    stat = os.stat(path)
+    return [os.path.basename(path), stat.st_mtime_ns, stat.st_size]
+
+def poll_folder(directory, base_name, suffixes=(), settle=10):
+    """
+    Parameters
+    ----------
+    directory : str
+        Folder of the images.
+    base_name : str
+        Base name of the images, e.g. '33deg_'. The images are the files
+        base_name + number + '.tif'.
+    suffixes : tuple, optional
+        Suffixes of the annotated images needed by the analysis, e.g.
+        ('_line_1', '_line_2'). An image is only listed once all of its
+        annotated images exist.
+    settle : float, optional
+        Files modified less than settle seconds ago are considered still being
+        written, and their image is not listed yet. The default is 10.
+
+    Returns
+    -------
+    Dictionary of image name (without extension) -> list of [file name,
+    modification time (ns), size] of the image and its annotated images. The
+    list changes whenever one of the files is replaced or modified.
+
+    """
+    pattern = re.compile(r'^{}(\d+)\.tif$'.format(re.escape(base_name)))
+    now = time.time()
+    index = {}
+    for entry in os.scandir(directory):
+        if pattern.match(entry.name) is None:
+            continue
+        name = entry.name[:-len('.tif')]
+        paths = [entry.path] + [os.path.join(directory, name + suffix + '.tif')\
+                                for suffix in suffixes]
+        if not all(os.path.isfile(path) for path in paths):
+            continue
+        signature = [_signature(path) for path in paths]
+        if now - max(mtime for file, mtime, size in signature)/1e9 < settle:
+            continue
+        index[name] = signature
+    return dict(sorted(index.items()))
+
+def update(directory, base_name, analysis='a_b_p', state_dir=None, store_dir=None,\
+           zeropad=3, settle=10, **kwargs):
+    """
+    Analyzes the images of the folder that are new or changed since the last
+    call, and updates the results of the whole condition.
+
+    Parameters
+    ----------
+    directory : str
+        Folder of the images.
+    base_name : str
+        Base name of the images, e.g. '33deg_'.
+    analysis : str, optional
+        'a_b_p', 'propagation_distance', 'new_method_propagation_distance' or
+        'propagation_direction', i.e. which batch function is run. The default
+        is 'a_b_p'.
+    state_dir : str, optional
+        Folder keeping the state of the watch (the signature of every analyzed
+        image) and the checkpoint of the results of every image. The default
+        is the folder '.finger_analysis_watch_<analysis>' in directory.
+    store_dir : str, optional
+        Result store (see store.py). If given, the results of the condition in
+        the store are replaced by the results of all the analyzed images.
+    zeropad : int, optional
+        Number of digits of the image numbers. The default is 3.
+    settle : float, optional
+        See poll_folder. The default is 10.
+    **kwargs :
+        Arguments of the batch function, e.g. suffix='_line2', h=120, alph=33,
+        t=6, l='2_p1', save_df=True (the excel files of the condition, in the
+        folder of the images unless their folders are absolute paths, are
+        rewritten with all the analyzed images). The batch function is given
+        the paths of the images, so the working directory is not changed.
+
+    Returns
+    -------
+    Dictionary with the lists of 'new', 'changed', 'failed' (the images that
+    failed in this update) and 'analyzed' images (all the images in the
+    results), and the 'results' returned by the batch function (None if no
+    image was analyzed).
+
+    """
+    func = _batch_function(analysis)
+    suffix_args, dataset_args = ANALYSES[analysis]
+    if state_dir is None:
+        state_dir = os.path.join(directory, '.finger_analysis_watch_{}'.format(analysis))
+    if not os.path.isdir(state_dir):
+        os.makedirs(state_dir)
+    state_path = os.path.join(state_dir, 'watch.json')
+    state = {'images': {}}
+    if os.path.isfile(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    checkpoint_dir = os.path.abspath(os.path.join(state_dir, 'checkpoint'))
+    # the batch function reads the images (and writes the excel files) by
+    # their paths; its results are indexed by the image names
+    prefix = os.path.join(os.path.abspath(directory), '')
+    datasets = [_argument(func, kwargs, arg) for arg in dataset_args]
+    run_kwargs = dict(kwargs)
+    for arg in OUTPUT_DIRS[analysis]:
+        run_kwargs[arg] = os.path.join(prefix, _argument(func, kwargs, arg))
+
+    suffixes = [_argument(func, kwargs, arg) for arg in suffix_args]
+    index = poll_folder(directory, base_name, suffixes, settle)
+    known = state['images']
+    new = [name for name in index if name not in known]
+    changed = [name for name in index if name in known and known[name]['signature'] != index[name]]
+    # the results of the changed images are computed again
+    fa.checkpoint.invalidate(checkpoint_dir, [prefix + name for name in changed])
+    for name in new + changed:
+        known[name] = {'signature': index[name], 'status': 'pending'}
+    # images that failed are only retried when their files change
+    names = [name for name in index if known[name]['status'] != 'failed']
+    failed = []
+    results = None
+    if len(new) + len(changed) > 0 and len(names) > 0:
+        img_num_list = [int(name[len(base_name):]) for name in names]
+        try:
+            results = func(prefix + base_name, img_num_list, zeropad=zeropad,\
+                           checkpoint_dir=checkpoint_dir, resume=True, **run_kwargs)
+        except RuntimeError:
+            # some images failed; the others are kept in the checkpoint
+            report = fa.checkpoint.error_report(checkpoint_dir)
+            failed = [name for name in names if prefix + name in report.index\
+                      and report.status[prefix + name] == 'failed']
+            names = [name for name in names if name not in failed]
+            for name in failed:
+                known[name]['status'] = 'failed'
+            if len(names) > 0:
+                img_num_list = [int(name[len(base_name):]) for name in names]
+                results = func(prefix + base_name, img_num_list, zeropad=zeropad,\
+                               checkpoint_dir=checkpoint_dir, resume=True, **run_kwargs)
+        for name in names:
+            known[name]['status'] = 'done'
+        if store_dir is not None and results is not None:
+            dfs = results if isinstance(results, tuple) else (results,)
+            alpha = _argument(func, kwargs, 'alpha' if analysis == 'propagation_direction' else 'alph')
+            suffix = _argument(func, kwargs, 'suffix') if analysis == 'a_b_p' else ''
+            for dataset, df in zip(datasets, dfs):
+                fa.store.replace_results(store_dir, dataset, df,\
+                                         _argument(func, kwargs, 'h'), alpha,\
+                                         _argument(func, kwargs, 't'),\
+                                         _argument(func, kwargs, 'l'), suffix)
+    state['updated'] = str(datetime.datetime.now())
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, state_path)
+    return {'new': new, 'changed': changed, 'failed': failed, 'analyzed': names,\
+            'results': results}
+
+def watch_folder(directory, base_name, analysis='a_b_p', interval=30, max_updates=None,\
+                 callback=None, **kwargs):
+    """
+    Polls the folder every interval seconds and calls update (see update for
+    the arguments) until interrupted with Ctrl-C, or after max_updates polls.
+    callback, if given, is called with the dictionary returned by update
+    whenever images were analyzed, e.g. to redraw the histograms.
+    Returns the list of the summaries of the updates in which images were
+    analyzed (time and numbers of new, changed, failed and analyzed images),
+    which are also logged (logger 'finger_analysis.watch', level INFO).
+    """
+    n = 0
+    summaries = []
+    try:
+        while max_updates is None or n < max_updates:
+            start = time.time()
+            out = update(directory, base_name, analysis, **kwargs)
+            n += 1
+            if len(out['new']) + len(out['changed']) > 0:
+                summary = {'time': str(datetime.datetime.now()), 'new': len(out['new']),\
+                           'changed': len(out['changed']), 'failed': len(out['failed']),\
+                           'analyzed': len(out['analyzed'])}
+                summaries.append(summary)
+                logger.info('%(new)d new, %(changed)d changed, %(failed)d failed, '
+                            '%(analyzed)d images analyzed', summary)
+                if callback is not None:
+                    callback(out)
+            if max_updates is None or n < max_updates:
+                time.sleep(max(0, interval - (time.time() - start)))
+    except KeyboardInterrupt:
+        pass
+    return summaries
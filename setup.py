@@ -24,6 +24,10 @@ setup(name='finger_analysis',
             'pytesseract',
             'seaborn',
             ],
+      extras_require={
+            'store': ['pyarrow'],
+            'mosaic': ['tifffile'],
+            },
       test_suite='nose.collector',
       tests_require=['nose'],
       zip_safe=False)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:51:37 2026
+
+@author: yoonahshin
+
+Checks that 'import finger_analysis' stays fast and free of side effects:
+the heavy dependencies are only imported when a submodule is used, and no
+matplotlib setting is changed. Every check runs in a fresh interpreter.
+"""
+import os
+import sys
+import json
+import subprocess
+
+# Time budget (s) of 'import finger_analysis' itself, without the
+# interpreter start-up (about 1 ms when the submodules are loaded lazily)
+IMPORT_BUDGET = 0.2
+
+HEAVY_MODULES = ('cv2', 'skimage', 'pytesseract', 'seaborn', 'matplotlib.pyplot')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(code):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env['MPLBACKEND'] = 'Agg'
+    out = subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT,\
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def test_import_time_and_modules():
+    result = _run('import sys, json, time\n'
+                  'start = time.perf_counter()\n'
+                  'import finger_analysis\n'
+                  'elapsed = time.perf_counter() - start\n'
+                  'print(json.dumps({"time": elapsed, "modules": sorted(sys.modules)}))')
+    assert result['time'] < IMPORT_BUDGET, result['time']
+    loaded = [name for name in HEAVY_MODULES if name in result['modules']]
+    assert loaded == [], loaded
+
+def test_rcparams_unchanged():
+    # the submodules that used to set the fonts on import are loaded too
+    result = _run('import json\n'
+                  'import matplotlib.pyplot as plt\n'
+                  'before = {key: repr(value) for key, value in plt.rcParams.items()}\n'
+                  'import finger_analysis as fa\n'
+                  'fa.output, fa.batch, fa.afm_analysis\n'
+                  'after = {key: repr(value) for key, value in plt.rcParams.items()}\n'
+                  'print(json.dumps(sorted(key for key in before if before[key] != after.get(key))))')
+    assert result == [], result
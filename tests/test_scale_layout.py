@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 18:44:12 2026
+
+@author: yoonahshin
+
+Regression check of scale.locate_data_bar on the bundled images: the scale
+bar must be found in the same rows of every image of the folder, so that the
+layout cached from any of them is the right one. The data bar and the scale
+bar of synthetic images of several sizes and data bar positions must be
+found as they were drawn.
+"""
+import os
+import tempfile
+import unittest
+import cv2
+import finger_analysis as fa
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),\
+                        'data', '05.28.2019_6h_3-3new_ni110_120')
+
+def _bundled_images():
+    if not os.path.isdir(DATA_DIR):
+        raise unittest.SkipTest('the bundled images are not available')
+    return sorted(name[:-4] for name in os.listdir(DATA_DIR)\
+                  if name.endswith('.tif') and '_line' not in name)
+
+def test_same_bar_rows_in_every_image():
+    names = _bundled_images()
+    cwd = os.getcwd()
+    os.chdir(DATA_DIR)
+    try:
+        fa.scale.clear_layouts()
+        bar_rows = {name: fa.scale.locate_data_bar(name, relocate=True)['bar_rows']\
+                    for name in names}
+    finally:
+        fa.scale.clear_layouts()
+        os.chdir(cwd)
+    assert len(set(bar_rows.values())) == 1, bar_rows
+
+def test_scale_bar_length_is_float():
+    names = _bundled_images()
+    cwd = os.getcwd()
+    os.chdir(DATA_DIR)
+    try:
+        fa.scale.clear_layouts()
+        lengths = [fa.scale.measure_scale_bar(name) for name in names[:5]]
+    finally:
+        fa.scale.clear_layouts()
+        os.chdir(cwd)
+    assert all(type(length) == float for length in lengths), lengths
+
+def test_synthetic_frames():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for width, height, data_bar_top in [(2048, 1536, None), (1280, 960, None),\
+                                                (1024, 768, None), (512, 384, None),\
+                                                (1024, 768, 650), (800, 600, 560)]:
+                for scale_bar_length in (5, 20):
+                    img, truth, geometry = fa.synthetic.render_finger_image(width, height,\
+                                                                            data_bar_top,\
+                                                                            scale_bar_length=scale_bar_length,\
+                                                                            seed=0)
+                    name = 'frame_{}x{}_{}'.format(width, height, scale_bar_length)
+                    cv2.imwrite(name+'.tif', img)
+                    fa.scale.clear_layouts()
+                    layout = fa.scale.locate_data_bar(name)
+                    assert layout['data_bar_top'] == truth['data_bar_top'], (name, layout)
+                    assert fa.scale.get_data_bar_top(name) == truth['data_bar_top'], name
+                    length = fa.scale.measure_scale_bar(name)
+                    assert abs(length - truth['scale_bar_pixels']) <= 1, (name, length)
+        finally:
+            fa.scale.clear_layouts()
+            os.chdir(cwd)